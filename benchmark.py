@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 端到端性能测试
+启动本地模拟API服务器，依次用各个爬虫版本爬取同一组UP主，对比吞吐量
+
+统计指标：
+- 墙钟时间、页面/秒、视频/秒
+- 等待占比：限速器累计等待时间占墙钟时间的比例（并发版本按并发任务数平均）
+- 请求成功率：未被限流的请求占全部请求的比例（服务器端统计）
+- 完整度：保存的视频数 / 应有的视频数
+
+每个版本使用独立的连接池、限速器和熔断器，输出和熔断状态写入临时目录，互不影响。
+原始版本（bilibili_video_crawler.py）通过 bilibili-api 库访问接口，无法指向模拟服务器，不参与测试。
+
+使用方法：
+python benchmark.py
+python benchmark.py --crawlers simple,async --latency 80 --distribution lognormal --throttle-rate 0.05
+python benchmark.py --rate 20 --max-rate 50 --json bench.json   # 放开限速，只测爬虫自身开销
+python benchmark.py --memory 100000   # 对比十万个视频以字典和 Video 对象保存时的内存占用
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import contextlib
+import gc
+import glob
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import bilibili_transport
+from bilibili_breaker import CircuitBreaker
+from bilibili_rate_limiter import AdaptiveRateLimiter
+from bilibili_transport import BilibiliTransport
+from bilibili_video import parse_video
+from mock_bilibili_server import (
+    LATENCY_DISTRIBUTIONS, THROTTLE_MODES, MockBilibiliAPI, MockBilibiliServer, parse_uploaders
+)
+
+# 参与测试的爬虫版本
+CRAWLER_NAMES = ('fast', 'simple', 'smart', 'adaptive', 'async')
+
+# 快速版本只获取第一页
+FAST_PAGE_SIZE = 50
+
+
+def count_saved_videos(output_dir: str, uid: int) -> int:
+    """读取某个UID最新的结果文件，返回其中的视频数"""
+    files = glob.glob(os.path.join(output_dir, f"videos_{uid}_*.json"))
+    if not files:
+        return 0
+    latest = max(files, key=os.path.getmtime)
+    with open(latest, 'r', encoding='utf-8') as f:
+        return len(json.load(f).get('videos', []))
+
+
+def run_sync_crawler(name: str, uids: List[int], output_dir: str,
+                     transport: BilibiliTransport, rate_limiter: AdaptiveRateLimiter,
+                     workers: int) -> int:
+    """
+    依次用同步爬虫爬取每个UID
+
+    Returns:
+        并发任务数，用于计算等待占比
+    """
+    if name == 'fast':
+        from bilibili_fast_crawler import BilibiliFastCrawler
+        crawler = BilibiliFastCrawler(transport=transport, rate_limiter=rate_limiter)
+    elif name == 'smart':
+        from bilibili_smart_crawler import BilibiliSmartCrawler
+        crawler = BilibiliSmartCrawler(transport=transport, rate_limiter=rate_limiter)
+    elif name == 'adaptive':
+        from bilibili_adaptive_crawler import BilibiliAdaptiveCrawler
+        crawler = BilibiliAdaptiveCrawler(transport=transport, rate_limiter=rate_limiter)
+    else:
+        from bilibili_simple_crawler import BilibiliSimpleCrawler
+        crawler = BilibiliSimpleCrawler(transport=transport, rate_limiter=rate_limiter)
+
+    crawler.output_dir = output_dir
+    if hasattr(crawler, 'parallel_workers'):
+        crawler.parallel_workers = workers
+    if hasattr(crawler, 'resume'):
+        crawler.resume = False
+
+    for uid in uids:
+        crawler.run(uid)
+    return workers if hasattr(crawler, 'parallel_workers') else 1
+
+
+def run_async_engine(uids: List[int], output_dir: str,
+                     transport: BilibiliTransport, rate_limiter: AdaptiveRateLimiter) -> int:
+    """用异步引擎同时爬取所有UID，返回并发任务数"""
+    from bilibili_async_engine import AsyncCrawlEngine
+
+    engine = AsyncCrawlEngine(transport=transport, rate_limiter=rate_limiter)
+    engine.output_dir = output_dir
+    engine.run(uids)
+    return min(len(uids), engine.max_active_uids)
+
+
+def benchmark_crawler(name: str, api: MockBilibiliAPI, uids: List[int],
+                      make_limiter: Callable[[], AdaptiveRateLimiter],
+                      workers: int = 1, verbose: bool = False) -> Dict:
+    """
+    测试单个爬虫版本
+
+    Args:
+        name: 爬虫版本
+        api: 模拟API，用于读取服务器端统计
+        uids: 要爬取的UID列表
+        make_limiter: 创建限速器的函数
+        workers: 同步版本并发获取页面的线程数
+        verbose: 是否显示爬虫自身的输出
+
+    Returns:
+        测试结果
+    """
+    rate_limiter = make_limiter()
+    api.reset_stats()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        # 熔断状态也写入临时目录，不读取或污染 ./output 下各次运行共用的状态文件
+        breaker = CircuitBreaker(os.path.join(output_dir, 'circuit_breaker.db'))
+        transport = BilibiliTransport(breaker=breaker)
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        start_time = time.perf_counter()
+        with output:
+            if name == 'async':
+                concurrency = run_async_engine(uids, output_dir, transport, rate_limiter)
+            else:
+                concurrency = run_sync_crawler(name, uids, output_dir, transport, rate_limiter, workers)
+        wall = time.perf_counter() - start_time
+
+        saved = sum(count_saved_videos(output_dir, uid) for uid in uids)
+        breaker.close()
+
+    if name == 'fast':
+        expected = sum(min(api.video_count(uid), FAST_PAGE_SIZE) for uid in uids)
+    else:
+        expected = sum(api.video_count(uid) for uid in uids)
+
+    server = api.stats()
+    connections = transport.connection_stats()['connections']
+    transport.close()
+
+    requests = server['requests']
+    return {
+        "crawler": name,
+        "wall_time": round(wall, 3),
+        "pages": server['pages'],
+        "videos": saved,
+        "expected_videos": expected,
+        "pages_per_sec": round(server['pages'] / wall, 2) if wall > 0 else 0.0,
+        "videos_per_sec": round(saved / wall, 2) if wall > 0 else 0.0,
+        "sleep_share": round(rate_limiter.total_wait / (wall * concurrency), 4) if wall > 0 else 0.0,
+        "requests": requests,
+        "throttled": server['throttled'],
+        "success_rate": round((requests - server['throttled']) / requests, 4) if requests else 0.0,
+        "completeness": round(saved / expected, 4) if expected else 0.0,
+        "connections": connections,
+        "final_rate": rate_limiter.rate
+    }
+
+
+def measure_video_memory(count: int, mid: int = 1001) -> Dict:
+    """
+    对比视频以字典和 Video 对象保存时的常驻内存
+
+    模拟接口数据由 MockBilibiliAPI.make_video 生成，字典形式即 Video.to_dict() 的结果，
+    与改用 Video 之前各爬虫中的字典完全相同。
+
+    Args:
+        count: 视频数量
+        mid: 模拟UP主UID
+
+    Returns:
+        每种形式的总内存（丢弃接口数据后）与记录自身的开销（字节）
+    """
+    builders = {
+        'dict': lambda info: parse_video(info).to_dict(),
+        'video': parse_video
+    }
+    result = {"videos": count}
+    for name, build in builders.items():
+        gc.collect()
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            raw = [MockBilibiliAPI.make_video(mid, serial) for serial in range(1, count + 1)]
+            before = tracemalloc.get_traced_memory()[0]
+            records = [build(info) for info in raw]
+            # 记录自身的开销：字典/对象本身以及新生成的字符串（标题等字符串与接口数据共用）
+            overhead = tracemalloc.get_traced_memory()[0] - before
+            del raw
+            gc.collect()
+            total = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        del records
+        result[name] = {"total_bytes": total, "record_bytes": overhead}
+    return result
+
+
+def print_memory_result(result: Dict):
+    """输出内存对比结果"""
+    count = result['videos']
+    print(f"\n📊 {count} 个视频的内存占用：")
+    print(f"{'形式':<8}{'总计(MB)':>12}{'每个视频(字节)':>16}{'记录开销(MB)':>14}{'每个记录(字节)':>16}")
+    print("-" * 66)
+    for name in ('dict', 'video'):
+        r = result[name]
+        print(f"{name:<8}{r['total_bytes'] / 1048576:>12.1f}{r['total_bytes'] / count:>16.0f}"
+              f"{r['record_bytes'] / 1048576:>14.1f}{r['record_bytes'] / count:>16.0f}")
+    saved = 1 - result['video']['total_bytes'] / result['dict']['total_bytes']
+    print(f"\n💾 Video 对象总内存减少 {saved:.1%}，"
+          f"记录开销为字典的 {result['video']['record_bytes'] / result['dict']['record_bytes']:.1%}")
+
+
+def print_results(results: List[Dict]):
+    """以表格形式输出测试结果"""
+    print("\n📊 测试结果：")
+    print(f"{'版本':<8}{'耗时(秒)':>10}{'页面':>7}{'视频':>8}{'页/秒':>9}{'视频/秒':>10}"
+          f"{'等待占比':>10}{'成功率':>9}{'完整度':>9}{'连接':>6}")
+    print("-" * 86)
+    for r in results:
+        print(f"{r['crawler']:<8}{r['wall_time']:>10.2f}{r['pages']:>7}{r['videos']:>8}"
+              f"{r['pages_per_sec']:>9.2f}{r['videos_per_sec']:>10.2f}"
+              f"{r['sleep_share']:>10.1%}{r['success_rate']:>9.1%}{r['completeness']:>9.1%}"
+              f"{r['connections']:>6}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="B站爬虫端到端性能测试")
+    parser.add_argument('--crawlers', default=','.join(CRAWLER_NAMES),
+                        help=f"参与测试的版本，逗号分隔（可选：{', '.join(CRAWLER_NAMES)}）")
+    parser.add_argument('--uploaders', default='1001:200,1002:80', help="UP主视频数量，如 1001:200,1002:80")
+    parser.add_argument('--latency', type=float, default=30.0, help="平均响应延迟（毫秒）")
+    parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal', help="延迟分布")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="随机限流概率（0~1）")
+    parser.add_argument('--max-rps', type=float, default=0.0, help="服务器每秒请求数上限，0为不限制")
+    parser.add_argument('--throttle-mode', choices=THROTTLE_MODES, default='mixed', help="限流形式")
+    parser.add_argument('--rate', type=float, default=0.5, help="限速器初始速率（次/秒）")
+    parser.add_argument('--max-rate', type=float, default=2.0, help="限速器最高速率（次/秒）")
+    parser.add_argument('--workers', type=int, default=1, help="同步版本并发获取页面的线程数")
+    parser.add_argument('--seed', type=int, default=42, help="随机数种子")
+    parser.add_argument('--json', dest='json_path', default=None, help="将结果另存为JSON文件")
+    parser.add_argument('--verbose', action='store_true', help="显示爬虫自身的输出")
+    parser.add_argument('--memory', type=int, default=0, metavar='N',
+                        help="只对比N个视频以字典和 Video 对象保存时的内存占用，不运行爬虫")
+    args = parser.parse_args()
+
+    if args.memory > 0:
+        result = measure_video_memory(args.memory)
+        print_memory_result(result)
+        if args.json_path:
+            with open(args.json_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            print(f"\n💾 结果已保存：{args.json_path}")
+        return
+
+    names = [name.strip() for name in args.crawlers.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CRAWLER_NAMES]
+    if unknown:
+        parser.error(f"未知的爬虫版本：{', '.join(unknown)}")
+
+    uploaders = parse_uploaders(args.uploaders)
+    api = MockBilibiliAPI(
+        uploaders=uploaders,
+        latency_ms=args.latency,
+        latency_distribution=args.distribution,
+        throttle_rate=args.throttle_rate,
+        max_rps=args.max_rps,
+        throttle_mode=args.throttle_mode,
+        seed=args.seed
+    )
+
+    def make_limiter() -> AdaptiveRateLimiter:
+        return AdaptiveRateLimiter(initial_rate=args.rate, max_rate=max(args.rate, args.max_rate))
+
+    print("⏱️  B站爬虫性能测试")
+    print("=" * 50)
+    print(f"👥 UP主：{', '.join(f'{uid}({count}个视频)' for uid, count in uploaders.items())}")
+    print(f"⏱️  延迟：{args.latency} 毫秒（{args.distribution}）")
+    print(f"🚦 限流：概率 {args.throttle_rate}，每秒上限 {args.max_rps or '不限'}，形式 {args.throttle_mode}")
+    print(f"🐢 限速器：初始 {args.rate} 次/秒，最高 {max(args.rate, args.max_rate)} 次/秒")
+
+    results = []
+    with MockBilibiliServer(api) as server:
+        # 请求地址在调用时拼接，修改模块变量即可指向模拟服务器
+        original_base = bilibili_transport.API_BASE
+        bilibili_transport.API_BASE = server.base_url
+        try:
+            for name in names:
+                print(f"\n🚀 测试 {name} 版本...")
+                result = benchmark_crawler(name, api, list(uploaders), make_limiter,
+                                           workers=args.workers, verbose=args.verbose)
+                print(f"   ✅ {result['wall_time']:.2f} 秒，{result['videos']}/{result['expected_videos']} 个视频")
+                results.append(result)
+        finally:
+            bilibili_transport.API_BASE = original_base
+
+    print_results(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存：{args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 自适应版本
+同一个爬虫按限流情况在快速、标准、智能三档设置之间自动切换
+
+- 从快速档开始（每页50个视频、最高速率2次/秒）
+- 连续触发限流时切换到更保守的一档：每页视频更少、速率上限更低、每次请求轮换请求头
+- 保守档连续成功一段时间后，切回更快的一档
+- 切换档位后按已保存的视频数换算新的页码，重叠部分按bvid去重
+- 每个UP主都从快速档开始，最终使用能正常工作的最快设置
+
+使用方法：
+python bilibili_adaptive_crawler.py UID
+python run.py adaptive UID
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import warnings
+from functools import partial
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
+
+import requests
+
+from bilibili_breaker import CircuitOpenError
+from bilibili_log import configure_logging, get_logger, parse_logging_args
+from bilibili_metrics import SLEEP_RETRY, print_metrics_summary
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, is_throttle_response
+)
+from bilibili_scheduler import create_scheduler
+from bilibili_storage import (
+    append_journal_page, create_journal, finalize_journal,
+    find_latest_final, find_resumable_journal, load_journal_state, load_known_bvids
+)
+from bilibili_transport import BilibiliTransport, USER_AGENTS, api_url, get_shared_transport, random_headers
+from bilibili_stream import VideoPage, VideoStream
+from bilibili_video import Video
+
+# 禁用SSL警告
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+
+log = get_logger('adaptive')
+
+
+class CrawlProfile(NamedTuple):
+    """一档爬取设置"""
+    name: str
+    page_size: int  # 每页视频数量
+    max_rate: float  # 限速器最高速率（次/秒）
+    retry_delay: float  # 网络错误时的重试延迟（秒）
+    rotate_headers: bool  # 是否每次请求轮换整套请求头
+
+
+# 从快到慢排列，对应快速、标准、智能三个版本的设置
+CRAWL_PROFILES = (
+    CrawlProfile('fast', 50, 2.0, 2, False),
+    CrawlProfile('simple', 10, 1.0, 10, False),
+    CrawlProfile('smart', 5, 0.25, 15, True),
+)
+
+
+class AdaptiveVideoStream(VideoStream):
+    """切换档位后按新的每页数量换算页码、继续产出的视频流"""
+
+    def __init__(self, crawler: 'BilibiliAdaptiveCrawler', uid: int, start_page: int = 1,
+                 seen_bvids: Optional[Set[str]] = None, stop_on_known: bool = False,
+                 saved: int = 0):
+        """
+        Args:
+            crawler: 自适应爬虫
+            uid: 用户UID
+            start_page: 起始页码（按当前档位的每页数量）
+            seen_bvids: 已保存的视频bvid，这些视频不再产出
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+            saved: 续传前已保存的视频数，用于切换档位后换算页码
+        """
+        # 切换档位后调度器按新的每页数量重新计算剩余页数
+        super().__init__(None, crawler.profile.page_size, start_page, seen_bvids,
+                         stop_on_known, crawler.parallel_workers, crawler.metrics,
+                         create_scheduler(crawler.deadline, crawler.rate_limiter, uid))
+        self.crawler = crawler
+        self.uid = uid
+        self.saved = saved
+
+    def __iter__(self) -> Iterator[VideoPage]:
+        while True:
+            profile = self.crawler.profile
+            self.page_size = profile.page_size
+            self.fetch_page = partial(self.crawler.get_user_videos, self.uid, page_size=profile.page_size)
+            for video_page in super().__iter__():
+                yield video_page
+                if self.crawler.profile is not profile and self.stop_reason is None:
+                    break
+            else:
+                return
+            # 档位已切换：按已保存的视频数换算新的页码，重新开始分页（重叠部分按bvid去重）
+            self.next_page = (self.saved + self.total) // self.crawler.profile.page_size + 1
+
+
+class BilibiliAdaptiveCrawler:
+    """B站视频爬虫类（自适应版本）"""
+
+    def __init__(self, transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        初始化爬虫配置
+
+        transport 默认使用进程内共享的实例；档位会调整限速器的最高速率，
+        所以 rate_limiter 默认是本爬虫独享的，避免档位限制影响进程内的其他爬虫
+        """
+        self.transport = transport or get_shared_transport()
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
+        self.max_retries = 8  # 每页最大重试次数
+        self.profiles = list(CRAWL_PROFILES)
+        self.escalate_after = 2  # 连续限流多少次后切换到更保守的一档
+        self.recover_after = 20  # 连续成功多少次后切回更快的一档
+        self.parallel_workers = 1  # 得知总数后并发获取剩余页面的线程数，1为逐页获取
+        self.output_dir = "./output"
+        self.resume = True  # 发现未完成的爬取文件时断点续传
+        self.incremental = False  # 增量爬取：遇到整页已知视频即停止，并与上次结果合并
+        self.compression = None  # 日志和 _final.json 的压缩格式：None、gzip 或 zstd（需要 zstandard）
+        self.deadline = None  # 每个UP主的时间预算（秒）：按期限均匀安排每页请求，赶不上时提前警告
+
+        self.user_agents = list(USER_AGENTS)
+        self.headers = {
+            'User-Agent': self.user_agents[0],
+            'Referer': 'https://www.bilibili.com'
+        }
+
+        # 档位状态，并发获取页面时多个线程会同时更新
+        self.profile_index = 0
+        self.throttle_streak = 0
+        self.success_streak = 0
+        self.profile_switches: List[str] = []
+        self._profile_lock = threading.Lock()
+
+        # 创建输出目录
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    @property
+    def profile(self) -> CrawlProfile:
+        """当前使用的档位"""
+        return self.profiles[self.profile_index]
+
+    def set_profile(self, index: int, reason: str = ""):
+        """
+        切换档位，并按该档设置限速器的最高速率
+
+        Args:
+            index: 档位序号，0为最快
+            reason: 切换原因，用于日志
+        """
+        with self._profile_lock:
+            self._set_profile(index, reason)
+
+    def _set_profile(self, index: int, reason: str = ""):
+        """切换档位（需持有锁）"""
+        index = min(max(index, 0), len(self.profiles) - 1)
+        previous = self.profile
+        self.profile_index = index
+        self.throttle_streak = 0
+        self.success_streak = 0
+        self.rate_limiter.set_max_rate(self.profile.max_rate)
+
+        if previous is not self.profile:
+            self.profile_switches.append(f"{previous.name} → {self.profile.name}")
+            log.info('profile_switch', "🔀 切换到 {profile} 档（每页 {page_size} 个，最高 {max_rate} 次/秒）{reason}",
+                     previous=previous.name, profile=self.profile.name, page_size=self.profile.page_size,
+                     max_rate=self.profile.max_rate, reason=reason)
+
+    def on_request_success(self):
+        """请求成功：保守档连续成功足够多次后切回更快的一档"""
+        self.rate_limiter.on_success()
+        with self._profile_lock:
+            self.throttle_streak = 0
+            self.success_streak += 1
+            if self.profile_index > 0 and self.success_streak >= self.recover_after:
+                self._set_profile(self.profile_index - 1, f"：连续成功 {self.recover_after} 次")
+
+    def on_request_throttle(self):
+        """触发限流：限速器降速，连续限流时切换到更保守的一档"""
+        self.rate_limiter.on_throttle()
+        with self._profile_lock:
+            self.success_streak = 0
+            self.throttle_streak += 1
+            if self.throttle_streak >= self.escalate_after and self.profile_index < len(self.profiles) - 1:
+                self._set_profile(self.profile_index + 1, f"：连续 {self.throttle_streak} 次触发限流")
+
+    def request_headers(self) -> Dict[str, str]:
+        """按当前档位生成请求头"""
+        if self.profile.rotate_headers:
+            headers = random_headers()
+            headers['User-Agent'] = random.choice(self.user_agents)
+            return headers
+        return self.headers
+
+    def get_user_info(self, uid: int) -> bool:
+        """检查用户是否存在"""
+        return self.get_user_videos(uid, page_size=1) is not None
+
+    def get_user_videos(self, uid: int, page: int = 1,
+                        page_size: Optional[int] = None) -> Optional[Dict]:
+        """
+        获取用户视频列表（分页）
+
+        Args:
+            uid: 用户UID
+            page: 页码，从1开始
+            page_size: 每页视频数，默认使用当前档位的设置
+
+        Returns:
+            视频列表数据，失败返回None
+        """
+        url = api_url("/x/space/arc/search")
+        params = {
+            'mid': uid,
+            'ps': page_size or self.profile.page_size,
+            'pn': page,
+            'order': 'pubdate'
+        }
+
+        log.info('page_request', "📄 正在获取第 {page} 页（{profile} 档）...",
+                 uid=uid, page=page, profile=self.profile.name)
+
+        # 缓存命中时直接使用，不消耗限速配额，也不计入档位切换
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            if cached.get('code') == 0:
+                return cached.get('data', {})
+            log.error('page_failed', "❌ 获取视频列表失败（第 {page} 页，缓存）：{error}",
+                      uid=uid, page=page, error=cached.get('message', '未知错误'), outcome='cached_error')
+            return None
+
+        for attempt in range(self.max_retries):
+            network_error = False
+            if attempt > 0:
+                self.metrics.record_retry()
+            wait = self.rate_limiter.acquire()
+            self.metrics.record_sleep(wait)
+            if wait >= 1:
+                log.info('rate_wait', "⏱️  限速等待 {delay:.1f} 秒（当前速率 {rate:.2f} 次/秒）",
+                         uid=uid, page=page, delay=wait, rate=self.rate_limiter.rate)
+
+            try:
+                data = self.transport.get_json(
+                    url,
+                    params=params,
+                    headers=self.request_headers(),
+                    timeout=20
+                )
+
+                if data.get('code') == 0:
+                    self.on_request_success()
+                    return data.get('data', {})
+                if is_throttle_response(data):
+                    self.on_request_throttle()
+                    log.warning('throttle', "⚠️  触发频率限制，降速至 {rate:.2f} 次/秒（第 {page} 页）",
+                                uid=uid, page=page, attempt=attempt + 1, rate=self.rate_limiter.rate,
+                                outcome='throttle')
+                    continue
+
+                log.error('page_failed', "❌ 获取视频列表失败（第 {page} 页）：{error}",
+                          uid=uid, page=page, attempt=attempt + 1, error=data.get('message', '未知错误'),
+                          outcome='api_error')
+                return None
+
+            except CircuitOpenError as e:
+                # 接口熔断中：不再等待重试，把时间留给其他UID
+                log.warning('circuit_rejected', "🚧 接口熔断中，{retry_in:.0f} 秒后才能再试，跳过第 {page} 页",
+                            uid=uid, page=page, key=e.key, retry_in=e.retry_in, outcome='circuit_open')
+                return None
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in THROTTLE_HTTP_STATUS:
+                    self.on_request_throttle()
+                    log.warning('throttle', "⚠️  HTTP {status} 限流，降速至 {rate:.2f} 次/秒（第 {page} 页）",
+                                uid=uid, page=page, attempt=attempt + 1, status=status,
+                                rate=self.rate_limiter.rate, outcome='throttle')
+                else:
+                    log.warning('http_error', "❌ HTTP错误（第 {page} 页，尝试 {attempt}/{max_retries}）：{error}",
+                                uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                                status=status, error=e, outcome='http_error')
+                    network_error = True
+            except requests.exceptions.Timeout:
+                log.warning('timeout', "⏰ 请求超时（第 {page} 页，尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            outcome='timeout')
+                network_error = True
+            except requests.exceptions.ConnectionError:
+                log.warning('connection_error', "🔌 网络连接错误（第 {page} 页，尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            outcome='connection_error')
+                network_error = True
+            except Exception as e:
+                log.warning('request_error', "❌ 请求异常（第 {page} 页，尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            error=e, outcome='error')
+                network_error = True
+
+            # 网络错误不是限流信号，不降低速率，只稍等后重试
+            if network_error and attempt < self.max_retries - 1:
+                time.sleep(self.profile.retry_delay)
+                self.metrics.record_sleep(self.profile.retry_delay, SLEEP_RETRY)
+
+        log.error('retries_exhausted', "💥 第 {page} 页已达到最大重试次数",
+                  uid=uid, page=page, outcome='gave_up')
+        return None
+
+    def iter_video_pages(self, uid: int, start_page: int = 1,
+                         seen_bvids: Optional[Set[str]] = None, stop_on_known: bool = False,
+                         saved: int = 0) -> AdaptiveVideoStream:
+        """
+        按页流式获取用户的视频，切换档位后自动换算页码继续
+
+        Args:
+            uid: 用户UID
+            start_page: 起始页码（按当前档位的每页数量）
+            seen_bvids: 已保存的视频bvid，这些视频不再产出
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+            saved: 续传前已保存的视频数
+
+        Returns:
+            视频流，迭代产出每一页视频，调用 cancel() 停止之后的请求
+        """
+        return AdaptiveVideoStream(self, uid, start_page, seen_bvids, stop_on_known, saved)
+
+    def iter_videos(self, uid: int) -> Iterator[Video]:
+        """逐个产出用户的视频（从最快的一档开始），调用方停止迭代后不再请求之后的页面"""
+        self.profile_switches = []
+        self.set_profile(0)
+        return self.iter_video_pages(uid).videos()
+
+    def fetch_all_videos_with_incremental_save(self, uid: int) -> int:
+        """
+        获取用户的所有视频并增量保存，按限流情况自动切换档位
+
+        Args:
+            uid: 用户UID
+
+        Returns:
+            获取到的视频总数
+        """
+        # 每个UP主都从最快的一档开始
+        self.profile_switches = []
+        self.set_profile(0)
+
+        # 先确认用户存在，避免为不存在或无法访问的UID留下空的日志文件（之后会被当作可续传的爬取）
+        if not self.get_user_info(uid):
+            log.error('not_found', "❌ 用户 {uid} 不存在或没有公开视频", uid=uid, outcome='not_found')
+            return 0
+
+        save_filepath = find_resumable_journal(self.output_dir, uid) if self.resume else None
+        if save_filepath:
+            # 日志头部不记录每页数量，续传时总是按已保存的视频数换算页码
+            state = load_journal_state(save_filepath, self.profile.page_size)
+            total_videos = state['total']
+            page = state['next_page']
+            seen_bvids = state['seen_bvids']
+            merge_from = state['merge_from']
+            log.info('journal_resumed', "🔁 发现未完成的爬取文件：{path}\n   已保存 {total} 个视频，从第 {page} 页继续",
+                     uid=uid, path=save_filepath, total=total_videos, page=page)
+        else:
+            merge_from = find_latest_final(self.output_dir, uid) if self.incremental else None
+            if merge_from:
+                log.info('incremental_base', "📚 增量爬取，基于上次结果：{path}", uid=uid, path=merge_from)
+            # 每页数量会随档位变化，不写入日志头部
+            save_filepath = create_journal(
+                self.output_dir, uid, {"crawler_version": "adaptive_v1.0"}, merge_from=merge_from,
+                compression=self.compression
+            )
+            log.info('journal_created', "📝 初始化保存文件：{path}", uid=uid, path=save_filepath)
+            total_videos = 0
+            page = 1
+            seen_bvids = load_known_bvids(merge_from) if merge_from else set()
+
+        stream = self.iter_video_pages(uid, page, seen_bvids, bool(merge_from), total_videos)
+        for video_page in stream:
+            if video_page.videos:
+                total_videos = append_journal_page(save_filepath, video_page.videos)
+            log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                     uid=uid, page=video_page.page, videos=len(video_page.videos), total=total_videos)
+        log.info('stream_end', "{description}", uid=uid, outcome=stream.stop_reason,
+                 description=stream.describe())
+        completed = stream.completed
+
+        if completed and merge_from and total_videos == 0:
+            os.remove(save_filepath)
+            log.info('up_to_date', "✅ 没有新投稿，上次结果已是最新：{path}", uid=uid, path=merge_from)
+        elif completed:
+            final_path, user_info = finalize_journal(save_filepath)
+            log.info('finalized', "\n🎉 最终文件已保存：{path}\n📊 总计爬取 {total} 个视频",
+                     uid=uid, path=final_path, total=user_info['total_videos'])
+        else:
+            log.warning('incomplete', "⏸️  爬取未完成，已保存 {total} 个视频，再次运行将断点续传",
+                        uid=uid, total=total_videos)
+
+        return total_videos
+
+    def run(self, uid: Optional[int] = None) -> bool:
+        """运行爬虫主程序"""
+        if uid is None:
+            try:
+                uid_input = input("请输入B站用户UID：").strip()
+                if not uid_input:
+                    print("❌ UID不能为空")
+                    return False
+                uid = int(uid_input)
+            except ValueError:
+                print("❌ 请输入有效的数字UID")
+                return False
+            except KeyboardInterrupt:
+                print("\n\n👋 程序已取消")
+                return False
+
+        print(f"\n🎚️  启动自适应爬虫，目标用户：{uid}")
+        print("💡 从快速档开始，遇到限流自动切换到更保守的设置")
+        print("💾 使用增量保存模式，数据会实时保存到文件")
+
+        metrics_baseline = self.metrics.snapshot()
+        total_videos = self.fetch_all_videos_with_incremental_save(uid)
+        print_metrics_summary(self.metrics, metrics_baseline)
+
+        if self.profile_switches:
+            print(f"\n🔀 档位切换：{'，'.join(self.profile_switches)}")
+        print(f"🎚️  结束时档位：{self.profile.name}")
+
+        if total_videos == 0:
+            if self.incremental and find_latest_final(self.output_dir, uid):
+                print("\n✅ 没有新投稿，数据已是最新")
+                return True
+            print("\n❌ 没有找到任何视频")
+            return False
+
+        print(f"\n🎉 爬取完成！共获取到 {total_videos} 个视频")
+        return True
+
+
+def main():
+    """主函数"""
+    print("🎚️  B站视频爬虫 - 自适应版本")
+    print("=" * 50)
+    print("🔧 特性：从快速设置开始，遇到限流自动降档，持续成功后自动升档")
+    print()
+
+    # --quiet / --log-level / --log-json 控制日志输出
+    args = sys.argv[1:]
+    log_options = parse_logging_args(args)
+    if log_options is None:
+        return
+    configure_logging(**log_options)
+
+    uid = None
+    if args:
+        try:
+            uid = int(args[0])
+        except ValueError:
+            print("❌ 命令行参数必须是数字UID")
+            return
+
+    crawler = BilibiliAdaptiveCrawler()
+    success = crawler.run(uid)
+
+    if success:
+        print("\n🎊 程序执行完成！")
+    else:
+        print("\n💔 程序执行失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
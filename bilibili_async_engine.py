@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 异步多用户爬取引擎
+在一个事件循环中并发爬取多个UID，并发数受全局和单主机两级信号量限制
+
+- 所有等待都使用 asyncio.sleep，不会阻塞事件循环
+- 请求节奏由共享的自适应限速器控制
+- HTTP请求通过共享连接池在线程中执行
+- 结果通过增量保存日志写入，支持断点续传
+
+使用方法：
+python bilibili_async_engine.py UID1 UID2 UID3 ...
+python bilibili_async_engine.py --incremental UID1 UID2 ...   # 只爬取新投稿
+python bilibili_async_engine.py --no-cache UID1 UID2 ...      # 跳过响应缓存
+python bilibili_async_engine.py --gzip UID1 UID2 ...          # 压缩保存（--zstd 需要 zstandard）
+python bilibili_async_engine.py --metrics-port 9108 UID1 ...  # 在 /metrics 提供请求指标
+python bilibili_async_engine.py --deadline 30m UID1 ...    # 每个UP主的时间预算
+python bilibili_async_engine.py --quiet --log-json output/crawl_log.jsonl UID1 ...  # 终端只显示警告和错误
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import asyncio
+import os
+import random
+import sys
+from functools import partial
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlsplit
+
+import requests
+
+from bilibili_breaker import CircuitOpenError
+from bilibili_cache import get_shared_response_cache
+from bilibili_log import configure_logging, get_logger, parse_logging_args
+from bilibili_metrics import SLEEP_RETRY, print_metrics_summary, start_metrics_server
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, get_shared_rate_limiter, is_throttle_response
+)
+from bilibili_scheduler import create_scheduler, parse_duration
+from bilibili_storage import (
+    append_journal_page, create_journal, finalize_journal,
+    find_latest_final, find_resumable_journal, load_journal_state, load_known_bvids
+)
+from bilibili_transport import BilibiliTransport, api_url
+from bilibili_stream import AsyncVideoStream
+from bilibili_video import Video
+
+log = get_logger('async')
+
+class AsyncCrawlEngine:
+    """异步多用户爬取引擎"""
+
+    def __init__(self, max_concurrency: int = 8, per_host_limit: int = 4,
+                 transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        初始化引擎配置
+
+        Args:
+            max_concurrency: 全局同时进行的请求数上限
+            per_host_limit: 单个主机同时进行的请求数上限
+            transport: HTTP传输层，默认按 per_host_limit 新建连接池（使用共享的响应缓存）
+            rate_limiter: 限速器，默认使用进程内共享的自适应限速器
+        """
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.transport = transport or BilibiliTransport(
+            pool_size=max_concurrency,
+            per_host_limit=per_host_limit,
+            cache=get_shared_response_cache()
+        )
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
+        self.max_retries = 5  # 最大重试次数
+        self.retry_delay = 5  # 网络错误时的重试基础延迟（秒）
+        self.max_active_uids = max_concurrency * 2  # 同时处理的用户数上限
+        self.videos_per_page = 30  # 每页视频数量
+        self.output_dir = "./output"
+        self.incremental = False  # 增量爬取：遇到整页已知视频即停止，并与上次结果合并
+        self.compression = None  # 日志和 _final.json 的压缩格式：None、gzip 或 zstd（需要 zstandard）
+        self.deadline = None  # 每个UP主的时间预算（秒）：按期限均匀安排每页请求，赶不上时提前警告
+
+        # 创建输出目录
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        # 信号量需要在事件循环内创建
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """获取请求主机对应的信号量"""
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def request_json(self, url: str, params: Dict, description: str) -> Optional[Dict]:
+        """
+        在信号量限制下发送请求
+
+        Args:
+            url: 请求地址
+            params: 查询参数
+            description: 日志中的请求描述
+
+        Returns:
+            响应中的 data 字段，失败返回None
+        """
+        # 日志字段：请求的UID和页码
+        uid = params.get('mid')
+        page = params.get('pn')
+
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            if cached.get('code') == 0:
+                return cached.get('data', {})
+            log.error('request_failed', "❌ {description}失败（缓存）：{error}", uid=uid, page=page,
+                      description=description, error=cached.get('message', '未知错误'),
+                      outcome='cached_error')
+            return None
+
+        network_errors = 0
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.metrics.record_retry()
+            if network_errors:
+                delay = self.retry_delay * network_errors + random.uniform(0, 3)
+                log.info('retry_wait', "⏳ {description}等待 {delay:.1f} 秒后重试...",
+                         uid=uid, page=page, attempt=attempt + 1, description=description, delay=delay)
+                await asyncio.sleep(delay)
+                self.metrics.record_sleep(delay, SLEEP_RETRY)
+
+            self.metrics.record_sleep(await self.rate_limiter.acquire_async())
+            try:
+                async with self._global_semaphore, self._host_semaphore(url):
+                    data = await asyncio.to_thread(
+                        self.transport.get_json, url, params, None, 20
+                    )
+            except CircuitOpenError as e:
+                # 接口熔断中：不再等待重试，把时间留给其他UID
+                log.warning('circuit_rejected', "🚧 {description}跳过：接口熔断中，{retry_in:.0f} 秒后才能再试",
+                            uid=uid, page=page, description=description, key=e.key, retry_in=e.retry_in,
+                            outcome='circuit_open')
+                return None
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in THROTTLE_HTTP_STATUS:
+                    self.rate_limiter.on_throttle()
+                    log.warning('throttle', "⚠️  {description}HTTP {status} 限流，降速至 {rate:.2f} 次/秒",
+                                uid=uid, page=page, attempt=attempt + 1, description=description,
+                                status=status, rate=self.rate_limiter.rate, outcome='throttle')
+                else:
+                    log.warning('http_error', "❌ {description}HTTP错误（尝试 {attempt}/{max_retries}）：{error}",
+                                uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                                description=description, status=status, error=e, outcome='http_error')
+                    network_errors += 1
+                continue
+            except requests.exceptions.Timeout:
+                log.warning('timeout', "⏰ {description}超时（尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            description=description, outcome='timeout')
+                network_errors += 1
+                continue
+            except requests.exceptions.ConnectionError:
+                log.warning('connection_error', "🔌 {description}连接错误（尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            description=description, outcome='connection_error')
+                network_errors += 1
+                continue
+            except Exception as e:
+                log.warning('request_error', "❌ {description}异常（尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            description=description, error=e, outcome='error')
+                network_errors += 1
+                continue
+
+            if data.get('code') == 0:
+                self.rate_limiter.on_success()
+                return data.get('data', {})
+
+            error_msg = data.get('message', '未知错误')
+            if is_throttle_response(data):
+                self.rate_limiter.on_throttle()
+                log.warning('throttle', "⚠️  {description}触发频率限制，降速至 {rate:.2f} 次/秒",
+                            uid=uid, page=page, attempt=attempt + 1, description=description,
+                            rate=self.rate_limiter.rate, outcome='throttle')
+                continue
+
+            log.error('request_failed', "❌ {description}失败：{error}", uid=uid, page=page,
+                      attempt=attempt + 1, description=description, error=error_msg, outcome='api_error')
+            return None
+
+        log.error('retries_exhausted', "💥 {description}失败，已达到最大重试次数",
+                  uid=uid, page=page, description=description, outcome='gave_up')
+        return None
+
+    async def get_user_info(self, uid: int) -> bool:
+        """检查用户是否存在"""
+        params = {
+            'mid': uid,
+            'ps': 1,
+            'pn': 1
+        }
+        data = await self.request_json(api_url("/x/space/arc/search"), params, f"[{uid}] 检查用户")
+        return data is not None
+
+    async def get_user_videos(self, uid: int, page: int = 1) -> Optional[Dict]:
+        """
+        获取用户的一页视频
+
+        Args:
+            uid: 用户UID
+            page: 页码，从1开始
+
+        Returns:
+            响应中的 data 字段，失败返回None
+        """
+        params = {
+            'mid': uid,
+            'ps': self.videos_per_page,
+            'pn': page,
+            'order': 'pubdate'
+        }
+        return await self.request_json(
+            api_url("/x/space/arc/search"), params, f"[{uid}] 第 {page} 页"
+        )
+
+    def iter_video_pages(self, uid: int, start_page: int = 1,
+                         seen_bvids: Optional[Set[str]] = None,
+                         stop_on_known: bool = False) -> AsyncVideoStream:
+        """
+        按页流式获取用户的视频（async for），每处理完一页才请求下一页
+
+        Args:
+            uid: 用户UID
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+
+        Returns:
+            异步视频流，调用 cancel() 或取消所在的任务即停止之后的请求
+        """
+        # 单独使用时（不经过 crawl_many）在此创建全局信号量
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return AsyncVideoStream(partial(self.get_user_videos, uid), self.videos_per_page,
+                                start_page, seen_bvids, stop_on_known, self.metrics,
+                                create_scheduler(self.deadline, self.rate_limiter, uid))
+
+    async def iter_videos(self, uid: int) -> AsyncIterator[Video]:
+        """
+        逐个产出用户的视频，调用方停止迭代后不再请求之后的页面
+
+        Args:
+            uid: 用户UID
+
+        Yields:
+            视频
+        """
+        async for video in self.iter_video_pages(uid).videos():
+            yield video
+
+    async def crawl_uid(self, uid: int) -> int:
+        """
+        爬取单个用户的所有视频并增量保存
+
+        Args:
+            uid: 用户UID
+
+        Returns:
+            已保存的视频总数
+        """
+        # 先确认用户存在，避免为不存在或无法访问的UID留下空的日志文件（之后会被当作可续传的爬取）
+        if not await self.get_user_info(uid):
+            log.error('not_found', "❌ [{uid}] 用户不存在或没有公开视频", uid=uid, outcome='not_found')
+            return 0
+
+        # 文件读写（读取整个日志或上次的 _final.json、每页 fsync）放到线程中，不阻塞其他UID的协程
+        filepath = await asyncio.to_thread(find_resumable_journal, self.output_dir, uid)
+        if filepath:
+            state = await asyncio.to_thread(load_journal_state, filepath, self.videos_per_page)
+            page = state['next_page']
+            total_videos = state['total']
+            seen_bvids = state['seen_bvids']
+            merge_from = state['merge_from']
+            log.info('journal_resumed', "🔁 [{uid}] 从第 {page} 页继续，已保存 {total} 个视频",
+                     uid=uid, page=page, total=total_videos, path=filepath)
+        else:
+            merge_from = (await asyncio.to_thread(find_latest_final, self.output_dir, uid)
+                          if self.incremental else None)
+            filepath = await asyncio.to_thread(
+                create_journal, self.output_dir, uid, {"crawler_version": "async_v1.0"},
+                page_size=self.videos_per_page, merge_from=merge_from, compression=self.compression
+            )
+            page = 1
+            total_videos = 0
+            seen_bvids = await asyncio.to_thread(load_known_bvids, merge_from) if merge_from else set()
+
+        stream = self.iter_video_pages(uid, page, seen_bvids, stop_on_known=bool(merge_from))
+        async for video_page in stream:
+            if video_page.videos:
+                total_videos = await asyncio.to_thread(
+                    append_journal_page, filepath, video_page.videos, video_page.page)
+            log.info('page_done', "✅ [{uid}] 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                     uid=uid, page=video_page.page, videos=len(video_page.videos), total=total_videos)
+        completed = stream.completed
+
+        if completed and merge_from and total_videos == 0:
+            await asyncio.to_thread(os.remove, filepath)
+            log.info('up_to_date', "✅ [{uid}] 没有新投稿", uid=uid, path=merge_from)
+        elif completed:
+            final_path, _ = await asyncio.to_thread(finalize_journal, filepath)
+            log.info('finalized', "🎉 [{uid}] 完成，共 {total} 个视频：{path}",
+                     uid=uid, total=total_videos, path=final_path)
+        else:
+            log.warning('incomplete', "⏸️  [{uid}] 未完成，已保存 {total} 个视频，再次运行将断点续传",
+                        uid=uid, page=stream.next_page, total=total_videos)
+
+        return total_videos
+
+    async def crawl_many(self, uids: Iterable[int]) -> Dict[int, int]:
+        """
+        并发爬取多个用户
+
+        Args:
+            uids: 用户UID列表
+
+        Returns:
+            每个UID保存的视频数
+        """
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+
+        # 限制同时处理的用户数，避免上千个UID同时创建保存文件
+        uid_semaphore = asyncio.Semaphore(self.max_active_uids)
+
+        async def crawl_limited(uid: int) -> int:
+            async with uid_semaphore:
+                return await self.crawl_uid(uid)
+
+        uid_list: List[int] = list(dict.fromkeys(uids))
+        results = await asyncio.gather(
+            *(crawl_limited(uid) for uid in uid_list),
+            return_exceptions=True
+        )
+
+        summary = {}
+        for uid, result in zip(uid_list, results):
+            if isinstance(result, Exception):
+                log.error('crawl_failed', "❌ [{uid}] 爬取异常：{error}", uid=uid, error=result)
+                summary[uid] = 0
+            else:
+                summary[uid] = result
+        return summary
+
+    def run(self, uids: Iterable[int]) -> Dict[int, int]:
+        """在新的事件循环中爬取多个用户，结束时输出本次运行的请求指标"""
+        metrics_baseline = self.metrics.snapshot()
+        try:
+            return asyncio.run(self.crawl_many(uids))
+        finally:
+            print_metrics_summary(self.metrics, metrics_baseline)
+
+
+def main():
+    """主函数"""
+    print("🚀 B站视频爬虫 - 异步多用户引擎")
+    print("=" * 50)
+
+    args = sys.argv[1:]
+    log_options = parse_logging_args(args)
+    if log_options is None:
+        sys.exit(1)
+    configure_logging(**log_options)
+    incremental = '--incremental' in args
+    no_cache = '--no-cache' in args
+    compression = 'zstd' if '--zstd' in args else 'gzip' if '--gzip' in args else None
+    metrics_port = None
+    if '--metrics-port' in args:
+        index = args.index('--metrics-port')
+        try:
+            metrics_port = int(args[index + 1])
+        except (IndexError, ValueError):
+            print("❌ --metrics-port 后需要指定端口号")
+            sys.exit(1)
+        del args[index:index + 2]
+    deadline = None
+    if '--deadline' in args:
+        index = args.index('--deadline')
+        try:
+            deadline = parse_duration(args[index + 1])
+        except (IndexError, ValueError):
+            print("❌ --deadline 后需要指定时长（如 1800、30m、1h30m）")
+            sys.exit(1)
+        del args[index:index + 2]
+    try:
+        uids = [int(arg) for arg in args
+                if arg not in ('--incremental', '--no-cache', '--gzip', '--zstd')]
+    except ValueError:
+        print("❌ 命令行参数必须是数字UID")
+        sys.exit(1)
+
+    if not uids:
+        print("用法：python bilibili_async_engine.py UID1 UID2 ...")
+        sys.exit(1)
+
+    # 增量爬取需要最新的第一页，同样跳过缓存读取
+    if no_cache or incremental:
+        get_shared_response_cache().bypass = True
+    engine = AsyncCrawlEngine()
+    engine.incremental = incremental
+    engine.compression = compression
+    engine.deadline = deadline
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
+    summary = engine.run(uids)
+
+    print("\n📊 爬取汇总：")
+    for uid, total in summary.items():
+        print(f"   {uid}: {total} 个视频")
+
+
+if __name__ == "__main__":
+    main()
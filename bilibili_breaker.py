@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 熔断器
+按“接口 + 出口”记录连续失败，触发风控后暂停请求该接口，到期后只放行一个试探请求
+
+- closed（正常）：连续失败（限流/-412/HTTP 412、5xx、连接错误、超时）达到阈值后熔断
+- open（熔断）：在冷却期内请求直接失败（CircuitOpenError），不再发出，也不再等待重试
+- half-open（试探）：冷却期结束后只放行一个请求，成功则恢复正常，失败则再次熔断且冷却时间翻倍
+- 状态保存在本地SQLite文件中，同一台机器上的多个进程共用，重启后继续生效
+
+爬虫收到 CircuitOpenError 后立即放弃当前请求；批量模式把当前UID放回队列，
+等熔断到期后再继续，其他出口（出口池）或其他接口不受影响。
+
+使用方法：
+    python bilibili_breaker.py            # 查看各接口的熔断状态
+    python bilibili_breaker.py --reset    # 清除所有熔断状态
+
+    BILIBILI_CIRCUIT_BREAKER=0 python run.py UID   # 关闭熔断器
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from bilibili_log import get_logger
+
+log = get_logger('breaker')
+
+# 默认状态文件，放在输出目录下（使用WAL模式，只能在同一台机器的进程之间共享）
+DEFAULT_BREAKER_PATH = "./output/circuit_breaker.db"
+
+# 熔断器状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 连续失败多少次后熔断
+DEFAULT_FAILURE_THRESHOLD = 5
+
+# 熔断冷却时间（秒），试探失败后翻倍，不超过上限
+DEFAULT_OPEN_SECONDS = 60.0
+MAX_OPEN_SECONDS = 900.0
+
+# 试探请求的最长时间，超过后视为试探者已退出，放行下一个试探请求
+PROBE_TIMEOUT = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS circuits (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'closed',
+    failures INTEGER NOT NULL DEFAULT 0,
+    trips INTEGER NOT NULL DEFAULT 0,
+    open_until REAL NOT NULL DEFAULT 0,
+    probe_until REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class CircuitOpenError(RuntimeError):
+    """接口处于熔断状态，请求未发送"""
+
+    def __init__(self, key: str, retry_in: float):
+        """
+        Args:
+            key: 熔断的接口和出口
+            retry_in: 距离可以试探的秒数
+        """
+        super().__init__(f"{key} 熔断中，{retry_in:.0f} 秒后再试")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def circuit_key(url: str, egress: Optional[str] = None) -> str:
+    """
+    熔断器的键：主机、接口路径和出口
+
+    键中包含主机名，通过 BILIBILI_API_BASE 切换到模拟服务器时与真实接口互不影响。
+
+    Args:
+        url: 请求地址
+        egress: 出口名称（代理地址），None 表示直连
+    """
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}@{egress or 'direct'}"
+
+
+class CircuitBreaker:
+    """按接口和出口熔断，状态保存在SQLite文件中"""
+
+    def __init__(self, db_path: str = DEFAULT_BREAKER_PATH,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 open_seconds: float = DEFAULT_OPEN_SECONDS,
+                 max_open_seconds: float = MAX_OPEN_SECONDS,
+                 probe_timeout: float = PROBE_TIMEOUT):
+        """
+        初始化熔断器（首次使用时才打开状态文件）
+
+        Args:
+            db_path: 状态文件路径
+            failure_threshold: 连续失败多少次后熔断
+            open_seconds: 熔断冷却时间（秒）
+            max_open_seconds: 试探失败后冷却时间翻倍的上限（秒）
+            probe_timeout: 试探请求的最长时间（秒）
+        """
+        self.db_path = db_path
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self.enabled = True  # 为False时放行所有请求，不记录结果
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # 上次读到的状态，成功请求只在状态不干净时才写入
+        self._seen: Dict[str, tuple] = {}
+
+        # 统计信息
+        self.rejections = 0
+        self.trips = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """状态文件的连接（需持有锁），fork 出的子进程重新连接"""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 自动提交模式，状态转换显式开启事务
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def allow(self, key: str) -> bool:
+        """
+        判断是否可以发送请求
+
+        熔断冷却期结束后，第一个调用者获得试探资格（状态转为 half-open），
+        试探结果返回前其他调用者仍被拒绝。
+
+        Args:
+            key: circuit_key() 生成的键
+
+        Returns:
+            是否可以发送
+        """
+        if not self.enabled:
+            return True
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT state, failures, open_until, probe_until FROM circuits WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row['state'] == STATE_CLOSED:
+                self._seen[key] = (STATE_CLOSED, row['failures'] if row else 0)
+                return True
+
+            now = time.time()
+            if row['state'] == STATE_OPEN and now < row['open_until']:
+                self.rejections += 1
+                return False
+            if row['state'] == STATE_HALF_OPEN and now < row['probe_until']:
+                self.rejections += 1
+                return False
+
+            # 冷却期已过（或上一个试探者超时）：抢占试探资格，只有一个进程能更新成功
+            cursor = self.conn.execute(
+                "UPDATE circuits SET state = ?, probe_until = ?, updated_at = ? "
+                "WHERE key = ? AND state = ? AND open_until = ? AND probe_until = ?",
+                (STATE_HALF_OPEN, now + self.probe_timeout, now,
+                 key, row['state'], row['open_until'], row['probe_until'])
+            )
+            if cursor.rowcount == 0:
+                self.rejections += 1
+                return False
+            self._seen[key] = (STATE_HALF_OPEN, row['failures'])
+
+        log.info('circuit_half_open', "🔎 {key} 冷却结束，发送试探请求", key=key, state=STATE_HALF_OPEN)
+        return True
+
+    def retry_in(self, key: Optional[str] = None) -> float:
+        """
+        距离可以试探的秒数
+
+        Args:
+            key: 要查询的键，为None时返回所有熔断中的键里最早可以试探的
+
+        Returns:
+            秒数，没有熔断时为0
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            if key is None:
+                row = self.conn.execute(
+                    "SELECT MIN(MAX(open_until, probe_until)) AS until FROM circuits WHERE state != ?",
+                    (STATE_CLOSED,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT MAX(open_until, probe_until) AS until FROM circuits WHERE key = ? AND state != ?",
+                    (key, STATE_CLOSED)
+                ).fetchone()
+        if row is None or row['until'] is None:
+            return 0.0
+        return max(row['until'] - time.time(), 0.0)
+
+    def record_success(self, key: str):
+        """请求成功（或接口正常返回了业务错误）：试探成功时恢复正常，清零连续失败"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._seen.get(key) == (STATE_CLOSED, 0):
+                return
+            cursor = self.conn.execute(
+                "UPDATE circuits SET state = ?, failures = 0, trips = 0, open_until = 0, probe_until = 0, "
+                "updated_at = ? WHERE key = ? AND (state != ? OR failures > 0)",
+                (STATE_CLOSED, time.time(), key, STATE_CLOSED)
+            )
+            recovered = cursor.rowcount > 0 and self._seen.get(key, (STATE_CLOSED,))[0] != STATE_CLOSED
+            self._seen[key] = (STATE_CLOSED, 0)
+        if recovered:
+            log.info('circuit_closed', "✅ {key} 试探成功，恢复正常请求", key=key, state=STATE_CLOSED)
+
+    def record_failure(self, key: str):
+        """请求失败（限流、风控、5xx、连接错误、超时）：连续失败达到阈值或试探失败时熔断"""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.time()
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT state, failures, trips FROM circuits WHERE key = ?", (key,)
+                ).fetchone()
+                state = row['state'] if row else STATE_CLOSED
+                failures = (row['failures'] if row else 0) + 1
+                trips = row['trips'] if row else 0
+                if state == STATE_OPEN:
+                    # 其他请求已经触发熔断（熔断前已发出的请求陆续失败），不重复计算
+                    opened = None
+                elif state == STATE_HALF_OPEN or failures >= self.failure_threshold:
+                    trips += 1
+                    opened = min(self.open_seconds * 2 ** (trips - 1), self.max_open_seconds)
+                    state = STATE_OPEN
+                else:
+                    opened = None
+                conn.execute(
+                    "INSERT INTO circuits (key, state, failures, trips, open_until, probe_until, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "state = excluded.state, failures = excluded.failures, trips = excluded.trips, "
+                    "open_until = CASE WHEN ? THEN excluded.open_until ELSE circuits.open_until END, "
+                    "probe_until = CASE WHEN ? THEN 0 ELSE circuits.probe_until END, "
+                    "updated_at = excluded.updated_at",
+                    (key, state, failures, trips, now + (opened or 0), now,
+                     opened is not None, opened is not None)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._seen[key] = (state, failures)
+            if opened is not None:
+                self.trips += 1
+
+        if opened is not None:
+            log.warning('circuit_open', "🚧 {key} 连续失败 {failures} 次，熔断 {seconds:.0f} 秒（至 {until}）",
+                        key=key, failures=failures, seconds=opened, state=STATE_OPEN,
+                        until=datetime.fromtimestamp(now + opened).strftime('%H:%M:%S'))
+
+    def circuits(self) -> List[Dict]:
+        """所有接口的熔断状态"""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM circuits ORDER BY key").fetchall()
+        return [dict(row) for row in rows]
+
+    def reset(self, key: Optional[str] = None) -> int:
+        """
+        清除熔断状态
+
+        Args:
+            key: 要清除的键，为None时清除所有
+
+        Returns:
+            清除的条目数
+        """
+        with self._lock:
+            if key is None:
+                cursor = self.conn.execute("DELETE FROM circuits")
+            else:
+                cursor = self.conn.execute("DELETE FROM circuits WHERE key = ?", (key,))
+            self._seen.clear()
+        return cursor.rowcount
+
+    def describe(self) -> str:
+        """熔断状态的文字说明"""
+        rows = self.circuits()
+        if not rows:
+            return "✅ 没有熔断记录"
+        now = time.time()
+        lines = ["🚧 熔断状态："]
+        for row in rows:
+            if row['state'] == STATE_OPEN and row['open_until'] > now:
+                status = f"熔断中，{row['open_until'] - now:.0f} 秒后试探（第 {row['trips']} 次熔断）"
+            elif row['state'] != STATE_CLOSED:
+                status = "等待试探"
+            else:
+                status = f"正常（连续失败 {row['failures']} 次）"
+            lines.append(f"   {row['key']}：{status}")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, int]:
+        """本进程的熔断统计"""
+        return {"rejections": self.rejections, "trips": self.trips}
+
+    def close(self):
+        """关闭状态文件"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_shared_breaker: Optional[CircuitBreaker] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_circuit_breaker() -> CircuitBreaker:
+    """获取进程内共享的熔断器，设置环境变量 BILIBILI_CIRCUIT_BREAKER=0 时关闭"""
+    global _shared_breaker
+    with _shared_lock:
+        if _shared_breaker is None:
+            _shared_breaker = CircuitBreaker()
+            _shared_breaker.enabled = os.environ.get("BILIBILI_CIRCUIT_BREAKER") != "0"
+        return _shared_breaker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或清除熔断状态")
+    parser.add_argument('--db', default=DEFAULT_BREAKER_PATH, help=f"状态文件路径（默认 {DEFAULT_BREAKER_PATH}）")
+    parser.add_argument('--reset', action='store_true', help="清除所有熔断状态")
+    args = parser.parse_args()
+
+    breaker = CircuitBreaker(args.db)
+    if args.reset:
+        print(f"🧹 已清除 {breaker.reset()} 条熔断记录")
+    else:
+        print(breaker.describe())
+    breaker.close()
+
+
+if __name__ == "__main__":
+    main()
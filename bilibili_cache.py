@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 磁盘响应缓存
+按接口地址和查询参数（mid、ps、pn、order 等）缓存API响应，重复运行时不再消耗限速配额
+
+- 成功的响应按 ttl 缓存，过期后重新请求
+- “用户不存在”等确定性的错误按 negative_ttl 缓存，避免反复请求无效UID
+- 限流、网络错误等临时失败不缓存
+- 缓存条目数和总大小有上限，超出时淘汰最久未使用的条目
+- bypass 为True时不读取缓存（仍会写入最新响应），相当于强制刷新
+
+每个条目是缓存目录下的一个JSON文件，文件名为请求的SHA-256摘要。
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from bilibili_rate_limiter import is_throttle_response
+
+# 默认缓存目录，放在输出目录下
+DEFAULT_CACHE_DIR = "./output/.cache"
+
+# 表示请求的资源确定不存在的业务码（-404 啥都木有，-626 用户不存在）
+NEGATIVE_CODES = (-404, -626)
+
+# 表示资源不存在的错误信息关键字
+NEGATIVE_KEYWORDS = ('不存在', '找不到')
+
+
+def make_cache_key(url: str, params: Optional[Dict] = None) -> str:
+    """
+    根据接口路径和查询参数生成缓存键
+
+    键中包含主机名，通过 BILIBILI_API_BASE 切换到模拟服务器时与真实接口的缓存互不影响。
+
+    Args:
+        url: 请求地址
+        params: 查询参数
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    parts = urlsplit(url)
+    payload = json.dumps(
+        [parts.netloc, parts.path, sorted((str(k), str(v)) for k, v in (params or {}).items())],
+        ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_negative_response(data: Dict) -> bool:
+    """判断API响应是否表示资源不存在（可以缓存的失败结果）"""
+    if data.get('code') in NEGATIVE_CODES:
+        return True
+    message = data.get('message') or ''
+    return data.get('code') != 0 and any(keyword in message for keyword in NEGATIVE_KEYWORDS)
+
+
+class ResponseCache:
+    """带过期时间和LRU淘汰的磁盘响应缓存"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = 600,
+                 negative_ttl: float = 6 * 3600, max_entries: int = 5000,
+                 max_bytes: int = 200 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            ttl: 成功响应的有效期（秒）
+            negative_ttl: “不存在”类错误响应的有效期（秒）
+            max_entries: 最多保存的条目数
+            max_bytes: 所有条目的总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = False  # 为True时跳过读取，每次都请求最新数据
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        # 条目键到文件大小的映射，按最近使用顺序排列，首次使用时从磁盘加载
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        """条目对应的文件路径，按前两位分目录"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """扫描缓存目录，按文件修改时间（最近使用时间）建立索引（需持有锁）"""
+        if self._index is not None:
+            return
+
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith('.json'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total_bytes = sum(self._index.values())
+
+    def _remove(self, key: str):
+        """删除条目（需持有锁）"""
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到满足数量和大小上限（需持有锁）"""
+        while self._index and (len(self._index) > self.max_entries
+                               or self._total_bytes > self.max_bytes):
+            key = next(iter(self._index))
+            self._remove(key)
+            self.evictions += 1
+
+    def get(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        读取缓存的响应
+
+        Args:
+            url: 请求地址
+            params: 查询参数
+
+        Returns:
+            缓存的响应JSON，未命中、已过期或 bypass 时返回None
+        """
+        if self.bypass:
+            return None
+
+        key = make_cache_key(url, params)
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                # 文件损坏或已被其他进程删除
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if entry.get('expires_at', 0) <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # 更新最近使用时间，重启后仍能按LRU顺序淘汰
+            self._index.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.hits += 1
+            return entry.get('response')
+
+    def put(self, url: str, params: Optional[Dict], data: Dict) -> bool:
+        """
+        缓存一个响应，只有成功和“不存在”类响应会被缓存
+
+        Args:
+            url: 请求地址
+            params: 查询参数
+            data: 响应JSON
+
+        Returns:
+            是否已缓存
+        """
+        if data.get('code') == 0:
+            ttl = self.ttl
+            negative = False
+        elif is_negative_response(data) and not is_throttle_response(data):
+            ttl = self.negative_ttl
+            negative = True
+        else:
+            return False
+        if ttl <= 0:
+            return False
+
+        key = make_cache_key(url, params)
+        path = self._path(key)
+        now = time.time()
+        entry = {
+            "url": url,
+            "params": params or {},
+            "negative": negative,
+            "stored_at": now,
+            "expires_at": now + ttl,
+            "response": data
+        }
+        payload = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+
+        with self._lock:
+            self._load_index()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，其他进程不会读到写了一半的条目
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(payload)
+            self._total_bytes += len(payload)
+            self.stores += 1
+            self._evict()
+        return True
+
+    def invalidate(self, url: str, params: Optional[Dict] = None):
+        """删除某个请求的缓存"""
+        key = make_cache_key(url, params)
+        with self._lock:
+            self._load_index()
+            self._remove(key)
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        """缓存统计信息"""
+        with self._lock:
+            self._load_index()
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions
+            }
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_response_cache() -> ResponseCache:
+    """获取进程内共享的响应缓存，设置环境变量 BILIBILI_CACHE_BYPASS=1 时跳过读取"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+            _shared_cache.bypass = os.environ.get("BILIBILI_CACHE_BYPASS") == "1"
+        return _shared_cache
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 输出压缩
+增量保存日志和 _final.json 可以用 gzip 或 zstd 压缩，读取时按扩展名自动解压
+
+- 日志每追加一页写入一个独立的 gzip 成员 / zstd 帧，追加时不会重写已有内容；
+  多个成员（帧）首尾相连仍是合法的压缩文件，gzip/zstd 命令行工具可以直接解压
+- 读取最后一条记录时从文件尾部反向查找最后一个完整的帧，开销与文件大小无关
+- 最后一帧只写了一半（程序中断）时，追加前先截掉不完整的部分
+- _final.json 流式压缩写入，内存中只保留当前正在写入的视频
+- 标题、简介等中文文本压缩率很高，gzip 通常可将输出缩小到原来的 1/5 左右
+
+gzip 使用标准库；zstd 需要安装 zstandard 库：pip install zstandard
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import gzip
+import io
+import os
+import re
+import zlib
+from typing import BinaryIO, Optional, TextIO, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 支持的压缩格式
+COMPRESSIONS = ('gzip', 'zstd')
+
+# 压缩格式对应的扩展名（附加在 .jsonl / _final.json 之后）
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+# 文件名中可选的压缩扩展名（用于拼接正则）
+COMPRESSION_SUFFIX_PATTERN = "(?:" + "|".join(re.escape(suffix) for suffix in COMPRESSION_SUFFIXES.values()) + ")?"
+
+# 每个帧开头的魔数，用于从文件尾部反向查找帧的起点
+_FRAME_MAGIC = {'gzip': b'\x1f\x8b\x08', 'zstd': b'\x28\xb5\x2f\xfd'}
+
+# 反向查找最后一帧时每次多读取的字节数
+_TAIL_BLOCK_SIZE = 65536
+
+# 压缩级别：日志每页一帧，帧很小，用较快的级别
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def require_compression(compression: Optional[str]):
+    """检查压缩格式是否可用"""
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩格式：{compression}（可选：{', '.join(COMPRESSIONS)}）")
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError("zstd 压缩需要 zstandard 库，请运行：pip install zstandard")
+
+
+def compression_of(filepath: str) -> Optional[str]:
+    """根据扩展名判断文件的压缩格式，未压缩返回None"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if filepath.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(filepath: str) -> str:
+    """去掉压缩扩展名"""
+    compression = compression_of(filepath)
+    if compression:
+        return filepath[:-len(COMPRESSION_SUFFIXES[compression])]
+    return filepath
+
+
+def with_compression_suffix(filepath: str, compression: Optional[str]) -> str:
+    """加上压缩扩展名（未压缩时原样返回）"""
+    return filepath + COMPRESSION_SUFFIXES[compression] if compression else filepath
+
+
+def compress_frame(data: bytes, compression: Optional[str]) -> bytes:
+    """
+    将一段数据压缩为一个独立的帧
+
+    Args:
+        data: 原始数据
+        compression: 压缩格式，None 表示不压缩
+
+    Returns:
+        可直接追加到文件末尾的数据
+    """
+    if compression == 'gzip':
+        # mtime 固定为0，相同内容得到相同的压缩结果
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if compression == 'zstd':
+        require_compression(compression)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def _decode_frame(data: bytes, compression: str) -> Tuple[Optional[bytes], int]:
+    """
+    解压 data 开头的一个完整帧
+
+    Returns:
+        (解压后的数据, 帧的长度)，不是完整的帧时返回 (None, 0)
+    """
+    try:
+        if compression == 'gzip':
+            decoder = zlib.decompressobj(wbits=31)
+        else:
+            decoder = zstandard.ZstdDecompressor().decompressobj()
+        out = decoder.decompress(data)
+        if not decoder.eof:
+            return None, 0
+    except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)):
+        return None, 0
+    return out, len(data) - len(decoder.unused_data)
+
+
+def read_last_frame(filepath: str, compression: str) -> Tuple[Optional[bytes], int]:
+    """
+    从文件尾部反向查找最后一个完整的帧
+
+    魔数也可能偶然出现在压缩数据中，因此每个候选位置都尝试解压验证。
+
+    Args:
+        filepath: 压缩文件路径
+        compression: 压缩格式
+
+    Returns:
+        (最后一帧解压后的数据, 该帧结束的位置)；没有完整的帧时返回 (None, 0)
+    """
+    require_compression(compression)
+    magic = _FRAME_MAGIC[compression]
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        start = size
+        buf = b""
+        while start > 0:
+            step = min(_TAIL_BLOCK_SIZE, start)
+            start -= step
+            f.seek(start)
+            buf = f.read(step) + buf
+
+            # 在新读入的部分（以及与之前部分的交界处）从后往前查找魔数
+            pos = buf.rfind(magic, 0, step + len(magic) - 1)
+            while pos >= 0:
+                data, length = _decode_frame(buf[pos:], compression)
+                if data is not None:
+                    return data, start + pos + length
+                pos = buf.rfind(magic, 0, pos)
+    return None, 0
+
+
+def truncate_incomplete_frame(filepath: str, compression: str) -> None:
+    """
+    截掉文件末尾不完整的帧（程序中断时最后一页可能只写了一半）
+
+    Args:
+        filepath: 压缩文件路径
+        compression: 压缩格式
+    """
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return
+    _, end = read_last_frame(filepath, compression)
+    if end < size:
+        with open(filepath, 'r+b') as f:
+            f.truncate(end)
+
+
+class _FrameReader(io.RawIOBase):
+    """
+    逐帧解压首尾相连的多个 gzip 成员 / zstd 帧，末尾不完整的帧视为文件结束
+
+    gzip 模块和 zstandard 的 stream_reader 遇到被截断的最后一帧都会报错，这里逐帧解压。
+    gzip 成员只缺少末尾校验时内容已能全部解压，whole_frames 为True时每帧解压完整后才输出，
+    与 read_last_frame / truncate_incomplete_frame 对“完整的帧”的判断保持一致。
+    """
+
+    def __init__(self, raw: BinaryIO, compression: str, whole_frames: bool = False):
+        self.raw = raw
+        self.compression = compression
+        self.whole_frames = whole_frames
+        self.decoder = self._new_decoder()
+        self.pending = b""
+        self.frame = b""  # whole_frames 时当前帧已解压、尚未输出的数据
+
+    def _new_decoder(self):
+        if self.compression == 'gzip':
+            return zlib.decompressobj(wbits=31)
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            chunk = self.raw.read(_TAIL_BLOCK_SIZE)
+            if not chunk:
+                return 0
+            while chunk:
+                try:
+                    out = self.decoder.decompress(chunk)
+                except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)):
+                    return 0
+                if not self.whole_frames:
+                    self.pending += out
+                elif self.decoder.eof:
+                    self.pending += self.frame + out
+                    self.frame = b""
+                else:
+                    self.frame += out
+                if not self.decoder.eof:
+                    break
+                # 一帧结束，剩余数据属于下一帧
+                chunk = self.decoder.unused_data
+                self.decoder = self._new_decoder()
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def open_text(filepath: str, whole_frames: bool = False) -> TextIO:
+    """
+    以文本方式读取文件，按扩展名自动解压
+
+    压缩文件末尾不完整的帧会被忽略（与未压缩日志中被截断的最后一行相同处理）。
+
+    Args:
+        filepath: 文件路径
+        whole_frames: 只输出完整的帧（读取日志时使用；_final.json 只有一帧，流式读取时不使用）
+
+    Returns:
+        文本文件对象
+    """
+    compression = compression_of(filepath)
+    if compression is None:
+        return open(filepath, 'r', encoding='utf-8')
+    require_compression(compression)
+    raw = open(filepath, 'rb')
+    reader = _FrameReader(raw, compression, whole_frames)
+    return io.TextIOWrapper(io.BufferedReader(reader, _TAIL_BLOCK_SIZE), encoding='utf-8')
+
+
+def open_text_writer(raw: BinaryIO, compression: Optional[str]) -> TextIO:
+    """
+    在已打开的二进制文件上创建（压缩）文本写入对象
+
+    关闭返回的对象会写完压缩数据，但不会关闭 raw，调用方随后可以 fsync。
+    未压缩时关闭前需调用 detach()（见 close_text_writer）。
+
+    Args:
+        raw: 二进制文件对象
+        compression: 压缩格式，None 表示不压缩
+
+    Returns:
+        文本文件对象
+    """
+    require_compression(compression)
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    elif compression == 'zstd':
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding='utf-8', write_through=compression is None)
+
+
+def close_text_writer(writer: TextIO, compression: Optional[str]) -> None:
+    """结束写入：压缩时写完最后的数据，底层二进制文件保持打开"""
+    if compression is None:
+        writer.flush()
+        writer.detach()
+    else:
+        writer.close()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - SQLite存储后端
+所有UP主的视频保存在同一个SQLite数据库中，按bvid更新，不再每次生成带时间戳的新文件
+
+- 每页视频在一个事务中写入（INSERT ... ON CONFLICT DO UPDATE），播放量等字段更新为最新值
+- WAL模式：爬取写入的同时可以随时查询
+- 索引：bvid 为主键（WITHOUT ROWID表按bvid聚簇存储），(mid, created) 用于按UP主查询最新视频
+- 视图 videos_json 输出与 _final.json 相同格式的视频JSON，可以随时导出为 _final.json
+- crawls 表记录每个UP主的爬取进度，中断后按页断点续传
+
+使用方法：
+python bilibili_database.py import output/*_final.json    # 导入已有的 _final.json
+python bilibili_database.py export 435776729             # 导出为 _final.json
+python bilibili_database.py latest 1001 1002 --limit 100  # 这些UP主最新的100个视频
+python bilibili_database.py stats
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from bilibili_log import get_logger
+from bilibili_storage import count_saved_videos, load_final_file, write_final_json
+from bilibili_video import VIDEO_FIELDS, VIDEO_URL_PREFIX, Video, as_video
+
+log = get_logger('database')
+
+# 默认数据库文件，放在输出目录下
+DEFAULT_DB_PATH = "./output/videos.db"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS videos (
+    bvid TEXT PRIMARY KEY,
+    aid INTEGER,
+    mid INTEGER NOT NULL,
+    title TEXT,
+    duration TEXT,
+    created INTEGER,
+    view INTEGER,
+    danmaku INTEGER,
+    reply INTEGER,
+    pic TEXT,
+    description TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_videos_mid_created ON videos (mid, created DESC);
+
+CREATE TABLE IF NOT EXISTS crawls (
+    mid INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    page_size INTEGER,
+    last_page INTEGER NOT NULL DEFAULT 0,
+    saved INTEGER NOT NULL DEFAULT 0,
+    incremental INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL
+);
+
+CREATE VIEW IF NOT EXISTS videos_json AS
+SELECT mid, bvid, created, json_object(
+    'aid', aid, 'bvid', bvid, 'title', title, 'url', '{VIDEO_URL_PREFIX}' || bvid,
+    'duration', duration, 'created', created, 'view', view, 'danmaku', danmaku,
+    'reply', reply, 'pic', pic, 'description', description
+) AS video
+FROM videos;
+"""
+
+_UPSERT = f"""
+INSERT INTO videos ({', '.join(VIDEO_FIELDS)}, mid, first_seen, last_seen)
+VALUES ({', '.join('?' * (len(VIDEO_FIELDS) + 3))})
+ON CONFLICT (bvid) DO UPDATE SET
+{', '.join(f'{name} = excluded.{name}' for name in VIDEO_FIELDS if name != 'bvid')},
+mid = excluded.mid, last_seen = excluded.last_seen
+"""
+
+
+def _now() -> str:
+    """当前时间字符串（与 _final.json 中的格式一致）"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class VideoDatabase:
+    """基于SQLite的视频存储"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        """
+        打开（或创建）数据库
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 自动提交模式，每页的写入显式开启事务
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        # WAL模式下读写互不阻塞；NORMAL 同步级别在WAL下不会损坏数据库
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def _write_videos(self, mid: int, videos: Iterable[Union[Video, Dict]]) -> int:
+        """写入视频（需在事务中调用），返回新增的视频数"""
+        now = time.time()
+        rows = [
+            video.to_row() + (mid, now, now)
+            for video in map(as_video, videos) if video.bvid
+        ]
+        if not rows:
+            return 0
+
+        bvids = [row[1] for row in rows]
+        existing = self.conn.execute(
+            "SELECT COUNT(*) FROM videos WHERE bvid IN (SELECT value FROM json_each(?))",
+            (json.dumps(bvids),)
+        ).fetchone()[0]
+        self.conn.executemany(_UPSERT, rows)
+        return len(set(bvids)) - existing
+
+    def upsert_videos(self, mid: int, videos: Iterable[Union[Video, Dict]]) -> int:
+        """
+        在一个事务中写入一批视频，已存在的bvid更新为最新数据
+
+        Args:
+            mid: UP主UID
+            videos: 视频对象或 _final.json 格式的视频字典
+
+        Returns:
+            新增的视频数（不含更新的）
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = self._write_videos(mid, videos)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def begin_crawl(self, mid: int, page_size: int, resume: bool = True,
+                    incremental: bool = False) -> Dict:
+        """
+        开始（或继续）某个UP主的爬取
+
+        Args:
+            mid: UP主UID
+            page_size: 每页视频数
+            resume: 上次爬取未完成时是否断点续传
+            incremental: 是否增量爬取（数据库中没有该UP主的视频时按完整爬取处理）
+
+        Returns:
+            包含 next_page、saved、seen_bvids、incremental、resumed 的字典
+        """
+        row = self.conn.execute("SELECT * FROM crawls WHERE mid = ?", (mid,)).fetchone()
+
+        if resume and row and row['status'] == 'crawling':
+            if row['page_size'] == page_size and row['last_page'] > 0:
+                next_page = row['last_page'] + 1
+            else:
+                next_page = row['saved'] // page_size + 1
+            incremental = bool(row['incremental'])
+            # 续传时页面内容可能因新投稿而偏移，本次爬取已保存的视频按bvid去重
+            seen_bvids = self.known_bvids(mid, since=row['started_at'])
+            return {
+                "next_page": next_page,
+                "saved": row['saved'],
+                "seen_bvids": seen_bvids | (self.known_bvids(mid) if incremental else set()),
+                "incremental": incremental,
+                "resumed": True
+            }
+
+        incremental = incremental and self.count_videos(mid) > 0
+        self.conn.execute(
+            "INSERT OR REPLACE INTO crawls (mid, status, page_size, last_page, saved, incremental, "
+            "started_at, finished_at) VALUES (?, 'crawling', ?, 0, 0, ?, ?, NULL)",
+            (mid, page_size, int(incremental), time.time())
+        )
+        return {
+            "next_page": 1,
+            "saved": 0,
+            "seen_bvids": self.known_bvids(mid) if incremental else set(),
+            "incremental": incremental,
+            "resumed": False
+        }
+
+    def save_page(self, mid: int, videos: List[Video], page: int) -> int:
+        """
+        在一个事务中保存一页视频并记录爬取进度
+
+        Args:
+            mid: UP主UID
+            videos: 本页视频
+            page: 页码
+
+        Returns:
+            本次爬取累计保存的视频数
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_videos(mid, videos)
+            self.conn.execute(
+                "UPDATE crawls SET last_page = MAX(last_page, ?), saved = saved + ? WHERE mid = ?",
+                (page, len(videos), mid)
+            )
+            row = self.conn.execute("SELECT saved FROM crawls WHERE mid = ?", (mid,)).fetchone()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return row['saved'] if row else len(videos)
+
+    def finish_crawl(self, mid: int) -> Dict:
+        """
+        标记某个UP主的爬取已完成
+
+        Returns:
+            包含 saved（本次保存的视频数）和 total_videos（数据库中的视频总数）的字典
+        """
+        self.conn.execute(
+            "UPDATE crawls SET status = 'completed', finished_at = ? WHERE mid = ?",
+            (time.time(), mid)
+        )
+        row = self.conn.execute("SELECT saved FROM crawls WHERE mid = ?", (mid,)).fetchone()
+        return {"saved": row['saved'] if row else 0, "total_videos": self.count_videos(mid)}
+
+    def crawl_status(self, mid: int) -> Optional[Dict]:
+        """某个UP主最近一次爬取的记录（status、saved、started_at、finished_at 等），没有时返回None"""
+        row = self.conn.execute("SELECT * FROM crawls WHERE mid = ?", (mid,)).fetchone()
+        return dict(row) if row else None
+
+    def known_bvids(self, mid: int, since: Optional[float] = None) -> Set[str]:
+        """某个UP主已保存的bvid，since 不为None时只返回该时间之后写入或更新的"""
+        if since is None:
+            rows = self.conn.execute("SELECT bvid FROM videos WHERE mid = ?", (mid,))
+        else:
+            rows = self.conn.execute(
+                "SELECT bvid FROM videos WHERE mid = ? AND last_seen >= ?", (mid, since)
+            )
+        return {row[0] for row in rows}
+
+    def count_videos(self, mid: Optional[int] = None) -> int:
+        """视频数，mid 为None时统计所有UP主"""
+        if mid is None:
+            return self.conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM videos WHERE mid = ?", (mid,)).fetchone()[0]
+
+    def iter_videos(self, mid: int) -> Iterator[Dict]:
+        """按发布时间从新到旧遍历某个UP主的视频（_final.json 格式）"""
+        rows = self.conn.execute(
+            "SELECT video FROM videos_json WHERE mid = ? ORDER BY created DESC", (mid,)
+        )
+        for row in rows:
+            yield json.loads(row[0])
+
+    def latest_videos(self, mids: Iterable[int], limit: int = 100,
+                      per_uploader: bool = False) -> List[Dict]:
+        """
+        查询一批UP主最新发布的视频
+
+        只通过 (mid, created) 索引读取需要的行，不会扫描UP主的全部视频：
+        合计最新的 limit 个视频一定不早于“各UP主最新视频中第 limit 新的发布时间”，
+        先求出这个下界，再按索引读取每个UP主在下界之后的视频。
+
+        Args:
+            mids: UP主UID列表
+            limit: 返回的视频数
+            per_uploader: 为True时每个UP主各返回 limit 个，否则返回所有UP主合计最新的 limit 个
+
+        Returns:
+            视频列表（_final.json 格式，附带 mid 字段），按发布时间从新到旧排列
+        """
+        mids_json = json.dumps(sorted({int(mid) for mid in mids}))
+        # 每个UP主最新的 limit 个视频
+        top_per_uploader = (
+            "SELECT v.bvid, v.created FROM json_each(?) AS m "
+            "JOIN videos AS v ON v.bvid IN ("
+            "SELECT bvid FROM videos WHERE mid = m.value ORDER BY created DESC LIMIT ?)"
+        )
+
+        if per_uploader:
+            query = (f"SELECT j.mid, j.video FROM ({top_per_uploader}) AS c "
+                     "JOIN videos_json AS j ON j.bvid = c.bvid ORDER BY j.mid, j.created DESC")
+            params = (mids_json, limit)
+        else:
+            threshold = self.conn.execute(
+                "SELECT latest FROM (SELECT (SELECT MAX(created) FROM videos WHERE mid = m.value) "
+                "AS latest FROM json_each(?) AS m) WHERE latest IS NOT NULL "
+                "ORDER BY latest DESC LIMIT 1 OFFSET ?",
+                (mids_json, limit - 1)
+            ).fetchone()
+            if threshold is None:
+                # 有视频的UP主不足 limit 个，直接合并每个UP主最新的 limit 个
+                candidates = f"{top_per_uploader} ORDER BY v.created DESC LIMIT ?"
+                params = (mids_json, limit, limit)
+            else:
+                candidates = (
+                    "SELECT v.bvid, v.created FROM json_each(?) AS m "
+                    "JOIN videos AS v ON v.mid = m.value AND v.created >= ? "
+                    "ORDER BY v.created DESC LIMIT ?"
+                )
+                params = (mids_json, threshold[0], limit)
+            query = (f"SELECT j.mid, j.video FROM ({candidates}) AS c "
+                     "JOIN videos_json AS j ON j.bvid = c.bvid ORDER BY j.created DESC")
+
+        videos = []
+        for row in self.conn.execute(query, params):
+            video = json.loads(row['video'])
+            video['mid'] = row['mid']
+            videos.append(video)
+        return videos
+
+    def export_json(self, mid: int, filepath: Optional[str] = None) -> str:
+        """
+        将某个UP主的视频导出为 _final.json 格式的文件
+
+        Args:
+            mid: UP主UID
+            filepath: 输出路径，为None时在数据库所在目录生成 videos_UID_时间戳_final.json
+
+        Returns:
+            导出的文件路径
+        """
+        if filepath is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filepath = os.path.join(os.path.dirname(self.db_path) or '.',
+                                    f"videos_{mid}_{timestamp}_final.json")
+
+        user_info = {
+            "uid": mid,
+            "total_videos": self.count_videos(mid),
+            "export_time": _now(),
+            "source": os.path.basename(self.db_path),
+            "status": "completed"
+        }
+        write_final_json(filepath, user_info, self.iter_videos(mid))
+        return filepath
+
+    def import_final_file(self, filepath: str) -> int:
+        """
+        导入已有的 _final.json（或旧版JSON）文件
+
+        Returns:
+            新增的视频数
+        """
+        data = load_final_file(filepath)
+        mid = data.get('user_info', {}).get('uid')
+        if mid is None:
+            raise ValueError(f"文件中没有UID：{filepath}")
+        return self.upsert_videos(int(mid), data.get('videos', []))
+
+    def stats(self) -> Dict[str, int]:
+        """数据库统计信息"""
+        return {
+            "videos": self.count_videos(),
+            "uploaders": self.conn.execute("SELECT COUNT(DISTINCT mid) FROM videos").fetchone()[0],
+            "crawling": self.conn.execute(
+                "SELECT COUNT(*) FROM crawls WHERE status = 'crawling'").fetchone()[0],
+            # WAL模式下未合并的写入位于 -wal 文件中
+            "bytes": sum(os.path.getsize(path) for path in (self.db_path, self.db_path + '-wal')
+                         if os.path.exists(path))
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+
+def crawl_to_database(crawler, uid: int, database: VideoDatabase) -> int:
+    """
+    用爬虫逐页获取视频并写入数据库，每页一个事务
+
+    爬虫需要提供 iter_video_pages(uid, start_page, seen_bvids, stop_on_known)、
+    videos_per_page、resume 和 incremental（标准版本和智能版本都满足）。
+
+    Args:
+        crawler: 爬虫实例
+        uid: 用户UID
+        database: 视频数据库
+
+    Returns:
+        本次爬取保存（新增或更新）的视频数
+    """
+    page_size = crawler.videos_per_page
+    state = database.begin_crawl(uid, page_size, crawler.resume, crawler.incremental)
+    saved = state['saved']
+    seen_bvids = state['seen_bvids']
+    incremental = state['incremental']
+    if state['resumed']:
+        log.info('crawl_resumed', "🔁 数据库中有未完成的爬取，已保存 {total} 个视频，从第 {page} 页继续",
+                 uid=uid, total=saved, page=state['next_page'])
+    elif incremental:
+        log.info('incremental_base', "📚 增量爬取，数据库中已有 {known} 个视频",
+                 uid=uid, known=len(seen_bvids))
+
+    log.info('database_target', "💾 数据写入数据库：{path}", uid=uid, path=database.db_path)
+
+    stream = crawler.iter_video_pages(uid, state['next_page'], seen_bvids, stop_on_known=incremental)
+    write_failed = False
+    for video_page in stream:
+        try:
+            saved = database.save_page(uid, video_page.videos, video_page.page)
+        except sqlite3.Error as e:
+            log.error('save_failed', "❌ 第 {page} 页写入数据库失败：{error}",
+                      uid=uid, page=video_page.page, error=e)
+            write_failed = True
+            page = video_page.page
+            break
+        log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                 uid=uid, page=video_page.page, videos=len(video_page.videos), total=saved)
+    else:
+        page = stream.next_page
+        log.info('stream_end', "{description}", uid=uid, page=page,
+                 outcome=stream.stop_reason, description=stream.describe())
+    completed = stream.completed and not write_failed
+
+    if completed:
+        result = database.finish_crawl(uid)
+        log.info('finalized', "\n🎉 已写入数据库：本次保存 {saved} 个视频，该UP主共 {total} 个",
+                 uid=uid, saved=result['saved'], total=result['total_videos'])
+    else:
+        log.warning('incomplete', "⏸️  爬取未完成，已保存 {total} 个视频，再次运行将从第 {page} 页继续",
+                    uid=uid, page=page, total=saved)
+
+    return saved
+
+
+def count_crawl_videos(crawler, uid: int, since: float) -> int:
+    """
+    某次爬取保存的视频数，按爬虫的存储后端读取
+
+    Args:
+        crawler: 爬虫实例
+        uid: 用户UID
+        since: 爬取开始时间
+
+    Returns:
+        sqlite 后端为本次写入数据库的视频数，snapshot 后端为本次快照记录的视频数，
+        json 后端为新生成的 _final.json 中的新视频数
+    """
+    storage = getattr(crawler, 'storage', 'json')
+    if storage == 'snapshot':
+        from bilibili_snapshots import count_snapshot_videos
+        return count_snapshot_videos(crawler.snapshot_path, uid, since)
+    if storage != 'sqlite':
+        return count_saved_videos(crawler.output_dir, uid, since)
+
+    database = VideoDatabase(crawler.db_path)
+    try:
+        crawl = database.crawl_status(uid)
+    finally:
+        database.close()
+    if not crawl or (crawl['started_at'] or 0) < since:
+        return 0
+    return crawl['saved']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站视频数据库工具")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f"数据库文件（默认 {DEFAULT_DB_PATH}）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="导入 _final.json 文件")
+    import_parser.add_argument('files', nargs='+')
+
+    export_parser = subparsers.add_parser('export', help="导出某个UP主的视频为 _final.json")
+    export_parser.add_argument('uid', type=int)
+    export_parser.add_argument('-o', '--output', help="输出文件路径")
+
+    latest_parser = subparsers.add_parser('latest', help="查询一批UP主最新的视频")
+    latest_parser.add_argument('uids', nargs='*', type=int)
+    latest_parser.add_argument('--from-file', help="从文件读取UID列表（每行一个）")
+    latest_parser.add_argument('--limit', type=int, default=100)
+    latest_parser.add_argument('--per-uploader', action='store_true', help="每个UP主各返回 limit 个")
+
+    subparsers.add_parser('stats', help="数据库统计信息")
+    args = parser.parse_args()
+
+    database = VideoDatabase(args.db)
+    try:
+        if args.command == 'import':
+            for filepath in args.files:
+                try:
+                    added = database.import_final_file(filepath)
+                    print(f"📥 {filepath}：新增 {added} 个视频")
+                except (OSError, ValueError) as e:
+                    print(f"❌ {filepath}：{e}")
+        elif args.command == 'export':
+            filepath = database.export_json(args.uid, args.output)
+            print(f"💾 已导出：{filepath}")
+        elif args.command == 'latest':
+            uids = list(args.uids)
+            if args.from_file:
+                from bilibili_queue import read_uid_source
+                uids += read_uid_source(args.from_file)
+            start = time.perf_counter()
+            videos = database.latest_videos(uids, args.limit, args.per_uploader)
+            elapsed = (time.perf_counter() - start) * 1000
+            for video in videos:
+                created = datetime.fromtimestamp(video['created'] or 0).strftime("%Y-%m-%d %H:%M")
+                print(f"{created}  {video['mid']:>12}  {video['bvid']}  {video['title']}")
+            print(f"\n📊 {len(uids)} 个UP主，{len(videos)} 个视频，查询耗时 {elapsed:.1f} 毫秒",
+                  file=sys.stderr)
+        elif args.command == 'stats':
+            stats = database.stats()
+            print(f"📊 {args.db}：{stats['uploaders']} 个UP主，{stats['videos']} 个视频，"
+                  f"{stats['bytes'] / 1024 / 1024:.1f} MB，未完成的爬取 {stats['crawling']} 个")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 出口池（多个代理出口）
+B站按来源IP限流，轮换User-Agent不能提高吞吐量；多个代理出口各自计算限额，
+总吞吐量随健康出口的数量增加
+
+- 每个出口有独立的连接池、自适应限速器和健康分（最近请求成功率的指数加权平均）
+- 触发频率限制（频繁/-412/HTTP 412等）：该出口进入冷却，连续限流时冷却时间翻倍
+- 连续连接失败或健康分过低的出口被剔除，不再使用
+- 每次请求发往有空闲额度的出口中健康分最高的一个；都没有额度时选最早可用的
+- 请求结果由传输层按实际使用的出口记录，爬虫代码不需要改动
+
+使用方法：
+    pool = EgressPool(['http://p1:8080', 'http://p2:8080', 'direct'])
+    crawler = BilibiliSimpleCrawler(**pool_components(pool))
+
+    python run.py batch uids.txt --proxies http://p1:8080,http://p2:8080,direct
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bilibili_log import get_logger
+from bilibili_rate_limiter import AdaptiveRateLimiter
+
+log = get_logger('egress')
+
+# 表示直连（不使用代理）的出口名称
+DIRECT = 'direct'
+
+# 触发限流后的冷却时间（秒），连续限流时翻倍，不超过上限
+DEFAULT_COOLDOWN = 30.0
+MAX_COOLDOWN = 600.0
+
+# 连续连接失败多少次后剔除出口
+MAX_CONSECUTIVE_FAILURES = 5
+
+# 健康分低于该值（且请求数足够）时剔除出口
+EVICT_HEALTH = 0.2
+MIN_SAMPLES = 10
+
+# 健康分的平滑系数
+HEALTH_SMOOTHING = 0.2
+
+
+class NoHealthyEgressError(RuntimeError):
+    """所有出口都已被剔除"""
+
+
+def parse_proxy_list(text: str) -> List[Optional[str]]:
+    """
+    解析逗号分隔的代理列表，direct 表示直连
+
+    Args:
+        text: 如 "http://p1:8080,http://p2:8080,direct"
+
+    Returns:
+        代理地址列表，直连为None
+    """
+    proxies = []
+    for item in text.split(','):
+        item = item.strip()
+        if item:
+            proxies.append(None if item.lower() == DIRECT else item)
+    return proxies
+
+
+class Egress:
+    """一个出口：代理（或直连）及其连接池、限速器和健康状态"""
+
+    def __init__(self, proxy: Optional[str], limiter: AdaptiveRateLimiter,
+                 pool_size: int = 10, per_host_limit: int = 4):
+        """
+        Args:
+            proxy: 代理地址，None 表示直连
+            limiter: 该出口的限速器
+            pool_size: 缓存的主机连接池数量
+            per_host_limit: 每个主机最多保持的连接数
+        """
+        self.proxy = proxy
+        self.name = proxy or DIRECT
+        self.limiter = limiter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=per_host_limit,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if proxy:
+            self.session.proxies = {'http': proxy, 'https': proxy}
+
+        self.health = 1.0
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.consecutive_failures = 0
+        self.evicted = False
+        self.evicted_reason = ""
+
+        # 统计信息
+        self.requests = 0
+        self.successes = 0
+        self.throttles = 0
+        self.failures = 0
+
+    def ready_in(self, now: float) -> float:
+        """距离该出口可以发送下一个请求的秒数（冷却剩余时间加限速等待）"""
+        return max(self.cooldown_until - now, 0.0) + self.limiter.available_in()
+
+    def stats(self) -> Dict:
+        """出口统计信息"""
+        return {
+            "egress": self.name,
+            "health": round(self.health, 3),
+            "rate": round(self.limiter.rate, 4),
+            "requests": self.requests,
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "failures": self.failures,
+            "cooling": max(round(self.cooldown_until - time.monotonic(), 1), 0.0),
+            "evicted": self.evicted_reason if self.evicted else ""
+        }
+
+
+class EgressPool:
+    """出口池：按健康分和空闲额度为每个请求选择出口"""
+
+    def __init__(self, proxies: Iterable[Optional[str]], initial_rate: float = 0.5,
+                 max_rate: float = 2.0, cooldown: float = DEFAULT_COOLDOWN,
+                 max_cooldown: float = MAX_COOLDOWN,
+                 max_failures: int = MAX_CONSECUTIVE_FAILURES,
+                 evict_health: float = EVICT_HEALTH, min_samples: int = MIN_SAMPLES,
+                 pool_size: int = 10, per_host_limit: int = 4):
+        """
+        初始化出口池
+
+        Args:
+            proxies: 代理地址列表，None 表示直连
+            initial_rate: 每个出口的初始速率（次/秒）
+            max_rate: 每个出口的最高速率
+            cooldown: 触发限流后的冷却时间（秒），连续限流时翻倍
+            max_cooldown: 冷却时间上限（秒）
+            max_failures: 连续连接失败多少次后剔除出口
+            evict_health: 健康分低于该值时剔除出口
+            min_samples: 按健康分剔除前至少需要的请求数
+            pool_size: 每个出口缓存的主机连接池数量
+            per_host_limit: 每个出口每个主机最多保持的连接数
+        """
+        self.egresses = [
+            Egress(proxy, AdaptiveRateLimiter(initial_rate=initial_rate, max_rate=max_rate),
+                   pool_size, per_host_limit)
+            for proxy in dict.fromkeys(proxies)
+        ]
+        if not self.egresses:
+            raise ValueError("出口池至少需要一个出口")
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_failures = max_failures
+        self.evict_health = evict_health
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        # 限速器为当前请求选定的出口，放在可变的单元素列表中：asyncio.to_thread 在上下文的副本中
+        # 执行请求，副本与原上下文共用同一个列表，取出后清空对发起请求的任务同样可见
+        self._current: ContextVar[Optional[List[Optional[Egress]]]] = ContextVar('egress', default=None)
+        self.limiter = EgressRateLimiter(self)
+
+    def healthy(self) -> List[Egress]:
+        """未被剔除的出口"""
+        return [egress for egress in self.egresses if not egress.evicted]
+
+    def _select(self, now: float) -> Egress:
+        """选择出口（需持有锁）：有空闲额度的出口中健康分最高的，都没有时选最早可用的"""
+        candidates = self.healthy()
+        if not candidates:
+            raise NoHealthyEgressError("所有出口都已被剔除：" + "；".join(
+                f"{egress.name}（{egress.evicted_reason}）" for egress in self.egresses))
+        waits = {egress: egress.ready_in(now) for egress in candidates}
+        ready = [egress for egress in candidates if waits[egress] <= 0]
+        if ready:
+            return max(ready, key=lambda egress: egress.health)
+        return min(candidates, key=lambda egress: (waits[egress], -egress.health))
+
+    def reserve(self) -> float:
+        """
+        为下一个请求选定出口并预定该出口的令牌
+
+        Returns:
+            需要等待的秒数（含冷却剩余时间）
+        """
+        with self._lock:
+            now = time.monotonic()
+            egress = self._select(now)
+            wait = max(egress.cooldown_until - now, 0.0) + egress.limiter.reserve()
+            egress.requests += 1
+        self._current.set([egress])
+        return wait
+
+    def take(self) -> Egress:
+        """取出限速器为当前请求选定的出口；未经限速器的请求直接选一个出口"""
+        reserved = self._current.get()
+        egress = reserved[0] if reserved else None
+        if reserved:
+            reserved[0] = None  # 每次预定只用于一个请求
+        if egress is not None and not egress.evicted:
+            return egress
+        with self._lock:
+            egress = self._select(time.monotonic())
+            egress.requests += 1
+        return egress
+
+    def fallback(self, rejected: Egress, accept: Callable[[Egress], bool]) -> Optional[Egress]:
+        """
+        选定的出口不能使用时（如该接口在此出口上熔断），按可用时间和健康分改选其他出口
+
+        Args:
+            rejected: 不能使用的出口，请求不计入该出口
+            accept: 判断出口能否使用的函数，按顺序调用，第一个返回True的出口被选中
+
+        Returns:
+            选中的出口（已等待该出口的令牌），都不能使用时返回None
+        """
+        with self._lock:
+            rejected.requests -= 1
+        now = time.monotonic()
+        candidates = sorted((egress for egress in self.healthy() if egress is not rejected),
+                            key=lambda egress: (egress.ready_in(now), -egress.health))
+        for egress in candidates:
+            if accept(egress):
+                # 改选的出口同样遵守它自己的限速和冷却，等到该出口的令牌再发送
+                with self._lock:
+                    now = time.monotonic()
+                    wait = max(egress.cooldown_until - now, 0.0) + egress.limiter.reserve()
+                    egress.requests += 1
+                if wait > 0:
+                    time.sleep(wait)
+                return egress
+        return None
+
+    def record_success(self, egress: Egress):
+        """请求成功：提高健康分和该出口的速率"""
+        with self._lock:
+            egress.successes += 1
+            egress.consecutive_throttles = 0
+            egress.consecutive_failures = 0
+            egress.health += HEALTH_SMOOTHING * (1 - egress.health)
+        egress.limiter.on_success()
+
+    def record_throttle(self, egress: Egress):
+        """触发频率限制：降低健康分和速率，出口进入冷却"""
+        with self._lock:
+            egress.throttles += 1
+            egress.consecutive_throttles += 1
+            egress.health -= HEALTH_SMOOTHING * egress.health
+            cooldown = min(self.cooldown * 2 ** (egress.consecutive_throttles - 1), self.max_cooldown)
+            egress.cooldown_until = max(egress.cooldown_until, time.monotonic() + cooldown)
+            evicted = self._maybe_evict(egress)
+        egress.limiter.on_throttle()
+        log.warning('egress_cooldown', "🧊 出口 {egress} 触发限流，冷却 {cooldown:.0f} 秒（健康分 {health:.2f}）",
+                    egress=egress.name, cooldown=cooldown, health=egress.health, outcome='throttle')
+        if evicted:
+            self._log_eviction(egress)
+
+    def record_failure(self, egress: Egress):
+        """连接失败、超时或代理错误：降低健康分，连续失败过多时剔除"""
+        with self._lock:
+            egress.failures += 1
+            egress.consecutive_failures += 1
+            egress.health -= HEALTH_SMOOTHING * egress.health
+            evicted = self._maybe_evict(egress)
+        if evicted:
+            self._log_eviction(egress)
+
+    def _maybe_evict(self, egress: Egress) -> bool:
+        """按连续失败次数和健康分判断是否剔除（需持有锁），返回是否刚被剔除"""
+        if egress.evicted:
+            return False
+        if egress.consecutive_failures >= self.max_failures:
+            egress.evicted_reason = f"连续 {egress.consecutive_failures} 次连接失败"
+        elif egress.requests >= self.min_samples and egress.health < self.evict_health:
+            egress.evicted_reason = f"健康分 {egress.health:.2f} 过低"
+        else:
+            return False
+        egress.evicted = True
+        return True
+
+    def _log_eviction(self, egress: Egress):
+        log.warning('egress_evicted', "🚫 出口 {egress} 已剔除：{reason}（剩余 {remaining} 个出口）",
+                    egress=egress.name, reason=egress.evicted_reason,
+                    remaining=len(self.healthy()), outcome='evicted')
+
+    def stats(self) -> List[Dict]:
+        """每个出口的统计信息"""
+        return [egress.stats() for egress in self.egresses]
+
+    def describe(self) -> str:
+        """出口统计的文字说明"""
+        lines = ["🌐 出口统计："]
+        for row in self.stats():
+            status = f"已剔除：{row['evicted']}" if row['evicted'] else f"健康分 {row['health']:.2f}"
+            lines.append(f"   {row['egress']}：{row['requests']} 次请求，成功 {row['successes']}，"
+                         f"限流 {row['throttles']}，失败 {row['failures']}，{status}")
+        return "\n".join(lines)
+
+    def close(self):
+        """关闭所有出口的连接"""
+        for egress in self.egresses:
+            egress.session.close()
+
+
+class EgressRateLimiter:
+    """
+    出口池的限速器接口，与 AdaptiveRateLimiter 用法相同，爬虫可以直接替换
+
+    acquire() 选定出口并等待该出口的令牌，随后的请求由传输层发往该出口；
+    每个出口的速率和健康分由传输层按请求结果更新，on_success / on_throttle 只做统计。
+    """
+
+    def __init__(self, pool: EgressPool):
+        self.pool = pool
+        self.successes = 0
+        self.throttles = 0
+        self.total_wait = 0.0
+
+    @property
+    def rate(self) -> float:
+        """所有未剔除出口的速率之和（次/秒）"""
+        return sum(egress.limiter.rate for egress in self.pool.healthy())
+
+    @property
+    def max_rate(self) -> float:
+        """单个出口的最高速率（次/秒）"""
+        return max(egress.limiter.max_rate for egress in self.pool.egresses)
+
+    def reserve(self) -> float:
+        """选定出口并预定令牌，返回需要等待的秒数"""
+        wait = self.pool.reserve()
+        self.total_wait += wait
+        return wait
+
+    def acquire(self) -> float:
+        """阻塞等待直到选定的出口可以发送请求，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """异步等待直到选定的出口可以发送请求，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_success(self):
+        self.successes += 1
+
+    def on_throttle(self):
+        self.throttles += 1
+
+    def set_max_rate(self, max_rate: float):
+        """调整每个出口的最高速率"""
+        for egress in self.pool.egresses:
+            egress.limiter.set_max_rate(max_rate)
+
+    def stats(self) -> Dict[str, float]:
+        """限速器统计信息"""
+        return {
+            "rate": round(self.rate, 4),
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "total_wait": round(self.total_wait, 2),
+            "egresses": len(self.pool.healthy())
+        }
+
+
+def pool_components(pool: EgressPool) -> Dict:
+    """
+    使用出口池的传输层和限速器，作为爬虫的构造参数
+
+    Args:
+        pool: 出口池
+
+    Returns:
+        {"transport": 传输层, "rate_limiter": 出口池限速器}
+    """
+    from bilibili_cache import get_shared_response_cache
+    from bilibili_transport import BilibiliTransport
+    transport = BilibiliTransport(cache=get_shared_response_cache(), egress_pool=pool)
+    return {"transport": transport, "rate_limiter": pool.limiter}
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 视频详情补全
+arc/search 只返回基本信息；本模块按bvid请求 /x/web-interface/view，补全完整统计
+（投币、收藏、分享、点赞）、分P列表、UP主信息，以及标签（/x/tag/archive/tags）
+
+- bvid 来源：已完成的 _final.json、爬取中的日志（.jsonl）、SQLite数据库，或包含它们的输出目录
+- 请求经过共享的传输层、限速器和熔断器，与爬虫共用限额；多个请求同时在途（有上限），
+  限速器决定实际速率，并发只用来重叠网络延迟
+- 每补全一个视频立即追加一行到详情文件（JSONL，可用 .gz / .zst 压缩），中断后不丢失已完成的部分
+- 已补全的bvid（包括已删除、不可见的视频）再次运行时跳过；限流、网络错误等失败的bvid下次重试
+- --follow：处理完后定期重新扫描来源，边爬取边补全
+
+使用方法：
+python bilibili_enrich.py output/                          # 补全输出目录中所有视频
+python bilibili_enrich.py output/videos.db --concurrency 8 -o output/details.jsonl.gz
+python bilibili_enrich.py output/ --follow 60 --no-tags    # 每60秒扫描一次新视频，不请求标签
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import requests
+
+from bilibili_breaker import CircuitOpenError
+from bilibili_compression import (
+    COMPRESSION_SUFFIX_PATTERN, compress_frame, compression_of, open_text, require_compression,
+    strip_compression_suffix, truncate_incomplete_frame
+)
+from bilibili_log import LEVELS, configure_logging, get_logger
+from bilibili_metrics import SLEEP_RETRY, print_metrics_summary
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, get_shared_rate_limiter, is_throttle_response
+)
+from bilibili_storage import FINAL_SUFFIX, JOURNAL_SUFFIX, iter_final_videos, iter_journal_records
+from bilibili_transport import BilibiliTransport, api_url, get_shared_transport
+
+log = get_logger('enrich')
+
+# 视频详情和标签接口
+VIEW_PATH = "/x/web-interface/view"
+TAGS_PATH = "/x/tag/archive/tags"
+
+# 默认详情文件，放在输出目录下
+DEFAULT_DETAILS_PATH = "./output/video_details.jsonl"
+
+# 默认同时在途的视频数
+DEFAULT_CONCURRENCY = 4
+
+# 表示视频已删除或不可见的业务码，记录后不再请求
+GONE_CODES = (-404, 62002, 62004, 62012)
+
+# 爬虫输出目录中的结果文件和日志
+_FINAL_PATTERN = re.compile(r"^videos_\d+_\d{8}_\d{6}" + re.escape(FINAL_SUFFIX) + COMPRESSION_SUFFIX_PATTERN + "$")
+_JOURNAL_PATTERN = re.compile(r"^videos_\d+_\d{8}_\d{6}" + re.escape(JOURNAL_SUFFIX) + COMPRESSION_SUFFIX_PATTERN + "$")
+
+
+def _now() -> str:
+    """当前时间字符串（与爬取结果的时间格式一致）"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def find_sources(directory: str) -> List[str]:
+    """
+    查找输出目录中的 _final.json 和爬取中的日志（包括压缩的 .gz / .zst）
+
+    Args:
+        directory: 输出目录
+
+    Returns:
+        文件路径列表，日志在前（新投稿先补全）
+    """
+    journals, finals = [], []
+    for path in sorted(glob.glob(os.path.join(directory, "videos_*"))):
+        name = os.path.basename(path)
+        if _JOURNAL_PATTERN.match(name):
+            journals.append(path)
+        elif _FINAL_PATTERN.match(name):
+            finals.append(path)
+    return journals + finals
+
+
+def iter_file_bvids(filepath: str) -> Iterator[str]:
+    """
+    读取一个来源文件中的bvid
+
+    Args:
+        filepath: _final.json、爬取日志（.jsonl）或SQLite数据库（.db）
+
+    Yields:
+        bvid（可能重复）
+    """
+    if filepath.endswith('.db'):
+        conn = sqlite3.connect(filepath)
+        try:
+            for (bvid,) in conn.execute("SELECT bvid FROM videos ORDER BY mid, created DESC"):
+                yield bvid
+        finally:
+            conn.close()
+    elif strip_compression_suffix(filepath).endswith(JOURNAL_SUFFIX):
+        for record in iter_journal_records(filepath):
+            if record.get('type') == 'page':
+                for video in record.get('videos', []):
+                    if video.get('bvid'):
+                        yield video['bvid']
+    else:
+        for video in iter_final_videos(filepath):
+            if video.get('bvid'):
+                yield video['bvid']
+
+
+def iter_source_bvids(sources: Iterable[str]) -> Iterator[str]:
+    """
+    按顺序读取多个来源中的bvid，去重后产出
+
+    读取失败的来源（如正在写入的日志被重命名）跳过并提示。
+
+    Args:
+        sources: 文件或目录路径
+
+    Yields:
+        bvid
+    """
+    seen: Set[str] = set()
+    for source in sources:
+        paths = find_sources(source) if os.path.isdir(source) else [source]
+        for path in paths:
+            try:
+                for bvid in iter_file_bvids(path):
+                    if bvid not in seen:
+                        seen.add(bvid)
+                        yield bvid
+            except (OSError, ValueError, sqlite3.Error) as e:
+                log.warning('source_error', "⚠️  读取 {path} 失败：{error}", path=path, error=e)
+
+
+def load_enriched_bvids(filepath: str) -> Set[str]:
+    """
+    读取详情文件中已补全的bvid
+
+    接口返回其他错误的记录不算已补全，下次运行重新请求；末尾不完整的行（帧）被忽略。
+
+    Args:
+        filepath: 详情文件路径
+
+    Returns:
+        已补全（或确认已删除）的bvid
+    """
+    done: Set[str] = set()
+    if not os.path.exists(filepath):
+        return done
+    with open_text(filepath, whole_frames=True) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('error') is None or record.get('error') in GONE_CODES:
+                done.add(record.get('bvid'))
+    return done
+
+
+def parse_details(data: Dict, tags: Optional[List[str]]) -> Dict:
+    """
+    从视频详情接口的 data 中提取要保存的字段
+
+    Args:
+        data: /x/web-interface/view 返回的 data
+        tags: 标签名称列表，未请求标签时为None
+
+    Returns:
+        详情记录
+    """
+    owner = data.get('owner') or {}
+    stat = data.get('stat') or {}
+    return {
+        "bvid": data.get('bvid'),
+        "aid": data.get('aid'),
+        "title": data.get('title'),
+        "tname": data.get('tname'),
+        "pubdate": data.get('pubdate'),
+        "duration": data.get('duration'),
+        "owner": {"mid": owner.get('mid'), "name": owner.get('name'), "face": owner.get('face')},
+        "stat": {name: stat.get(name) for name in
+                 ('view', 'danmaku', 'reply', 'favorite', 'coin', 'share', 'like')},
+        "pages": [
+            {"cid": page.get('cid'), "page": page.get('page'), "part": page.get('part'),
+             "duration": page.get('duration')}
+            for page in data.get('pages') or []
+        ],
+        "tags": tags,
+        "fetched_at": _now()
+    }
+
+
+class DetailEnricher:
+    """按bvid补全视频详情，结果逐条追加到详情文件"""
+
+    def __init__(self, output_path: str = DEFAULT_DETAILS_PATH,
+                 concurrency: int = DEFAULT_CONCURRENCY, with_tags: bool = True,
+                 transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        初始化
+
+        Args:
+            output_path: 详情文件路径，以 .gz / .zst 结尾时压缩保存
+            concurrency: 同时在途的视频数
+            with_tags: 是否请求标签（每个视频多一次请求）
+            transport: HTTP传输层，默认使用进程内共享的连接池
+            rate_limiter: 限速器，默认使用进程内共享的自适应限速器
+        """
+        self.output_path = output_path
+        self.concurrency = max(concurrency, 1)
+        self.with_tags = with_tags
+        self.transport = transport or get_shared_transport()
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
+        self.max_retries = 5  # 每个请求的最大尝试次数
+        self.retry_delay = 5  # 网络错误时的重试延迟（秒）
+
+        self.compression = compression_of(output_path)
+        require_compression(self.compression)
+        # 已补全的bvid，首次运行时从详情文件读取
+        self.done: Optional[Set[str]] = None
+
+    def _request(self, path: str, bvid: str) -> Optional[Dict]:
+        """
+        请求一个接口，限流和网络错误时重试
+
+        Returns:
+            接口返回的JSON（包括“视频不存在”等业务错误），重试后仍失败返回None
+        """
+        url = api_url(path)
+        params = {'bvid': bvid}
+
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            return cached
+
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.metrics.record_retry()
+            self.metrics.record_sleep(self.rate_limiter.acquire())
+            try:
+                data = self.transport.get_json(url, params=params, timeout=20)
+            except CircuitOpenError as e:
+                # 详情接口熔断中，没有其他请求可做，等到可以试探时再继续
+                wait_seconds = max(e.retry_in, 1.0)
+                log.warning('circuit_wait', "🚧 详情接口熔断中，等待 {delay:.0f} 秒", bvid=bvid,
+                            delay=wait_seconds, key=e.key, outcome='circuit_open')
+                time.sleep(wait_seconds)
+                self.metrics.record_sleep(wait_seconds, SLEEP_RETRY)
+                continue
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in THROTTLE_HTTP_STATUS:
+                    self.rate_limiter.on_throttle()
+                    log.warning('throttle', "⚠️  {bvid} HTTP {status} 限流，降速至 {rate:.2f} 次/秒",
+                                bvid=bvid, attempt=attempt + 1, status=status,
+                                rate=self.rate_limiter.rate, outcome='throttle')
+                    continue
+                log.warning('http_error', "❌ {bvid} HTTP错误（尝试 {attempt}/{max_retries}）：{error}",
+                            bvid=bvid, attempt=attempt + 1, max_retries=self.max_retries,
+                            status=status, error=e, outcome='http_error')
+            except (requests.exceptions.RequestException, ValueError) as e:
+                log.warning('request_error', "🔌 {bvid} 请求失败（尝试 {attempt}/{max_retries}）：{error}",
+                            bvid=bvid, attempt=attempt + 1, max_retries=self.max_retries,
+                            error=e, outcome='error')
+            else:
+                if is_throttle_response(data):
+                    self.rate_limiter.on_throttle()
+                    log.warning('throttle', "⚠️  {bvid} 触发频率限制，降速至 {rate:.2f} 次/秒",
+                                bvid=bvid, attempt=attempt + 1, rate=self.rate_limiter.rate,
+                                outcome='throttle')
+                    continue
+                if data.get('code') == 0:
+                    self.rate_limiter.on_success()
+                return data
+
+            # 网络错误不是限流信号，不降低速率，只稍等后重试
+            if attempt < self.max_retries - 1:
+                time.sleep(self.retry_delay)
+                self.metrics.record_sleep(self.retry_delay, SLEEP_RETRY)
+
+        log.error('retries_exhausted', "💥 {bvid} 详情获取失败，下次运行时重试",
+                  bvid=bvid, outcome='gave_up')
+        return None
+
+    def fetch(self, bvid: str) -> Optional[Dict]:
+        """
+        获取一个视频的详情（和标签）
+
+        Returns:
+            详情记录；视频不存在等业务错误返回带 error 字段的记录；请求失败返回None
+        """
+        view = self._request(VIEW_PATH, bvid)
+        if view is None:
+            return None
+        if view.get('code') != 0:
+            return {"bvid": bvid, "error": view.get('code'), "message": view.get('message'),
+                    "fetched_at": _now()}
+
+        tags = None
+        if self.with_tags:
+            tag_data = self._request(TAGS_PATH, bvid)
+            if tag_data is None:
+                return None
+            tags = [tag.get('tag_name') for tag in tag_data.get('data') or []] \
+                if tag_data.get('code') == 0 else []
+        return parse_details(view.get('data') or {}, tags)
+
+    def _open_output(self):
+        """以追加方式打开详情文件，先处理上次中断留下的不完整记录"""
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            if self.compression:
+                truncate_incomplete_frame(self.output_path, self.compression)
+            else:
+                with open(self.output_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    partial = f.read(1) != b"\n"
+                if partial:
+                    with open(self.output_path, 'ab') as f:
+                        f.write(b"\n")
+        return open(self.output_path, 'ab')
+
+    def _write(self, f, record: Dict):
+        """追加一条记录（压缩时每条记录一个独立的帧）"""
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+        f.write(compress_frame(line, self.compression))
+        f.flush()
+
+    def run(self, bvids: Iterable[str]) -> Dict[str, int]:
+        """
+        补全一批视频，已补全的跳过
+
+        同时在途的视频不超过 concurrency 个，bvid 按需从 bvids 中读取，来源很大时也不会全部载入内存。
+
+        Args:
+            bvids: bvid 序列（可以是生成器）
+
+        Returns:
+            统计：enriched（补全）、gone（已删除/不可见）、errors（其他业务错误）、
+            failed（请求失败）、skipped（已补全而跳过）
+        """
+        if self.done is None:
+            self.done = load_enriched_bvids(self.output_path)
+        stats = {"enriched": 0, "gone": 0, "errors": 0, "failed": 0, "skipped": 0}
+        start = time.time()
+        pending = iter(bvids)
+        in_flight: Dict[Future, str] = {}
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        f = self._open_output()
+
+        def submit_next() -> bool:
+            for bvid in pending:
+                if bvid in self.done:
+                    stats["skipped"] += 1
+                    continue
+                # 同一个bvid在途时不重复提交
+                self.done.add(bvid)
+                in_flight[executor.submit(self.fetch, bvid)] = bvid
+                return True
+            return False
+
+        try:
+            while len(in_flight) < self.concurrency and submit_next():
+                pass
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    bvid = in_flight.pop(future)
+                    record = future.result()
+                    if record is None:
+                        stats["failed"] += 1
+                        self.done.discard(bvid)
+                    else:
+                        self._write(f, record)
+                        error = record.get('error')
+                        if error is None:
+                            stats["enriched"] += 1
+                        elif error in GONE_CODES:
+                            stats["gone"] += 1
+                        else:
+                            stats["errors"] += 1
+                            self.done.discard(bvid)
+                    submit_next()
+
+                written = stats["enriched"] + stats["gone"] + stats["errors"]
+                if written and written % 100 == 0 and finished:
+                    log.info('enrich_progress', "📦 已补全 {written} 个视频（{rate:.2f} 个/秒）",
+                             written=written, rate=written / max(time.time() - start, 1e-6))
+        finally:
+            # 中断时取消尚未开始的请求，已写入的记录保留
+            executor.shutdown(wait=False, cancel_futures=True)
+            f.close()
+
+        stats["elapsed"] = round(time.time() - start, 1)
+        return stats
+
+
+def print_enrich_summary(stats: Dict[str, int], output_path: str):
+    """输出补全汇总"""
+    print(f"\n📊 详情补全：新增 {stats['enriched']} 个，已删除/不可见 {stats['gone']} 个，"
+          f"其他错误 {stats['errors']} 个，失败 {stats['failed']} 个，跳过已补全 {stats['skipped']} 个，"
+          f"耗时 {stats['elapsed']} 秒")
+    print(f"💾 详情文件：{output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按bvid补全视频详情（统计、分P、UP主、标签）")
+    parser.add_argument('sources', nargs='+',
+                        help="bvid来源：输出目录、_final.json、爬取日志（.jsonl）或SQLite数据库（.db）")
+    parser.add_argument('-o', '--output', default=DEFAULT_DETAILS_PATH,
+                        help=f"详情文件，以 .gz / .zst 结尾时压缩保存（默认 {DEFAULT_DETAILS_PATH}）")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"同时在途的视频数（默认 {DEFAULT_CONCURRENCY}），实际速率由限速器决定")
+    parser.add_argument('--no-tags', action='store_true', help="不请求标签（每个视频少一次请求）")
+    parser.add_argument('--follow', type=float, nargs='?', const=60, metavar='SECONDS',
+                        help="处理完后每隔一段时间重新扫描来源（默认60秒），按 Ctrl+C 停止")
+    parser.add_argument('--proxies', help="逗号分隔的代理地址，组成出口池（direct 表示直连）")
+    parser.add_argument('--no-cache', action='store_true', help="跳过响应缓存")
+    parser.add_argument('--log-level', choices=list(LEVELS), default='info', help="日志的最低级别（默认 info）")
+    parser.add_argument('--quiet', action='store_true', help="只显示警告和错误")
+    parser.add_argument('--log-json', metavar='FILE', help="所有日志按JSON行追加写入该文件")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.quiet, args.log_json)
+
+    if args.no_cache:
+        from bilibili_cache import get_shared_response_cache
+        get_shared_response_cache().bypass = True
+
+    components = {}
+    if args.proxies:
+        from bilibili_egress import EgressPool, parse_proxy_list, pool_components
+        components = pool_components(EgressPool(parse_proxy_list(args.proxies)))
+
+    try:
+        enricher = DetailEnricher(args.output, args.concurrency, not args.no_tags, **components)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+
+    print("🧩 B站视频详情补全")
+    print("=" * 40)
+    totals = {"enriched": 0, "gone": 0, "errors": 0, "failed": 0, "skipped": 0, "elapsed": 0.0}
+    try:
+        while True:
+            stats = enricher.run(iter_source_bvids(args.sources))
+            for key in totals:
+                totals[key] += stats[key]
+            if args.follow is None:
+                break
+            if stats["enriched"] or stats["gone"]:
+                log.info('enrich_round', "🔁 本轮补全 {enriched} 个，{delay:.0f} 秒后重新扫描",
+                         enriched=stats["enriched"] + stats["gone"], delay=args.follow)
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        print("\n👋 已中断，再次运行继续补全剩余的视频")
+
+    totals["elapsed"] = round(totals["elapsed"], 1)
+    print_enrich_summary(totals, args.output)
+    print_metrics_summary(enricher.metrics)
+    if enricher.transport.egress_pool is not None:
+        print(enricher.transport.egress_pool.describe())
+    sys.exit(0 if totals["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - Parquet/Arrow 导出
+把爬取结果转换为带类型的列式文件，供 pandas / DuckDB / Spark 等分析工具直接读取
+
+- 播放量、弹幕数、评论数为整数列，created 为时间戳列，duration 换算为秒
+- Parquet：标题、封面、简介使用字典编码，zstd 压缩
+- Arrow IPC：字符串列不使用字典编码（IPC文件不支持逐批替换字典），缓冲区使用 zstd 压缩
+- 流式转换：_final.json 逐个视频解析、SQLite数据库逐行读取，
+  每攒够 row_group_size 行写出一个行组，内存占用与文件大小无关
+- url 不单独存储，可由 bvid 拼接：https://www.bilibili.com/video/{bvid}
+
+依赖 pyarrow（可选依赖）：pip install pyarrow
+
+使用方法：
+python bilibili_export.py output/                        # 每个UID最新的 _final.json → output/videos.parquet
+python bilibili_export.py output/videos_1001_*_final.json -o 1001.parquet
+python bilibili_export.py --db output/videos.db -o videos.parquet
+python bilibili_export.py output/ --format arrow -o videos.arrow
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from bilibili_compression import COMPRESSION_SUFFIX_PATTERN
+from bilibili_storage import FINAL_SUFFIX, iter_final_videos, read_final_user_info
+
+# 导出格式
+EXPORT_FORMATS = ('parquet', 'arrow')
+
+# 每个行组（Arrow 记录批次）的行数
+DEFAULT_ROW_GROUP_SIZE = 50000
+
+# 默认输出文件
+DEFAULT_OUTPUT = "./output/videos.parquet"
+
+# 列名，与 _final.json 中的字段对应（url 除外），mid 为UP主UID
+COLUMNS = ('mid', 'aid', 'bvid', 'title', 'duration', 'created',
+           'view', 'danmaku', 'reply', 'pic', 'description')
+
+
+def require_pyarrow():
+    """检查 pyarrow 是否可用"""
+    if pa is None:
+        raise ImportError("导出Parquet/Arrow需要 pyarrow 库，请运行：pip install pyarrow")
+
+
+def video_schema(dictionary_strings: bool = True):
+    """
+    导出文件的列类型
+
+    Args:
+        dictionary_strings: 标题、封面、简介是否使用字典编码
+            （Arrow IPC 文件要求每列在所有批次中使用同一个字典，逐批写入时不使用）
+    """
+    require_pyarrow()
+    dict_string = pa.dictionary(pa.int32(), pa.string()) if dictionary_strings else pa.string()
+    return pa.schema([
+        ('mid', pa.int64()),
+        ('aid', pa.int64()),
+        ('bvid', pa.string()),
+        ('title', dict_string),
+        ('duration', pa.int32()),
+        ('created', pa.timestamp('s', tz='Asia/Shanghai')),
+        ('view', pa.int64()),
+        ('danmaku', pa.int64()),
+        ('reply', pa.int64()),
+        ('pic', dict_string),
+        ('description', dict_string),
+    ])
+
+
+def parse_duration(value) -> Optional[int]:
+    """
+    将时长转换为秒数
+
+    Args:
+        value: "MM:SS"、"H:MM:SS" 或秒数
+
+    Returns:
+        秒数，无法解析时返回None
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    seconds = 0
+    try:
+        for part in str(value).split(':'):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+def to_int(value) -> Optional[int]:
+    """转换为整数，"--" 等无法解析的值（如播放量被隐藏）返回None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def video_row(mid: Optional[int], video: Dict) -> Tuple:
+    """将 _final.json 格式的视频转换为一行（按 COLUMNS 顺序）"""
+    return (
+        to_int(mid),
+        to_int(video.get('aid')),
+        video.get('bvid'),
+        video.get('title'),
+        parse_duration(video.get('duration')),
+        to_int(video.get('created')),
+        to_int(video.get('view')),
+        to_int(video.get('danmaku')),
+        to_int(video.get('reply')),
+        video.get('pic'),
+        video.get('description'),
+    )
+
+
+def iter_file_rows(filepaths: Iterable[str]) -> Iterator[Tuple]:
+    """
+    流式读取多个 _final.json 文件的视频
+
+    Args:
+        filepaths: 文件路径
+
+    Yields:
+        按 COLUMNS 顺序的行
+    """
+    for filepath in filepaths:
+        mid = read_final_user_info(filepath).get('uid')
+        for video in iter_final_videos(filepath):
+            yield video_row(mid, video)
+
+
+def iter_database_rows(db_path: str) -> Iterator[Tuple]:
+    """
+    逐行读取SQLite数据库中的视频（按UP主和发布时间排序）
+
+    Args:
+        db_path: bilibili_database.py 创建的数据库文件
+
+    Yields:
+        按 COLUMNS 顺序的行
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT mid, aid, bvid, title, duration, created, view, danmaku, reply, pic, description "
+            "FROM videos ORDER BY mid, created DESC"
+        )
+        for row in rows:
+            yield video_row(row[0], dict(zip(COLUMNS[1:], row[1:])))
+    finally:
+        conn.close()
+
+
+def find_final_files(directory: str, latest_only: bool = True) -> List[str]:
+    """
+    查找目录中已完成的 _final.json 文件（包括压缩的 .gz / .zst）
+
+    Args:
+        directory: 输出目录
+        latest_only: 为True时每个UID只取最近一次的结果，避免重复
+
+    Returns:
+        文件路径列表
+    """
+    pattern = re.compile(rf"^videos_(\d+)_\d{{8}}_\d{{6}}{FINAL_SUFFIX}{COMPRESSION_SUFFIX_PATTERN}$")
+    latest: Dict[str, str] = {}
+    files = []
+    for path in sorted(glob.glob(os.path.join(directory, f"videos_*{FINAL_SUFFIX}*"))):
+        match = pattern.match(os.path.basename(path))
+        if not match:
+            continue
+        files.append(path)
+        # 文件名中的时间戳按字典序即按时间排序
+        latest[match.group(1)] = path
+    return sorted(latest.values()) if latest_only else files
+
+
+class ColumnarWriter:
+    """按行组写出 Parquet 或 Arrow IPC 文件"""
+
+    def __init__(self, filepath: str, file_format: str = 'parquet',
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        """
+        创建写入器
+
+        Args:
+            filepath: 输出文件路径
+            file_format: parquet 或 arrow
+            row_group_size: 每个行组的行数
+        """
+        require_pyarrow()
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的格式：{file_format}")
+        self.filepath = filepath
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.schema = video_schema(dictionary_strings=file_format == 'parquet')
+        self.rows = 0
+
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 先写临时文件，完成后再替换，中途失败不会留下不完整的文件
+        self._temp_path = filepath + '.tmp'
+        self._columns: List[List] = [[] for _ in COLUMNS]
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(self._temp_path, self.schema,
+                                            compression='zstd', use_dictionary=True)
+        else:
+            self._sink = pa.OSFile(self._temp_path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema,
+                                           options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    def write_rows(self, rows: Iterable[Tuple]):
+        """写入多行，攒够一个行组时写出"""
+        for row in rows:
+            for column, value in zip(self._columns, row):
+                column.append(value)
+            if len(self._columns[0]) >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        """把缓冲的行写成一个行组"""
+        if not self._columns[0]:
+            return
+        arrays = [pa.array(values, type=field.type)
+                  for values, field in zip(self._columns, self.schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.file_format == 'parquet':
+            self._writer.write_batch(batch, row_group_size=self.row_group_size)
+        else:
+            self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+        self._columns = [[] for _ in COLUMNS]
+
+    def close(self) -> int:
+        """写出剩余的行并完成文件，返回总行数"""
+        self._flush()
+        self._writer.close()
+        if self.file_format == 'arrow':
+            self._sink.close()
+        os.replace(self._temp_path, self.filepath)
+        return self.rows
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        try:
+            self._writer.close()
+            if self.file_format == 'arrow':
+                self._sink.close()
+        except Exception:
+            pass
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def export_rows(rows: Iterable[Tuple], filepath: str, file_format: str = 'parquet',
+                row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    """
+    将行流式写入 Parquet / Arrow 文件
+
+    Args:
+        rows: 按 COLUMNS 顺序的行（可以是生成器）
+        filepath: 输出文件路径
+        file_format: parquet 或 arrow
+        row_group_size: 每个行组的行数
+
+    Returns:
+        写入的行数
+    """
+    writer = ColumnarWriter(filepath, file_format, row_group_size)
+    try:
+        writer.write_rows(rows)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def export_final_files(filepaths: Iterable[str], filepath: str, file_format: str = 'parquet',
+                       row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    """将 _final.json 文件转换为 Parquet / Arrow 文件，返回写入的行数"""
+    return export_rows(iter_file_rows(filepaths), filepath, file_format, row_group_size)
+
+
+def export_database(db_path: str, filepath: str, file_format: str = 'parquet',
+                    row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    """将SQLite数据库中的视频导出为 Parquet / Arrow 文件，返回写入的行数"""
+    return export_rows(iter_database_rows(db_path), filepath, file_format, row_group_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将爬取结果导出为 Parquet / Arrow 文件")
+    parser.add_argument('inputs', nargs='*', help="_final.json 文件或输出目录")
+    parser.add_argument('--db', help="从SQLite数据库导出（bilibili_database.py 创建的 videos.db）")
+    parser.add_argument('-o', '--output', help=f"输出文件（默认 {DEFAULT_OUTPUT}）")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='parquet', help="输出格式")
+    parser.add_argument('--all-runs', action='store_true',
+                        help="目录中同一UID的所有 _final.json 都导出（默认只取最近一次）")
+    parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help=f"每个行组的行数（默认{DEFAULT_ROW_GROUP_SIZE}）")
+    args = parser.parse_args()
+
+    if pa is None:
+        print("错误：未找到 pyarrow 库")
+        print("请运行：pip install pyarrow")
+        sys.exit(1)
+
+    output = args.output or (DEFAULT_OUTPUT if args.format == 'parquet'
+                             else os.path.splitext(DEFAULT_OUTPUT)[0] + '.arrow')
+    start = time.time()
+
+    if args.db:
+        print(f"🗄️  从数据库导出：{args.db}")
+        rows = export_database(args.db, output, args.format, args.row_group_size)
+    else:
+        filepaths = []
+        for path in args.inputs or ['./output']:
+            if os.path.isdir(path):
+                filepaths.extend(find_final_files(path, latest_only=not args.all_runs))
+            else:
+                filepaths.append(path)
+        if not filepaths:
+            print("❌ 没有找到 _final.json 文件")
+            sys.exit(1)
+        print(f"📂 转换 {len(filepaths)} 个文件")
+        rows = export_final_files(filepaths, output, args.format, args.row_group_size)
+
+    elapsed = time.time() - start
+    size = os.path.getsize(output)
+    print(f"✅ 已导出 {rows} 个视频到 {output}（{size / 1024 / 1024:.1f} MB，耗时 {elapsed:.1f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
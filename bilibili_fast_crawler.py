@@ -10,9 +10,9 @@ B站视频爬虫 - 超快速版本
 
 import json
 import os
+import requests
 import sys
 import time
-import requests
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -20,12 +20,22 @@ from typing import Dict, List, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+from bilibili_metrics import print_metrics_summary
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, get_shared_rate_limiter, is_throttle_response
+)
+from bilibili_transport import BilibiliTransport, api_url, get_shared_transport
+
 
 class BilibiliFastCrawler:
     """B站视频爬虫类（超快速版本）"""
 
-    def __init__(self):
-        """初始化爬虫配置"""
+    def __init__(self, transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """初始化爬虫配置（transport 和 rate_limiter 默认使用进程内共享的实例）"""
+        self.transport = transport or get_shared_transport()
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
         self.max_retries = 3  # 最少重试次数
         self.base_delay = 2  # 最短延迟
         self.videos_per_page = 50  # 每页更多视频
@@ -42,7 +52,7 @@ class BilibiliFastCrawler:
 
     def get_user_videos_simple(self, uid: int) -> Optional[List[Dict]]:
         """简化版获取用户视频"""
-        url = "https://api.bilibili.com/x/space/arc/search"
+        url = api_url("/x/space/arc/search")
         params = {
             'mid': uid,
             'ps': self.videos_per_page,
@@ -50,29 +60,41 @@ class BilibiliFastCrawler:
             'order': 'pubdate'
         }
 
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None and cached.get('code') == 0:
+            videos = cached.get('data', {}).get('list', {}).get('vlist', [])
+            print(f"✅ 从缓存获取 {len(videos)} 个视频")
+            return videos
+
         try:
             print(f"🚀 快速请求用户 {uid} 的视频...")
-            response = requests.get(
+            self.metrics.record_sleep(self.rate_limiter.acquire())
+            # get_json 按业务码把限流计入所用出口和熔断器，并写入缓存
+            data = self.transport.get_json(
                 url,
                 params=params,
                 headers=self.headers,
-                timeout=10,
-                verify=False
+                timeout=10
             )
 
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 0:
-                    videos = data.get('data', {}).get('list', {}).get('vlist', [])
-                    print(f"✅ 成功获取 {len(videos)} 个视频")
-                    return videos
-                else:
-                    print(f"❌ API错误：{data.get('message', '未知错误')}")
-                    return None
+            if data.get('code') == 0:
+                self.rate_limiter.on_success()
+                videos = data.get('data', {}).get('list', {}).get('vlist', [])
+                print(f"✅ 成功获取 {len(videos)} 个视频")
+                return videos
             else:
-                print(f"❌ HTTP错误：{response.status_code}")
+                if is_throttle_response(data):
+                    self.rate_limiter.on_throttle()
+                print(f"❌ API错误：{data.get('message', '未知错误')}")
                 return None
 
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status in THROTTLE_HTTP_STATUS:
+                self.rate_limiter.on_throttle()
+            print(f"❌ HTTP错误：{status}")
+            return None
         except Exception as e:
             print(f"❌ 请求失败：{e}")
             return None
@@ -130,8 +152,10 @@ class BilibiliFastCrawler:
 
         # 快速获取视频
         start_time = time.time()
+        metrics_baseline = self.metrics.snapshot()
         videos = self.get_user_videos_simple(uid)
         end_time = time.time()
+        print_metrics_summary(self.metrics, metrics_baseline)
 
         if not videos or len(videos) == 0:
             print("\n❌ 没有获取到任何视频")
@@ -149,7 +173,7 @@ class BilibiliFastCrawler:
         print(f"\n🔝 前5个视频预览：")
         for i, video in enumerate(videos[:5], 1):
             print(f"   {i}. {video['title']}")
-            print(f"      📺 {video['url']}")
+            print(f"      📺 https://www.bilibili.com/video/{video.get('bvid')}")
             print(f"      ⏱️  时长: {video.get('length', 'N/A')}")
             print(f"      👀 播放: {video.get('play', 'N/A'):,}")
             print()
@@ -168,20 +192,23 @@ class BilibiliFastCrawler:
         """测试网络连接"""
         print("🔍 测试网络连接...")
 
-        test_url = "https://api.bilibili.com/x/web-interface/nav"
+        test_url = api_url("/x/web-interface/nav")
         try:
-            response = requests.get(
+            # 未登录时返回 -101，同样说明网络正常；业务码表示的限流会计入出口和熔断器
+            data = self.transport.get_json(
                 test_url,
                 headers=self.headers,
-                timeout=5,
-                verify=False
+                timeout=5
             )
-            if response.status_code == 200:
-                print("✅ 网络连接正常")
-                return True
-            else:
-                print(f"❌ 网络异常，状态码：{response.status_code}")
+            if is_throttle_response(data):
+                print(f"❌ 请求被限流：{data.get('message', '未知错误')}")
                 return False
+            print("✅ 网络连接正常")
+            return True
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            print(f"❌ 网络异常，状态码：{status}")
+            return False
         except Exception as e:
             print(f"❌ 网络连接失败：{e}")
             return False
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 结构化日志
+爬取循环中的每条输出都是一条带字段（uid、page、attempt、delay、outcome 等）的日志记录，
+终端上看到的带 emoji 的文字只是其中一种输出方式
+
+- 基于标准库 logging，按级别过滤：debug / info / warning / error
+- 级别未开启时直接返回，不拼接消息、不创建日志记录
+- 消息模板用 str.format 的写法引用字段，只在真正输出时才格式化
+- 终端输出（ConsoleRenderer）：与以前的 print 完全相同，写到当前的 sys.stdout
+- JSON 行输出（JsonLinesSink）：每条记录一行JSON，包含时间、级别、事件名、字段和渲染后的消息
+- 安静模式：终端只显示警告和错误，JSON 行输出不受影响
+
+使用示例：
+    log = get_logger('simple')
+    log.info('page_request', "正在获取第 {page} 页...", uid=uid, page=page)
+
+    configure_logging(level='info', quiet=True, jsonl_path='output/crawl.jsonl')
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+# 所有爬虫日志的根名称
+ROOT_LOGGER = 'bilibili'
+
+# 命令行中的级别名称
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+
+
+def render_message(record: logging.LogRecord) -> str:
+    """用记录中的字段填充消息模板"""
+    fields = getattr(record, 'fields', None)
+    if not fields:
+        return str(record.msg)
+    try:
+        return str(record.msg).format(**fields)
+    except (KeyError, IndexError, ValueError):
+        return str(record.msg)
+
+
+class ConsoleRenderer(logging.Handler):
+    """终端输出：按消息模板渲染，写到当前的 sys.stdout（工作者进程重定向后写入日志文件）"""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            print(render_message(record), file=sys.stdout)
+        except Exception:
+            self.handleError(record)
+
+
+class JsonLinesSink(logging.Handler):
+    """JSON 行输出：每条记录一行JSON，追加写入文件"""
+
+    def __init__(self, filepath: str, level: int = logging.NOTSET):
+        """
+        Args:
+            filepath: 输出文件路径（追加写入）
+            level: 写入的最低级别
+        """
+        super().__init__(level)
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filepath = filepath
+        self._file = open(filepath, 'a', encoding='utf-8', buffering=1)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            entry = {
+                "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "event": getattr(record, 'event', None),
+                "pid": record.process,
+                **(getattr(record, 'fields', None) or {}),
+                "message": render_message(record)
+            }
+            line = json.dumps(entry, ensure_ascii=False, default=str)
+            with self.lock:
+                self._file.write(line + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        with self.lock:
+            if not self._file.closed:
+                self._file.close()
+        super().close()
+
+
+class CrawlLogger:
+    """带事件名和字段的日志接口，级别未开启时不做任何格式化"""
+
+    __slots__ = ('logger',)
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, event: str, message: str, **fields):
+        """
+        输出一条日志
+
+        Args:
+            level: 日志级别
+            event: 事件名（如 page_request、throttle），便于按类型过滤和统计
+            message: 消息模板，用 {字段名} 引用字段
+            **fields: 结构化字段
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, message, extra={'event': event, 'fields': fields})
+
+    def is_enabled(self, level: int) -> bool:
+        """级别是否开启，输出前需要额外计算时先判断"""
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, event: str, message: str, **fields):
+        self.log(logging.DEBUG, event, message, **fields)
+
+    def info(self, event: str, message: str, **fields):
+        self.log(logging.INFO, event, message, **fields)
+
+    def warning(self, event: str, message: str, **fields):
+        self.log(logging.WARNING, event, message, **fields)
+
+    def error(self, event: str, message: str, **fields):
+        self.log(logging.ERROR, event, message, **fields)
+
+
+_console: Optional[ConsoleRenderer] = None
+_sink: Optional[JsonLinesSink] = None
+_configure_lock = threading.Lock()
+
+
+def _root() -> logging.Logger:
+    """爬虫日志的根logger：默认只有终端输出，级别为 info，与以前的 print 输出相同"""
+    global _console
+    root = logging.getLogger(ROOT_LOGGER)
+    if _console is None:
+        with _configure_lock:
+            if _console is None:
+                _console = ConsoleRenderer(logging.INFO)
+                root.addHandler(_console)
+                root.setLevel(logging.INFO)
+                # 不传给标准库的根logger，避免重复输出
+                root.propagate = False
+    return root
+
+
+def get_logger(name: str) -> CrawlLogger:
+    """
+    获取爬虫日志
+
+    Args:
+        name: 模块名（如 simple、smart、async），日志名为 bilibili.<name>
+
+    Returns:
+        日志对象
+    """
+    _root()
+    return CrawlLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+
+def configure_logging(level: str = 'info', quiet: bool = False,
+                      jsonl_path: Optional[str] = None) -> Dict[str, str]:
+    """
+    配置日志输出
+
+    Args:
+        level: 最低级别（debug / info / warning / error）
+        quiet: 安静模式，终端只显示警告和错误
+        jsonl_path: JSON 行输出文件，为None时不输出（已有的输出会关闭）
+
+    Returns:
+        生效的配置
+    """
+    global _sink
+    if level not in LEVELS:
+        raise ValueError(f"不支持的日志级别：{level}（可选：{', '.join(LEVELS)}）")
+    threshold = LEVELS[level]
+    root = _root()
+    console_level = max(threshold, logging.WARNING) if quiet else threshold
+
+    with _configure_lock:
+        _console.setLevel(console_level)
+        if _sink is not None:
+            root.removeHandler(_sink)
+            _sink.close()
+            _sink = None
+        if jsonl_path:
+            _sink = JsonLinesSink(jsonl_path, threshold)
+            root.addHandler(_sink)
+        # logger 的级别取各输出中最低的，都不需要的级别在调用处直接跳过
+        root.setLevel(min(console_level, threshold) if _sink else console_level)
+
+    return {
+        "level": level,
+        "console": logging.getLevelName(console_level).lower(),
+        "jsonl": jsonl_path or ""
+    }
+
+
+def parse_logging_args(args) -> Optional[Dict]:
+    """
+    从命令行参数中取出日志选项（--quiet、--log-level 级别、--log-json 文件），并从列表中删除
+
+    Args:
+        args: 命令行参数列表（会被修改）
+
+    Returns:
+        configure_logging 的参数，参数有误时返回None
+    """
+    options = {"level": 'info', "quiet": False, "jsonl_path": None}
+    if '--quiet' in args:
+        args.remove('--quiet')
+        options["quiet"] = True
+    for flag, key in (('--log-level', 'level'), ('--log-json', 'jsonl_path')):
+        if flag in args:
+            index = args.index(flag)
+            if index + 1 >= len(args):
+                print(f"❌ 错误：{flag} 后需要指定{'级别' if key == 'level' else '文件路径'}")
+                return None
+            options[key] = args[index + 1]
+            del args[index:index + 2]
+    if options["level"] not in LEVELS:
+        print(f"❌ 错误：日志级别只能是 {', '.join(LEVELS)}")
+        return None
+    return options
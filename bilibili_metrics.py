@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 请求指标
+在传输层和爬取循环中记录每个请求的耗时和结果，用于定位时间花在哪里、按限流比例报警、估算需要的工作者数量
+
+记录的指标：
+- 请求耗时直方图（按接口）
+- HTTP状态码计数，超时和连接错误单独计数
+- 业务码计数（code != 0 时按错误信息分为 throttle / not_found / other）
+- 重试次数、接收字节数、等待时间（限速等待和重试等待分开统计）
+- 获取的页数和视频数（用于计算 页/秒、视频/秒）
+- 响应缓存命中数
+
+输出方式：
+- Prometheus 文本格式：python run.py UID --metrics-port 9108，然后访问 http://127.0.0.1:9108/metrics
+- JSON 汇总：各版本 run() 结束时输出本次运行的汇总（/metrics.json 返回进程启动以来的汇总）
+
+所有爬虫版本默认共用同一个指标实例。
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from bilibili_rate_limiter import is_throttle_response
+
+# 请求耗时直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+# 业务码错误分类
+CODE_OK = 'ok'
+CODE_THROTTLE = 'throttle'
+CODE_NOT_FOUND = 'not_found'
+CODE_OTHER = 'other'
+
+# 没有HTTP状态码的请求结果
+STATUS_TIMEOUT = 'timeout'
+STATUS_CONNECTION_ERROR = 'connection_error'
+STATUS_ERROR = 'error'
+
+# 等待原因
+SLEEP_RATE_LIMIT = 'rate_limit'
+SLEEP_RETRY = 'retry'
+
+# JSON汇总中输出的耗时分位数
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def code_category(data: Dict) -> str:
+    """
+    业务码的分类
+
+    Args:
+        data: API响应JSON
+
+    Returns:
+        ok / throttle / not_found / other
+    """
+    if data.get('code') == 0:
+        return CODE_OK
+    if is_throttle_response(data):
+        return CODE_THROTTLE
+    message = data.get('message') or ''
+    if '不存在' in message or '找不到' in message or data.get('code') == -404:
+        return CODE_NOT_FOUND
+    return CODE_OTHER
+
+
+def endpoint_of(url: str) -> str:
+    """请求地址对应的接口（URL路径），用作指标标签"""
+    return urlsplit(url).path or '/'
+
+
+class Histogram:
+    """固定分桶的直方图（Prometheus 格式，每个桶记录不超过上限的次数）"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """记录一个值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self) -> 'Histogram':
+        other = Histogram(self.buckets)
+        other.counts = list(self.counts)
+        other.sum = self.sum
+        other.count = self.count
+        return other
+
+    def subtract(self, baseline: Optional['Histogram']) -> 'Histogram':
+        """减去之前的快照，得到这段时间内的直方图"""
+        result = self.copy()
+        if baseline is not None:
+            result.counts = [a - b for a, b in zip(self.counts, baseline.counts)]
+            result.sum -= baseline.sum
+            result.count -= baseline.count
+        return result
+
+    def merge(self, other: 'Histogram'):
+        """合并另一个直方图（分桶相同）"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """
+        估算分位数：在所在的桶内线性插值
+
+        Args:
+            q: 分位（0~1）
+
+        Returns:
+            估算值，落在 +Inf 桶时返回最大的分桶上限
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class CrawlMetrics:
+    """线程安全的爬取指标"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.latency: Dict[str, Histogram] = {}          # 接口 -> 耗时直方图
+        self.responses: Dict[Tuple[str, str], int] = {}  # (接口, HTTP状态码/错误类型) -> 次数
+        self.codes: Dict[Tuple[str, int, str], int] = {}  # (接口, 业务码, 分类) -> 次数
+        self.sleep: Dict[str, float] = {}                # 等待原因 -> 秒数
+        self.retries = 0
+        self.bytes_received = 0
+        self.pages = 0
+        self.videos = 0
+        self.cache_hits = 0
+
+    def record_request(self, url: str, seconds: float, status, size: int = 0):
+        """
+        记录一次HTTP请求
+
+        Args:
+            url: 请求地址
+            seconds: 耗时（秒）
+            status: HTTP状态码，或 timeout / connection_error / error
+            size: 响应体字节数
+        """
+        endpoint = endpoint_of(url)
+        key = (endpoint, str(status))
+        with self._lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.bytes_received += size
+
+    def record_code(self, url: str, data: Dict):
+        """记录API响应的业务码"""
+        key = (endpoint_of(url), data.get('code'), code_category(data))
+        with self._lock:
+            self.codes[key] = self.codes.get(key, 0) + 1
+
+    def record_retry(self):
+        """记录一次重试"""
+        with self._lock:
+            self.retries += 1
+
+    def record_sleep(self, seconds: float, reason: str = SLEEP_RATE_LIMIT):
+        """记录一段等待时间"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.sleep[reason] = self.sleep.get(reason, 0.0) + seconds
+
+    def record_page(self, videos: int):
+        """记录获取到的一页视频"""
+        with self._lock:
+            self.pages += 1
+            self.videos += videos
+
+    def record_cache_hit(self):
+        """记录一次响应缓存命中"""
+        with self._lock:
+            self.cache_hits += 1
+
+    def snapshot(self) -> Dict:
+        """
+        当前指标的快照，用于之后计算某次运行的增量
+
+        Returns:
+            快照（只用于传给 summary）
+        """
+        with self._lock:
+            return {
+                "time": time.time(),
+                "latency": {endpoint: h.copy() for endpoint, h in self.latency.items()},
+                "responses": dict(self.responses),
+                "codes": dict(self.codes),
+                "sleep": dict(self.sleep),
+                "retries": self.retries,
+                "bytes_received": self.bytes_received,
+                "pages": self.pages,
+                "videos": self.videos,
+                "cache_hits": self.cache_hits
+            }
+
+    def summary(self, baseline: Optional[Dict] = None) -> Dict:
+        """
+        汇总指标
+
+        Args:
+            baseline: snapshot() 的结果，只汇总之后的部分；为None时汇总进程启动以来的全部
+
+        Returns:
+            可直接序列化为JSON的汇总
+        """
+        current = self.snapshot()
+        baseline = baseline or {"time": self.start_time}
+        elapsed = current["time"] - baseline["time"]
+
+        def diff(name):
+            before = baseline.get(name, {})
+            return {key: value - before.get(key, 0) for key, value in current[name].items()
+                    if value - before.get(key, 0)}
+
+        responses = diff("responses")
+        codes = diff("codes")
+        sleep = diff("sleep")
+        latency = Histogram()
+        for endpoint, histogram in current["latency"].items():
+            latency.merge(histogram.subtract(baseline.get("latency", {}).get(endpoint)))
+        pages = current["pages"] - baseline.get("pages", 0)
+        videos = current["videos"] - baseline.get("videos", 0)
+
+        status_counts: Dict[str, int] = {}
+        for (_, status), count in responses.items():
+            status_counts[status] = status_counts.get(status, 0) + count
+        code_counts: Dict[str, int] = {}
+        throttled = sum(count for (_, status), count in responses.items() if status in ('412', '429'))
+        for (_, code, category), count in codes.items():
+            label = f"{code} {category}"
+            code_counts[label] = code_counts.get(label, 0) + count
+            if category == CODE_THROTTLE:
+                throttled += count
+        requests = latency.count
+
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests": requests,
+            "http_status": status_counts,
+            "api_codes": code_counts,
+            "throttled": throttled,
+            "throttle_ratio": round(throttled / requests, 4) if requests else 0.0,
+            "retries": current["retries"] - baseline.get("retries", 0),
+            "bytes_received": current["bytes_received"] - baseline.get("bytes_received", 0),
+            "sleep_seconds": {reason: round(seconds, 3) for reason, seconds in sleep.items()},
+            "latency_ms": {
+                "mean": round(latency.sum / requests * 1000, 1) if requests else 0.0,
+                **{f"p{int(q * 100)}": round(latency.quantile(q) * 1000, 1) for q in SUMMARY_QUANTILES}
+            },
+            "pages": pages,
+            "videos": videos,
+            "pages_per_sec": round(pages / elapsed, 3) if elapsed > 0 else 0.0,
+            "videos_per_sec": round(videos / elapsed, 3) if elapsed > 0 else 0.0,
+            "cache_hits": current["cache_hits"] - baseline.get("cache_hits", 0)
+        }
+
+    def render_prometheus(self) -> str:
+        """按 Prometheus 文本格式输出全部指标"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        metric("bilibili_request_duration_seconds", "histogram", "HTTP请求耗时")
+        for endpoint, histogram in sorted(snapshot["latency"].items()):
+            cumulative = 0
+            for upper, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if upper == float('inf') else repr(upper)
+                lines.append(f'bilibili_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+            lines.append(f'bilibili_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+            lines.append(f'bilibili_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+        metric("bilibili_responses_total", "counter", "按HTTP状态码（或 timeout/connection_error/error）统计的请求数")
+        for (endpoint, status), count in sorted(snapshot["responses"].items()):
+            lines.append(f'bilibili_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+        metric("bilibili_api_codes_total", "counter", "按业务码和分类统计的响应数")
+        for (endpoint, code, category), count in sorted(snapshot["codes"].items(), key=str):
+            lines.append(f'bilibili_api_codes_total{{endpoint="{endpoint}",code="{code}",category="{category}"}} {count}')
+
+        metric("bilibili_sleep_seconds_total", "counter", "等待时间（rate_limit 限速等待，retry 重试等待）")
+        for reason, seconds in sorted(snapshot["sleep"].items()):
+            lines.append(f'bilibili_sleep_seconds_total{{reason="{reason}"}} {seconds:.3f}')
+
+        for name, key, help_text in (
+            ("bilibili_retries_total", "retries", "重试次数"),
+            ("bilibili_response_bytes_total", "bytes_received", "接收的响应体字节数"),
+            ("bilibili_pages_total", "pages", "获取的页数"),
+            ("bilibili_videos_total", "videos", "获取的新视频数"),
+            ("bilibili_cache_hits_total", "cache_hits", "响应缓存命中数"),
+        ):
+            metric(name, "counter", help_text)
+            lines.append(f"{name} {snapshot[key]}")
+
+        metric("bilibili_metrics_start_time_seconds", "gauge", "开始记录指标的时间（Unix时间戳）")
+        lines.append(f"bilibili_metrics_start_time_seconds {self.start_time:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """在后台线程中提供 /metrics（Prometheus 文本格式）和 /metrics.json（JSON汇总）"""
+
+    def __init__(self, metrics: Optional[CrawlMetrics] = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        初始化服务器
+
+        Args:
+            metrics: 要输出的指标，默认使用进程内共享的实例
+            host: 监听地址
+            port: 监听端口，0表示随机分配空闲端口
+        """
+        self.metrics = metrics or get_shared_metrics()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """指标地址"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def _make_handler(self):
+        """创建绑定到当前指标的请求处理类"""
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(metrics.summary(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 不输出每次抓取指标的访问日志
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """在后台线程启动服务器，返回指标地址"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """停止服务器"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def print_metrics_summary(metrics: CrawlMetrics, baseline: Optional[Dict] = None):
+    """输出一行JSON格式的指标汇总，便于日志采集"""
+    print(f"📈 请求指标：{json.dumps(metrics.summary(baseline), ensure_ascii=False)}")
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> Optional[MetricsServer]:
+    """
+    启动指标服务器（使用进程内共享的指标）
+
+    Args:
+        port: 监听端口
+        host: 监听地址
+
+    Returns:
+        服务器，端口被占用等原因启动失败时返回None
+    """
+    try:
+        server = MetricsServer(host=host, port=port)
+    except OSError as e:
+        print(f"⚠️  启动指标服务失败（端口 {port}）：{e}")
+        return None
+    print(f"📈 指标地址：{server.start()}")
+    return server
+
+
+_shared_metrics: Optional[CrawlMetrics] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_metrics() -> CrawlMetrics:
+    """获取进程内共享的指标实例"""
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = CrawlMetrics()
+        return _shared_metrics
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 分页获取
+按页码顺序产出每一页的数据，支持在得知视频总数后并发获取剩余页面
+
+- 第一页返回 page.count 后即可算出总页数，剩余页面交给线程池并发获取
+- 并发请求仍受共享限速器控制，总速度取决于允许的请求速率
+- 结果按页码顺序产出，保存文件时无需重新排序
+- 获取失败的页面单独重试，不影响其他页面
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import math
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from bilibili_log import get_logger
+
+log = get_logger('pages')
+
+# 获取一页数据的函数：参数为页码，返回API的 data 字段，失败返回None
+PageFetcher = Callable[[int], Optional[Dict]]
+
+
+def fetch_pages_parallel(fetch_page: PageFetcher, pages: Iterable[int],
+                         max_workers: int = 4,
+                         page_retries: int = 2) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    并发获取多个页面，按页码顺序产出
+
+    同时在途的页面数限制为 max_workers 的4倍，避免慢页面阻塞时结果在内存中堆积。
+
+    Args:
+        fetch_page: 获取单页数据的函数
+        pages: 要获取的页码（递增）
+        max_workers: 并发线程数
+        page_retries: 单个页面失败后额外重试的次数
+
+    Yields:
+        (页码, 数据)，重试后仍失败的页面数据为None
+    """
+    page_list = list(pages)
+    window = max_workers * 4
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight: Dict[int, Future] = {}
+    attempts: Dict[int, int] = {}
+    next_submit = 0
+
+    try:
+        for page in page_list:
+            # 补充提交窗口内的页面
+            while next_submit < len(page_list) and len(in_flight) < window:
+                pn = page_list[next_submit]
+                in_flight[pn] = executor.submit(fetch_page, pn)
+                attempts[pn] = 0
+                next_submit += 1
+
+            data = in_flight[page].result()
+            while data is None and attempts[page] < page_retries:
+                attempts[page] += 1
+                log.warning('page_retry', "🔁 第 {page} 页获取失败，单独重试（{attempt}/{max_retries}）",
+                            page=page, attempt=attempts[page], max_retries=page_retries)
+                data = executor.submit(fetch_page, page).result()
+
+            del in_flight[page]
+            yield page, data
+    finally:
+        # 调用方提前停止时取消尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pages(fetch_page: PageFetcher, start_page: int, page_size: int,
+               max_workers: int = 1) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    从 start_page 开始按顺序产出每一页
+
+    max_workers 为1时逐页获取，调用方停止迭代即停止请求；
+    大于1时，在第一页得知视频总数后并发获取剩余页面。
+
+    Args:
+        fetch_page: 获取单页数据的函数
+        start_page: 起始页码
+        page_size: 每页视频数
+        max_workers: 并发线程数
+
+    Yields:
+        (页码, 数据)，数据为None表示该页获取失败，之后不再产出
+    """
+    page = start_page
+    data = fetch_page(page)
+    yield page, data
+    if not data:
+        return
+
+    count = data.get('page', {}).get('count', 0)
+    if max_workers > 1 and count > 0:
+        last_page = math.ceil(count / page_size)
+        if last_page > page:
+            log.info('parallel_pages', "🚀 共 {total} 个视频，并发获取剩余 {pages} 页（{workers} 线程）",
+                     total=count, pages=last_page - page, workers=max_workers)
+        for page, data in fetch_pages_parallel(fetch_page, range(page + 1, last_page + 1), max_workers):
+            yield page, data
+            if not data:
+                return
+        return
+
+    while True:
+        page += 1
+        data = fetch_page(page)
+        yield page, data
+        if not data:
+            return
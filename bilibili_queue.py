@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 持久化任务队列
+批量爬取的UID保存在本地SQLite文件中，记录每个UID的状态、尝试次数和最后一次错误
+
+- 状态：pending（等待）→ running（爬取中）→ done（完成）/ failed（多次失败后放弃）
+- 程序中断后重新打开队列，running 状态的任务恢复为 pending，继续处理
+- 多进程/多机器共享同一个队列时，任务以租约方式领取：领取者需定期续约，
+  租约过期（进程崩溃）的任务会被其他进程重新领取
+- 重复添加同一个UID不会产生重复任务
+- 失败的任务排到队尾重试，达到最大尝试次数后标记为 failed
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# 默认队列文件，放在输出目录下
+DEFAULT_QUEUE_PATH = "./output/crawl_queue.db"
+
+# 任务状态
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    uid INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    videos INTEGER NOT NULL DEFAULT 0,
+    added_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, attempts, added_at);
+"""
+
+
+def parse_uid_lines(lines: Iterable[str]) -> List[int]:
+    """
+    从文本行中解析UID
+
+    每行一个或多个UID（空格或逗号分隔），# 之后为注释，无效内容会被跳过并提示。
+
+    Args:
+        lines: 文本行
+
+    Returns:
+        按出现顺序去重后的UID列表
+    """
+    uids = []
+    for line_no, line in enumerate(lines, 1):
+        content = line.split('#', 1)[0].replace(',', ' ')
+        for token in content.split():
+            try:
+                uids.append(int(token))
+            except ValueError:
+                print(f"⚠️  第 {line_no} 行的 {token!r} 不是有效的UID，已跳过")
+    return list(dict.fromkeys(uids))
+
+
+def read_uid_source(source: str) -> List[int]:
+    """
+    读取UID列表
+
+    Args:
+        source: 文件路径，"-" 表示从标准输入读取
+
+    Returns:
+        UID列表
+    """
+    if source == '-':
+        return parse_uid_lines(sys.stdin)
+    with open(source, 'r', encoding='utf-8') as f:
+        return parse_uid_lines(f)
+
+
+class CrawlQueue:
+    """基于SQLite的持久化任务队列"""
+
+    def __init__(self, db_path: str = DEFAULT_QUEUE_PATH, max_attempts: int = 3):
+        """
+        打开（或创建）队列
+
+        Args:
+            db_path: SQLite文件路径
+            max_attempts: 单个UID最多尝试的次数，超过后标记为 failed
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 自动提交模式，需要原子操作的地方显式开启事务
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """为旧版队列文件补充租约字段"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for name, column_type in (('lease_owner', 'TEXT'), ('lease_until', 'REAL')):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    def add(self, uids: Iterable[int], retry_finished: bool = False) -> int:
+        """
+        添加UID
+
+        Args:
+            uids: UID列表
+            retry_finished: 为True时已完成或已失败的UID重新设为等待
+
+        Returns:
+            新加入（或重新设为等待）的任务数
+        """
+        now = time.time()
+        added = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for uid in uids:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO jobs (uid, status, added_at) VALUES (?, ?, ?)",
+                    (uid, STATUS_PENDING, now)
+                )
+                if cursor.rowcount == 0 and retry_finished:
+                    cursor = self.conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = 0, last_error = NULL "
+                        "WHERE uid = ? AND status IN (?, ?)",
+                        (STATUS_PENDING, uid, STATUS_DONE, STATUS_FAILED)
+                    )
+                added += cursor.rowcount
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def recover(self) -> int:
+        """
+        将上次中断时仍在爬取中、且没有租约的任务恢复为等待
+
+        带租约的任务由租约过期机制回收，不会抢走其他进程正在爬取的任务。
+
+        Returns:
+            恢复的任务数
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ? WHERE status = ? AND lease_until IS NULL",
+            (STATUS_PENDING, STATUS_RUNNING)
+        )
+        return cursor.rowcount
+
+    def claim_next(self, owner: Optional[str] = None,
+                   lease_seconds: Optional[float] = None) -> Optional[int]:
+        """
+        取出下一个任务并标记为爬取中
+
+        尝试次数少的任务优先，失败后重新等待的任务排在其他任务之后。
+        租约已过期的爬取中任务（领取者已崩溃）同样可以被领取。
+
+        Args:
+            owner: 领取者标识，多进程时用于校验租约
+            lease_seconds: 租约时长（秒），为None时不设租约（单进程批量模式）
+
+        Returns:
+            UID，没有可领取的任务时返回None
+        """
+        now = time.time()
+        lease_until = now + lease_seconds if lease_seconds else None
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT uid FROM jobs WHERE status = ? "
+                "OR (status = ? AND lease_until IS NOT NULL AND lease_until < ?) "
+                "ORDER BY attempts, added_at, uid LIMIT 1",
+                (STATUS_PENDING, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, "
+                "lease_owner = ?, lease_until = ? WHERE uid = ?",
+                (STATUS_RUNNING, now, owner, lease_until, row['uid'])
+            )
+            self.conn.execute("COMMIT")
+            return row['uid']
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def renew_lease(self, uid: int, owner: str, lease_seconds: float) -> bool:
+        """
+        续约
+
+        Returns:
+            是否续约成功，租约已被其他进程领取时返回False
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE uid = ? AND status = ? AND lease_owner = ?",
+            (time.time() + lease_seconds, uid, STATUS_RUNNING, owner)
+        )
+        return cursor.rowcount > 0
+
+    def _owned(self, owner: Optional[str]) -> str:
+        """校验租约归属的SQL条件，owner 为None时不校验"""
+        return "" if owner is None else f" AND status = '{STATUS_RUNNING}' AND lease_owner = ?"
+
+    def mark_done(self, uid: int, videos: int = 0, owner: Optional[str] = None) -> bool:
+        """
+        标记任务完成
+
+        Returns:
+            是否已更新，租约已被其他进程领取时返回False
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, videos = ?, last_error = NULL, finished_at = ?, "
+            "lease_until = NULL WHERE uid = ?" + self._owned(owner),
+            (STATUS_DONE, videos, time.time(), uid) + (() if owner is None else (owner,))
+        )
+        return cursor.rowcount > 0
+
+    def mark_failed(self, uid: int, error: str, owner: Optional[str] = None) -> str:
+        """
+        记录一次失败，未达到最大尝试次数时重新设为等待
+
+        Args:
+            uid: 用户UID
+            error: 错误信息
+            owner: 领取者标识，不为None时只在仍持有租约时更新
+
+        Returns:
+            任务的新状态
+        """
+        row = self.conn.execute("SELECT attempts, status FROM jobs WHERE uid = ?", (uid,)).fetchone()
+        attempts = row['attempts'] if row else self.max_attempts
+        status = STATUS_FAILED if attempts >= self.max_attempts else STATUS_PENDING
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, last_error = ?, finished_at = ?, lease_until = NULL "
+            "WHERE uid = ?" + self._owned(owner),
+            (status, error, time.time(), uid) + (() if owner is None else (owner,))
+        )
+        if cursor.rowcount == 0 and row:
+            return row['status']
+        return status
+
+    def release(self, uid: int, owner: Optional[str] = None):
+        """放回尚未完成的任务（如用户中断），不计入尝试次数"""
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_until = NULL "
+            "WHERE uid = ? AND status = ?" + ("" if owner is None else " AND lease_owner = ?"),
+            (STATUS_PENDING, uid, STATUS_RUNNING) + (() if owner is None else (owner,))
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        counts = {STATUS_PENDING: 0, STATUS_RUNNING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row['status']] = row['n']
+        return counts
+
+    def owner_stats(self, since: float) -> List[Dict]:
+        """
+        按领取者汇总某个时间之后完成的任务
+
+        Args:
+            since: 起始时间戳
+
+        Returns:
+            每个领取者的完成任务数和视频数，按视频数降序
+        """
+        rows = self.conn.execute(
+            "SELECT lease_owner AS owner, COUNT(*) AS jobs, SUM(videos) AS videos FROM jobs "
+            "WHERE status = ? AND finished_at >= ? GROUP BY lease_owner ORDER BY videos DESC",
+            (STATUS_DONE, since)
+        )
+        return [dict(row) for row in rows]
+
+    def jobs(self, status: Optional[str] = None) -> Iterator[Dict]:
+        """按加入顺序遍历任务"""
+        if status:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY added_at, uid", (status,)
+            )
+        else:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY added_at, uid")
+        for row in rows:
+            yield dict(row)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 自适应限速器
+令牌桶控制请求速率，按AIMD（加性增、乘性减）根据实际响应调整速率
+
+- 请求成功：速率加上一个固定步长，API正常时逐渐提速
+- 触发频率限制（频繁/上限/-412等）：速率减半，并清空已积累的令牌
+- 超时、连接错误等不视为限流信号，不影响速率
+
+所有爬虫版本默认共用同一个限速器实例。
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+# 表示触发频率限制的错误信息关键字
+THROTTLE_KEYWORDS = ('频繁', '频率', '上限')
+
+# 表示触发风控/限流的业务码和HTTP状态码
+THROTTLE_CODES = (-412, -509, -799)
+THROTTLE_HTTP_STATUS = (412, 429)
+
+
+def is_throttle_message(message: Optional[str]) -> bool:
+    """判断错误信息是否表示触发了频率限制"""
+    return bool(message) and any(keyword in message for keyword in THROTTLE_KEYWORDS)
+
+
+def is_throttle_response(data: Dict) -> bool:
+    """判断API响应是否表示触发了频率限制"""
+    return data.get('code') in THROTTLE_CODES or is_throttle_message(data.get('message'))
+
+
+class AdaptiveRateLimiter:
+    """令牌桶 + AIMD 自适应限速器"""
+
+    def __init__(self, initial_rate: float = 0.5, min_rate: float = 1 / 60,
+                 max_rate: float = 2.0, increase_step: float = 0.05,
+                 decrease_factor: float = 0.5, burst: float = 1.0):
+        """
+        初始化限速器
+
+        Args:
+            initial_rate: 初始速率（次/秒）
+            min_rate: 最低速率，连续限流时不会低于该值
+            max_rate: 最高速率
+            increase_step: 每次成功后增加的速率
+            decrease_factor: 触发限流时速率乘以的系数
+            burst: 令牌桶容量，允许的最大突发请求数
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+
+        self._rate = min(max(initial_rate, min_rate), max_rate)
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.successes = 0
+        self.throttles = 0
+        self.total_wait = 0.0
+
+    @property
+    def rate(self) -> float:
+        """当前速率（次/秒）"""
+        return self._rate
+
+    def _refill(self, now: float):
+        """按当前速率补充令牌（需持有锁）"""
+        elapsed = now - self._last_refill
+        self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
+        self._last_refill = now
+
+    def reserve(self) -> float:
+        """
+        预定一个令牌
+
+        Returns:
+            需要等待的秒数，调用方等待该时长后即可发送请求
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+            self.total_wait += wait
+            return wait
+
+    def available_in(self) -> float:
+        """下一个令牌还需多久可用（秒），只查询不预定"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(1 - self._tokens, 0.0) / self._rate
+
+    def acquire(self) -> float:
+        """阻塞等待直到可以发送请求，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """异步等待直到可以发送请求，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_success(self):
+        """请求成功：加性增加速率"""
+        with self._lock:
+            self.successes += 1
+            self._refill(time.monotonic())
+            self._rate = min(self.max_rate, self._rate + self.increase_step)
+
+    def on_throttle(self):
+        """触发频率限制：乘性降低速率，并清空已积累的令牌"""
+        with self._lock:
+            self.throttles += 1
+            self._refill(time.monotonic())
+            self._rate = max(self.min_rate, self._rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+
+    def set_max_rate(self, max_rate: float):
+        """调整最高速率，当前速率高于新上限时同步降低"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.max_rate = max(max_rate, self.min_rate)
+            self._rate = min(self._rate, self.max_rate)
+
+    def stats(self) -> Dict[str, float]:
+        """限速器统计信息"""
+        return {
+            "rate": round(self._rate, 4),
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "total_wait": round(self.total_wait, 2)
+        }
+
+
+_shared_limiter: Optional[AdaptiveRateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_rate_limiter() -> AdaptiveRateLimiter:
+    """获取进程内共享的限速器实例"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = AdaptiveRateLimiter()
+        return _shared_limiter
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 按期限安排请求节奏
+给一个UP主的爬取设定时间预算（如30分钟），第一页得知视频总数后，
+把剩余页面的请求均匀分布在期限之内
+
+- 每次请求前按“剩余时间 / 剩余页数”计算下一页的时间点，落后时自动加快、领先时放慢
+- 实际速率仍受自适应限速器限制，不会因为期限紧张而超过限速器的速率
+- 预留一部分预算给重试和最后一页，默认为期限的10%
+- 按限速器当前速率和实际每页耗时估算最快完成时间，赶不上期限时立即警告，不必等到超时
+- 同步（含并发获取）和异步视频流都可使用：传入 scheduler 后，流的每次页面请求都经过它
+
+使用示例：
+    crawler.deadline = parse_duration('30m')
+    stream = crawler.iter_video_pages(uid)
+    ...
+    print(stream.scheduler.projection())
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import asyncio
+import logging
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from bilibili_log import get_logger
+from bilibili_pages import PageFetcher
+from bilibili_rate_limiter import AdaptiveRateLimiter
+
+log = get_logger('scheduler')
+
+# 预留给重试和最后一页的预算比例
+DEFAULT_SAFETY_MARGIN = 0.1
+
+# 每页实际耗时的平滑系数（指数加权平均）
+LATENCY_SMOOTHING = 0.3
+
+# 时长单位
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(text: str) -> float:
+    """
+    解析时长：纯数字为秒，也可以带单位，如 90s、30m、1.5h、1h30m
+
+    Args:
+        text: 时长文本
+
+    Returns:
+        秒数
+
+    Raises:
+        ValueError: 格式不正确或不是正数
+    """
+    text = text.strip().lower()
+    try:
+        seconds = float(text)
+    except ValueError:
+        parts = re.findall(r'(\d+(?:\.\d+)?)([smh])', text)
+        if not parts or ''.join(number + unit for number, unit in parts) != text:
+            raise ValueError(f"无法识别的时长：{text}（示例：1800、90s、30m、1h30m）")
+        seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    if seconds <= 0:
+        raise ValueError(f"时长必须大于0：{text}")
+    return seconds
+
+
+def format_duration(seconds: float) -> str:
+    """把秒数格式化为便于阅读的时长"""
+    seconds = max(int(round(seconds)), 0)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
+
+
+class DeadlineScheduler:
+    """按期限均匀安排每页请求，并估算完成时间"""
+
+    def __init__(self, deadline: float, rate_limiter: AdaptiveRateLimiter,
+                 safety_margin: float = DEFAULT_SAFETY_MARGIN, uid: Optional[int] = None):
+        """
+        初始化调度器，期限从创建时开始计算
+
+        Args:
+            deadline: 时间预算（秒）
+            rate_limiter: 限速器，用于估算最快能达到的速率
+            safety_margin: 预留给重试和最后一页的预算比例
+            uid: 用户UID，只用于日志
+        """
+        self.deadline = deadline
+        self.rate_limiter = rate_limiter
+        self.safety_margin = safety_margin
+        self.uid = uid
+
+        self.started = time.monotonic()
+        self.deadline_at = self.started + deadline
+        # 计划在该时间点之前发出最后一个请求
+        self.plan_end = self.deadline_at - deadline * safety_margin
+
+        self.count = 0          # 视频总数，第一页返回后得知
+        self.page_size = 0      # 当前每页视频数
+        self.covered = 0        # 已获取的页面覆盖到的视频数
+        self.pages = 0          # 已完成的页面请求数
+        self.in_flight = 0      # 已安排但尚未返回的请求数
+        self.page_seconds = 0.0  # 每页实际耗时（含限速等待和重试）的平滑值
+        self.planned = False
+        self.on_track = True
+        self.finished = False
+        self._last_slot = self.started
+        self._lock = threading.Lock()
+
+    def _remaining_requests(self) -> int:
+        """还需要请求的页数（需持有锁）"""
+        if not self.planned or self.page_size <= 0:
+            return 0
+        return max(math.ceil(max(self.count - self.covered, 0) / self.page_size) - self.in_flight, 0)
+
+    def _page_cost(self) -> float:
+        """按限速器当前速率和实际每页耗时估算的每页最短用时"""
+        rate = self.rate_limiter.rate
+        return max(1 / rate if rate > 0 else 0.0, self.page_seconds)
+
+    def reserve(self, page_size: int) -> float:
+        """
+        为下一次页面请求安排时间点
+
+        Args:
+            page_size: 本次请求的每页视频数
+
+        Returns:
+            需要等待的秒数（得知视频总数之前为0）
+        """
+        with self._lock:
+            self.page_size = page_size
+            now = time.monotonic()
+            remaining = self._remaining_requests()
+            if remaining <= 0:
+                self.in_flight += 1
+                return 0.0
+            # 剩余请求均匀分布在上一次请求和计划结束时间之间
+            interval = max(self.plan_end - self._last_slot, 0.0) / remaining
+            slot = max(now, self._last_slot + interval)
+            self._last_slot = slot
+            self.in_flight += 1
+            return slot - now
+
+    def record(self, page: int, page_size: int, data: Optional[Dict], seconds: float):
+        """
+        记录一次页面请求的结果
+
+        Args:
+            page: 页码
+            page_size: 每页视频数
+            data: 接口返回的 data 字段，失败为None
+            seconds: 请求实际耗时（不含调度器安排的等待）
+        """
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if not data:
+                return
+            self.pages += 1
+            self.page_size = page_size
+            self.covered = max(self.covered, page * page_size)
+            self.page_seconds = (seconds if self.pages == 1 else
+                                 LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * self.page_seconds)
+            first = not self.planned
+            if first:
+                self.count = data.get('page', {}).get('count', 0)
+                self.planned = self.count > 0
+                if not self.planned:
+                    return
+            projection = self._projection()
+
+        if first:
+            log.info('deadline_plan',
+                     "⏳ 期限 {deadline_text}：还需 {remaining} 页，约每 {interval:.1f} 秒一页，"
+                     "预计 {finish} 完成（期限 {deadline_time}）",
+                     uid=self.uid, deadline=self.deadline, deadline_text=format_duration(self.deadline),
+                     **projection)
+        self._check(projection)
+
+    def _projection(self) -> Dict:
+        """当前的完成时间估算（需持有锁）"""
+        now = time.monotonic()
+        remaining = self._remaining_requests() + self.in_flight
+        fastest = remaining * self._page_cost()
+        planned = max(self.plan_end - now, 0.0) if remaining else 0.0
+        eta = max(fastest, planned)
+        wall = datetime.now()
+        return {
+            "remaining": remaining,
+            "elapsed": round(now - self.started, 1),
+            "interval": eta / remaining if remaining else 0.0,
+            "rate": round(self.rate_limiter.rate, 4),
+            "fastest_seconds": round(fastest, 1),
+            "finish": (wall + timedelta(seconds=eta)).strftime('%H:%M:%S'),
+            "deadline_time": (wall + timedelta(seconds=self.deadline_at - now)).strftime('%H:%M:%S'),
+            "overrun": round(max(now + fastest - self.deadline_at, 0.0), 1),
+            "on_track": now + fastest <= self.deadline_at
+        }
+
+    def _check(self, projection: Dict):
+        """按最快完成时间判断能否按时完成，状态变化时输出"""
+        on_track = projection["on_track"]
+        if on_track == self.on_track:
+            return
+        self.on_track = on_track
+        if on_track:
+            log.info('deadline_on_track', "✅ 恢复按期进度：预计 {finish} 完成（期限 {deadline_time}）",
+                     uid=self.uid, **projection)
+        else:
+            log.warning('deadline_at_risk',
+                        "⚠️  按当前速率（{rate} 次/秒）还需约 {fastest_seconds} 秒，"
+                        "预计超出期限 {overrun} 秒（期限 {deadline_time}）",
+                        uid=self.uid, **projection)
+
+    def projection(self) -> Dict:
+        """
+        当前的完成时间估算
+
+        Returns:
+            剩余页数、已用时间、计划间隔、最快完成所需秒数、预计完成时间、期限、预计超出秒数、是否能按时完成
+        """
+        with self._lock:
+            return self._projection()
+
+    def finish(self):
+        """视频流结束时输出实际用时（只输出一次）"""
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.monotonic() - self.started
+        met = elapsed <= self.deadline
+        log.log(logging.INFO if met else logging.WARNING, 'deadline_done',
+                "⏱️  用时 {elapsed_text}，期限 {deadline_text}（{result}）",
+                uid=self.uid, elapsed=round(elapsed, 1), deadline=self.deadline,
+                elapsed_text=format_duration(elapsed), deadline_text=format_duration(self.deadline),
+                result="按时完成" if met else "已超时", on_track=met)
+
+    def wrap(self, fetch_page: PageFetcher, page_size: int) -> PageFetcher:
+        """
+        包装获取单页数据的函数：请求前等待安排的时间点，请求后记录结果
+
+        Args:
+            fetch_page: 获取单页数据的函数
+            page_size: 每页视频数
+
+        Returns:
+            包装后的函数
+        """
+        def paced(page: int) -> Optional[Dict]:
+            wait = self.reserve(page_size)
+            if wait > 0:
+                time.sleep(wait)
+            start = time.monotonic()
+            data = None
+            try:
+                data = fetch_page(page)
+            finally:
+                self.record(page, page_size, data, time.monotonic() - start)
+            return data
+        return paced
+
+    def wrap_async(self, fetch_page, page_size: int):
+        """
+        包装异步获取单页数据的函数，等待使用 asyncio.sleep
+
+        Args:
+            fetch_page: 异步获取单页数据的函数
+            page_size: 每页视频数
+
+        Returns:
+            包装后的异步函数
+        """
+        async def paced(page: int) -> Optional[Dict]:
+            wait = self.reserve(page_size)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            data = None
+            try:
+                data = await fetch_page(page)
+            finally:
+                self.record(page, page_size, data, time.monotonic() - start)
+            return data
+        return paced
+
+
+def create_scheduler(deadline: Optional[float], rate_limiter: AdaptiveRateLimiter,
+                     uid: Optional[int] = None) -> Optional[DeadlineScheduler]:
+    """
+    按爬虫的 deadline 设置创建调度器
+
+    Args:
+        deadline: 时间预算（秒），为None时不按期限安排
+        rate_limiter: 爬虫使用的限速器
+        uid: 用户UID
+
+    Returns:
+        调度器，未设置期限时返回None
+    """
+    if deadline is None:
+        return None
+    return DeadlineScheduler(deadline, rate_limiter, uid=uid)
@@ -15,8 +15,26 @@ import time
 import random
 import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Set
 import warnings
+from functools import partial
+
+from bilibili_breaker import CircuitOpenError
+from bilibili_log import configure_logging, get_logger, parse_logging_args
+from bilibili_metrics import SLEEP_RETRY, print_metrics_summary
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, get_shared_rate_limiter, is_throttle_response
+)
+from bilibili_scheduler import create_scheduler
+from bilibili_transport import BilibiliTransport, USER_AGENTS, api_url, get_shared_transport
+from bilibili_database import DEFAULT_DB_PATH, VideoDatabase, crawl_to_database
+from bilibili_snapshots import DEFAULT_SNAPSHOT_PATH, SnapshotStore, crawl_to_snapshots
+from bilibili_storage import (
+    append_journal_page, create_journal, finalize_journal,
+    find_latest_final, find_resumable_journal, load_journal_state, load_known_bvids
+)
+from bilibili_stream import VideoStream
+from bilibili_video import Video, video_dicts
 
 # 禁用SSL警告
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
@@ -26,26 +44,39 @@ try:
 except ImportError:
     pass
 
+log = get_logger('simple')
+
 
 class BilibiliSimpleCrawler:
     """B站视频爬虫类（简化版）"""
 
-    def __init__(self):
-        """初始化爬虫配置"""
+    def __init__(self, transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        初始化爬虫配置
+
+        Args:
+            transport: HTTP传输层，默认使用进程内共享的连接池
+            rate_limiter: 限速器，默认使用进程内共享的自适应限速器
+        """
+        self.transport = transport or get_shared_transport()
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
         self.max_retries = 8  # 最大重试次数（进一步增加）
-        self.retry_delay = 10  # 重试延迟（秒，进一步增加）
-        self.request_delay = 5  # 基础请求间隔（秒，进一步增加）
+        self.retry_delay = 10  # 网络错误时的重试延迟（秒）
         self.videos_per_page = 10  # 每页视频数量（进一步减少）
+        self.parallel_workers = 1  # 得知总数后并发获取剩余页面的线程数，1为逐页获取
         self.output_dir = "./output"  # 输出目录
+        self.resume = True  # 发现未完成的爬取文件时断点续传
+        self.incremental = False  # 增量爬取：遇到整页已知视频即停止，并与上次结果合并
+        self.compression = None  # 日志和 _final.json 的压缩格式：None、gzip 或 zstd（需要 zstandard）
+        self.deadline = None  # 每个UP主的时间预算（秒）：按期限均匀安排每页请求，赶不上时提前警告
+        self.storage = 'json'  # 存储后端：json（JSONL日志 + _final.json）、sqlite（按bvid更新的数据库）或 snapshot（只记录计数快照）
+        self.db_path = DEFAULT_DB_PATH  # sqlite 后端的数据库文件
+        self.snapshot_path = DEFAULT_SNAPSHOT_PATH  # snapshot 后端的快照数据库
 
         # 多个User-Agent轮换
-        self.user_agents = [
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        ]
+        self.user_agents = list(USER_AGENTS)
 
         # 获取随机User-Agent
         import random
@@ -72,6 +103,32 @@ class BilibiliSimpleCrawler:
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
 
+    def wait_for_rate_limit(self):
+        """等待限速器发放令牌，速率根据限流情况自动调整"""
+        wait = self.rate_limiter.acquire()
+        self.metrics.record_sleep(wait)
+        if wait >= 1:
+            log.info('rate_wait', "等待 {delay:.1f} 秒（当前速率 {rate:.2f} 次/秒）...",
+                     delay=wait, rate=self.rate_limiter.rate)
+
+    def handle_http_error(self, error: requests.exceptions.HTTPError) -> bool:
+        """
+        处理HTTP错误状态码
+
+        Args:
+            error: requests抛出的HTTP错误
+
+        Returns:
+            是否为限流状态码（412/429），是则已降低速率，可直接重试
+        """
+        status = error.response.status_code if error.response is not None else None
+        if status in THROTTLE_HTTP_STATUS:
+            self.rate_limiter.on_throttle()
+            log.warning('throttle', "HTTP {status} 限流，降速至 {rate:.2f} 次/秒...",
+                        status=status, rate=self.rate_limiter.rate, outcome='throttle')
+            return True
+        return False
+
     def get_user_info(self, uid: int) -> Optional[Dict]:
         """
         获取用户信息
@@ -82,62 +139,82 @@ class BilibiliSimpleCrawler:
         Returns:
             用户信息字典，失败返回None
         """
-        url = f"https://api.bilibili.com/x/space/arc/search"
+        url = api_url("/x/space/arc/search")
         params = {
             'mid': uid,
             'ps': 1,
             'pn': 1
         }
 
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            if cached.get('code') == 0:
+                return cached.get('data', {}).get('list', {}).get('vlist', [])
+            log.error('user_info_failed', "获取用户信息失败（缓存）：{error}",
+                      uid=uid, error=cached.get('message', '未知错误'), outcome='cached_error')
+            return None
+
         for attempt in range(self.max_retries):
             try:
-                # 添加随机延迟和User-Agent轮换
+                # 等待限速器发放令牌，重试时轮换User-Agent
+                self.wait_for_rate_limit()
                 if attempt > 0:
-                    # 频率限制时使用更长的延迟
-                    if attempt > 2:
-                        delay = 30 + random.uniform(10, 20)  # 30-50秒
-                        print(f"🔄 检测到多次失败，等待 {delay:.1f} 秒...")
-                    else:
-                        delay = self.retry_delay + random.uniform(5, 10)  # 15-20秒
-                        print(f"等待 {delay:.1f} 秒后重试...")
-                    time.sleep(delay)
-
-                    # 轮换User-Agent
+                    self.metrics.record_retry()
                     user_agent = random.choice(self.user_agents)
                     self.headers['User-Agent'] = user_agent
 
-                response = requests.get(
+                # 通过共享连接池发送，请求头每次单独传入
+                data = self.transport.get_json(
                     url,
                     params=params,
                     headers=self.headers,
-                    timeout=15,
-                    verify=False  # 禁用SSL验证（仅用于解决兼容性问题）
+                    timeout=15
                 )
-                response.raise_for_status()
-                data = response.json()
 
                 if data.get('code') == 0:
+                    self.rate_limiter.on_success()
                     return data.get('data', {}).get('list', {}).get('vlist', [])
                 else:
                     error_msg = data.get('message', '未知错误')
-                    if '频繁' in error_msg or '频率' in error_msg:
-                        print(f"请求过于频繁，等待更长时间...")
-                        time.sleep(30)  # 频率限制时等待更长时间
+                    if is_throttle_response(data):
+                        self.rate_limiter.on_throttle()
+                        log.warning('throttle', "请求过于频繁，降速至 {rate:.2f} 次/秒...",
+                                    uid=uid, attempt=attempt + 1, rate=self.rate_limiter.rate,
+                                    outcome='throttle')
                         continue
-                    print(f"获取用户信息失败：{error_msg}")
+                    log.error('user_info_failed', "获取用户信息失败：{error}",
+                              uid=uid, attempt=attempt + 1, error=error_msg, outcome='api_error')
                     return None
 
+            except CircuitOpenError as e:
+                # 接口熔断中：不再重试，把时间留给其他UID
+                log.warning('circuit_rejected', "接口熔断中，{retry_in:.0f} 秒后才能再试，跳过获取用户信息",
+                            uid=uid, key=e.key, retry_in=e.retry_in, outcome='circuit_open')
+                return None
+            except requests.exceptions.HTTPError as e:
+                if self.handle_http_error(e):
+                    continue
+                log.warning('http_error', "获取用户信息时发生HTTP错误（尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, attempt=attempt + 1, max_retries=self.max_retries, error=e,
+                            outcome='http_error')
             except requests.exceptions.Timeout:
-                print(f"请求超时（尝试 {attempt + 1}/{self.max_retries}）")
+                log.warning('timeout', "请求超时（尝试 {attempt}/{max_retries}）",
+                            uid=uid, attempt=attempt + 1, max_retries=self.max_retries, outcome='timeout')
             except requests.exceptions.ConnectionError:
-                print(f"网络连接错误（尝试 {attempt + 1}/{self.max_retries}）")
+                log.warning('connection_error', "网络连接错误（尝试 {attempt}/{max_retries}）",
+                            uid=uid, attempt=attempt + 1, max_retries=self.max_retries,
+                            outcome='connection_error')
             except Exception as e:
-                print(f"获取用户信息时发生错误（尝试 {attempt + 1}/{self.max_retries}）：{e}")
+                log.warning('request_error', "获取用户信息时发生错误（尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, attempt=attempt + 1, max_retries=self.max_retries, error=e,
+                            outcome='error')
 
             if attempt < self.max_retries - 1:
                 time.sleep(self.retry_delay)
+                self.metrics.record_sleep(self.retry_delay, SLEEP_RETRY)
             else:
-                print("已达到最大重试次数")
+                log.error('retries_exhausted', "已达到最大重试次数", uid=uid, outcome='gave_up')
                 return None
 
     def get_user_videos(self, uid: int, page: int = 1) -> Optional[Dict]:
@@ -151,7 +228,7 @@ class BilibiliSimpleCrawler:
         Returns:
             视频列表数据，失败返回None
         """
-        url = "https://api.bilibili.com/x/space/arc/search"
+        url = api_url("/x/space/arc/search")
         params = {
             'mid': uid,
             'ps': self.videos_per_page,
@@ -159,152 +236,219 @@ class BilibiliSimpleCrawler:
             'order': 'pubdate'  # 按发布时间排序
         }
 
+        log.info('page_request', "正在获取第 {page} 页...", uid=uid, page=page)
+
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            if cached.get('code') == 0:
+                return cached.get('data', {})
+            log.warning('not_found', "用户不存在或没有公开视频（{page}页，缓存）",
+                        uid=uid, page=page, outcome='cached_error')
+            return None
+
         for attempt in range(self.max_retries):
             try:
-                # 添加随机延迟和User-Agent轮换
+                # 等待限速器发放令牌，重试时轮换User-Agent
+                self.wait_for_rate_limit()
                 if attempt > 0:
-                    # 频率限制时使用更长的延迟
-                    if attempt > 2:
-                        delay = 30 + random.uniform(10, 20)  # 30-50秒
-                        print(f"🔄 检测到多次失败，等待 {delay:.1f} 秒...")
-                    else:
-                        delay = self.retry_delay + random.uniform(5, 10)  # 15-20秒
-                        print(f"等待 {delay:.1f} 秒后重试第 {page} 页...")
-                    time.sleep(delay)
-
-                    # 轮换User-Agent
+                    self.metrics.record_retry()
                     user_agent = random.choice(self.user_agents)
                     self.headers['User-Agent'] = user_agent
 
-                response = requests.get(
+                # 通过共享连接池发送，请求头每次单独传入
+                data = self.transport.get_json(
                     url,
                     params=params,
                     headers=self.headers,
-                    timeout=20,
-                    verify=False  # 禁用SSL验证（仅用于解决兼容性问题）
+                    timeout=20
                 )
-                response.raise_for_status()
-                data = response.json()
 
                 if data.get('code') == 0:
+                    self.rate_limiter.on_success()
                     return data.get('data', {})
                 else:
                     error_msg = data.get('message', '未知错误')
-                    if '频繁' in error_msg or '频率' in error_msg:
-                        print(f"请求过于频繁，等待更长时间（{page}页）...")
-                        time.sleep(30)  # 频率限制时等待更长时间
+                    if is_throttle_response(data):
+                        self.rate_limiter.on_throttle()
+                        log.warning('throttle', "请求过于频繁，降速至 {rate:.2f} 次/秒（{page}页）...",
+                                    uid=uid, page=page, attempt=attempt + 1,
+                                    rate=self.rate_limiter.rate, outcome='throttle')
                         continue
                     elif '不存在' in error_msg or '找不到' in error_msg:
-                        print(f"用户不存在或没有公开视频（{page}页）")
+                        log.warning('not_found', "用户不存在或没有公开视频（{page}页）",
+                                    uid=uid, page=page, outcome='not_found')
                         return None
                     else:
-                        print(f"获取视频列表失败（页码：{page}）：{error_msg}")
+                        log.error('page_failed', "获取视频列表失败（页码：{page}）：{error}",
+                                  uid=uid, page=page, attempt=attempt + 1, error=error_msg,
+                                  outcome='api_error')
                         return None
 
+            except CircuitOpenError as e:
+                log.warning('circuit_rejected', "接口熔断中，{retry_in:.0f} 秒后才能再试，跳过第 {page} 页",
+                            uid=uid, page=page, key=e.key, retry_in=e.retry_in, outcome='circuit_open')
+                return None
+            except requests.exceptions.HTTPError as e:
+                if self.handle_http_error(e):
+                    continue
+                log.warning('http_error', "获取视频列表时发生HTTP错误（页码：{page}，尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            error=e, outcome='http_error')
             except requests.exceptions.Timeout:
-                print(f"请求超时（页码：{page}，尝试 {attempt + 1}/{self.max_retries}）")
+                log.warning('timeout', "请求超时（页码：{page}，尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            outcome='timeout')
             except requests.exceptions.ConnectionError:
-                print(f"网络连接错误（页码：{page}，尝试 {attempt + 1}/{self.max_retries}）")
+                log.warning('connection_error', "网络连接错误（页码：{page}，尝试 {attempt}/{max_retries}）",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            outcome='connection_error')
             except Exception as e:
-                print(f"获取视频列表时发生错误（页码：{page}，尝试 {attempt + 1}/{self.max_retries}）：{e}")
+                log.warning('request_error', "获取视频列表时发生错误（页码：{page}，尝试 {attempt}/{max_retries}）：{error}",
+                            uid=uid, page=page, attempt=attempt + 1, max_retries=self.max_retries,
+                            error=e, outcome='error')
 
             if attempt < self.max_retries - 1:
                 time.sleep(self.retry_delay)
+                self.metrics.record_sleep(self.retry_delay, SLEEP_RETRY)
             else:
-                print(f"第 {page} 页已达到最大重试次数")
+                log.error('retries_exhausted', "第 {page} 页已达到最大重试次数",
+                          uid=uid, page=page, outcome='gave_up')
                 return None
 
-    def fetch_all_videos_with_incremental_save(self, uid: int) -> int:
+    def fetch_all_videos_to_database(self, uid: int) -> int:
         """
-        获取用户的所有视频并增量保存
+        获取用户的所有视频并逐页写入SQLite数据库
 
         Args:
             uid: 用户UID
 
         Returns:
-            获取到的视频总数
+            本次保存（新增或更新）的视频数
         """
-        # 初始化保存文件
-        save_filepath = self.init_save_file(uid)
-        if not save_filepath:
-            return 0
-
-        total_videos = 0
-        page = 1
+        database = VideoDatabase(self.db_path)
+        try:
+            return crawl_to_database(self, uid, database)
+        finally:
+            database.close()
 
-        print("开始爬取视频列表...")
+    def fetch_all_videos_to_snapshots(self, uid: int) -> int:
+        """
+        获取用户的所有视频，只把播放、弹幕、评论数记录为一次计数快照
 
-        while True:
-            # 添加智能请求延迟
-            if page > 1:
-                # 基础延迟 + 随机延迟
-                base_delay = self.request_delay + (page - 1) * 0.5  # 逐页增加延迟
-                random_delay = random.uniform(2, 5)
-                total_delay = base_delay + random_delay
-                print(f"等待 {total_delay:.1f} 秒后获取下一页...")
-                time.sleep(total_delay)
+        Args:
+            uid: 用户UID
 
-            # 获取当前页视频
-            print(f"正在获取第 {page} 页...")
-            data = self.get_user_videos(uid, page)
+        Returns:
+            本次快照记录的视频数
+        """
+        store = SnapshotStore(self.snapshot_path)
+        try:
+            return crawl_to_snapshots(self, uid, store)
+        finally:
+            store.close()
 
-            if not data:
-                print(f"第 {page} 页获取失败，停止爬取")
-                break
+    def fetch_all_videos_with_incremental_save(self, uid: int) -> int:
+        """
+        获取用户的所有视频并增量保存
 
-            # 提取视频列表
-            videos = data.get('list', {}).get('vlist', [])
+        Args:
+            uid: 用户UID
 
-            if not videos:
-                print(f"第 {page} 页没有视频，爬取完成")
+        Returns:
+            获取到的视频总数
+        """
+        if self.storage == 'sqlite':
+            return self.fetch_all_videos_to_database(uid)
+        if self.storage == 'snapshot':
+            return self.fetch_all_videos_to_snapshots(uid)
+
+        # 优先从未完成的文件断点续传，否则初始化新的保存文件
+        state = self.resume_save_file(uid)
+        if state:
+            save_filepath = state['filepath']
+            total_videos = state['total']
+            page = state['next_page']
+            seen_bvids = state['seen_bvids']
+            merge_from = state['merge_from']
+        else:
+            # 增量模式以上一次的完整结果为基础，已知视频不再重复保存
+            merge_from = find_latest_final(self.output_dir, uid) if self.incremental else None
+            if merge_from:
+                log.info('incremental_base', "📚 增量爬取，基于上次结果：{path}", uid=uid, path=merge_from)
+            save_filepath = self.init_save_file(uid, merge_from)
+            if not save_filepath:
+                return 0
+            total_videos = 0
+            page = 1
+            seen_bvids = load_known_bvids(merge_from) if merge_from else set()
+
+        log.info('crawl_start', "开始爬取视频列表...", uid=uid, page=page)
+
+        stream = self.iter_video_pages(uid, page, seen_bvids, stop_on_known=bool(merge_from))
+        save_failed = False
+        for video_page in stream:
+            # 立即保存到文件
+            if not self.append_videos_to_file(save_filepath, video_page.videos, video_page.page):
+                log.error('save_failed', "❌ 第 {page} 页保存失败", uid=uid, page=video_page.page)
+                save_failed = True
+                page = video_page.page
                 break
+            total_videos += len(video_page.videos)
+            log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                     uid=uid, page=video_page.page, videos=len(video_page.videos), total=total_videos)
+        else:
+            page = stream.next_page
+            log.info('stream_end', "{description}", uid=uid, page=page,
+                     outcome=stream.stop_reason, description=stream.describe())
+        completed = stream.completed and not save_failed
+
+        # 完成保存；中途失败时保留未完成的文件，下次运行可断点续传
+        if completed and merge_from and total_videos == 0:
+            # 增量爬取没有新投稿，上次的结果就是最新的，不再生成重复文件
+            os.remove(save_filepath)
+            log.info('up_to_date', "✅ 没有新投稿，上次结果已是最新：{path}", uid=uid, path=merge_from)
+        elif completed:
+            self.finalize_save_file(save_filepath)
+        else:
+            log.warning('incomplete', "⏸️  爬取未完成，已保存 {total} 个视频，再次运行将从第 {page} 页继续",
+                        uid=uid, page=page, total=total_videos)
 
-            # 处理每个视频信息
-            page_videos = []
-            for video_info in videos:
-                video_data = {
-                    'aid': video_info.get('aid'),
-                    'bvid': video_info.get('bvid'),
-                    'title': video_info.get('title'),
-                    'url': f"https://www.bilibili.com/video/{video_info.get('bvid')}",
-                    'duration': video_info.get('length'),
-                    'created': video_info.get('created'),
-                    'view': video_info.get('play'),
-                    'danmaku': video_info.get('video_review'),
-                    'reply': video_info.get('comment'),
-                    'pic': video_info.get('pic'),
-                    'description': video_info.get('description', '')
-                }
-                page_videos.append(video_data)
+        return total_videos
 
-            # 立即保存到文件
-            if self.append_videos_to_file(save_filepath, page_videos):
-                total_videos += len(page_videos)
-                print(f"✅ 第 {page} 页完成：{len(page_videos)} 个视频，总计 {total_videos} 个")
-            else:
-                print(f"❌ 第 {page} 页保存失败")
-                break
+    def iter_video_pages(self, uid: int, start_page: int = 1,
+                         seen_bvids: Optional[Set[str]] = None,
+                         stop_on_known: bool = False) -> VideoStream:
+        """
+        按页流式获取用户的视频，每处理完一页才请求下一页
 
-            # 检查是否还有更多页面
-            page_info = data.get('page', {})
-            count = page_info.get('count', 0)
-            if count > 0 and total_videos >= count:
-                print(f"✅ 已获取所有 {count} 个视频")
-                break
+        Args:
+            uid: 用户UID
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出
+            stop_on_known: 整页都是已知视频时停止（增量模式）
 
-            # 如果当前页的视频数少于期望，说明没有更多页面了
-            if len(videos) < self.videos_per_page:
-                print(f"✅ 当前页视频数不足，说明已到最后一页")
-                break
+        Returns:
+            视频流，迭代产出每一页视频，调用 cancel() 停止之后的请求
+        """
+        # 请求节奏由限速器控制（设置了 deadline 时按期限安排）；parallel_workers > 1 时第一页之后并发获取
+        return VideoStream(partial(self.get_user_videos, uid), self.videos_per_page, start_page,
+                           seen_bvids, stop_on_known, self.parallel_workers, self.metrics,
+                           create_scheduler(self.deadline, self.rate_limiter, uid))
 
-            page += 1
+    def iter_videos(self, uid: int) -> Iterator[Video]:
+        """
+        逐个产出用户的视频，调用方停止迭代后不再请求之后的页面
 
-        # 完成保存
-        self.finalize_save_file(save_filepath)
+        Args:
+            uid: 用户UID
 
-        return total_videos
+        Yields:
+            视频
+        """
+        return self.iter_video_pages(uid).videos()
 
-    def fetch_all_videos(self, uid: int) -> List[Dict]:
+    def fetch_all_videos(self, uid: int) -> List[Video]:
         """
         获取用户的所有视频（原版本，保留兼容性）
 
@@ -315,111 +459,80 @@ class BilibiliSimpleCrawler:
             所有视频的列表
         """
         all_videos = []
-        page = 1
-
-        print("开始爬取视频列表...")
-
-        while True:
-            # 添加智能请求延迟
-            if page > 1:
-                # 基础延迟 + 随机延迟
-                base_delay = self.request_delay + (page - 1) * 0.5  # 逐页增加延迟
-                random_delay = random.uniform(2, 5)
-                total_delay = base_delay + random_delay
-                print(f"等待 {total_delay:.1f} 秒后获取下一页...")
-                time.sleep(total_delay)
 
-            # 获取当前页视频
-            print(f"正在获取第 {page} 页...")
-            data = self.get_user_videos(uid, page)
+        log.info('crawl_start', "开始爬取视频列表...", uid=uid, page=1)
 
-            if not data:
-                break
-
-            # 提取视频列表
-            videos = data.get('list', {}).get('vlist', [])
-
-            if not videos:
-                print(f"第 {page} 页没有视频，爬取完成")
-                break
-
-            # 处理每个视频信息
-            for video_info in videos:
-                video_data = {
-                    'aid': video_info.get('aid'),
-                    'bvid': video_info.get('bvid'),
-                    'title': video_info.get('title'),
-                    'url': f"https://www.bilibili.com/video/{video_info.get('bvid')}",
-                    'duration': video_info.get('length'),
-                    'created': video_info.get('created'),
-                    'view': video_info.get('play'),
-                    'danmaku': video_info.get('video_review'),
-                    'reply': video_info.get('comment'),
-                    'pic': video_info.get('pic'),
-                    'description': video_info.get('description', '')
-                }
-                all_videos.append(video_data)
-
-            print(f"已获取第 {page} 页，本页 {len(videos)} 个视频，总计 {len(all_videos)} 个视频")
-
-            # 检查是否还有更多页面
-            page_info = data.get('page', {})
-            count = page_info.get('count', 0)
-            if count > 0 and len(all_videos) >= count:
-                print(f"已获取所有 {count} 个视频")
-                break
-
-            # 如果当前页的视频数少于期望，说明没有更多页面了
-            if len(videos) < self.videos_per_page:
-                break
-
-            page += 1
+        stream = self.iter_video_pages(uid)
+        for video_page in stream:
+            all_videos.extend(video_page.videos)
+            log.info('page_done', "已获取第 {page} 页，本页 {videos} 个视频，总计 {total} 个视频",
+                     uid=uid, page=video_page.page, videos=video_page.fetched, total=len(all_videos))
+        log.info('stream_end', "{description}", uid=uid, page=stream.next_page,
+                 outcome=stream.stop_reason, description=stream.describe())
 
         return all_videos
 
-    def init_save_file(self, uid: int) -> str:
+    def init_save_file(self, uid: int, merge_from: Optional[str] = None) -> str:
         """
-        初始化保存文件
+        初始化保存文件（追加写入的JSONL日志）
 
         Args:
             uid: 用户UID
+            merge_from: 增量爬取时上一次的 _final.json，完成时合并
 
         Returns:
             文件路径
         """
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            filepath = create_journal(
+                self.output_dir, uid, page_size=self.videos_per_page, merge_from=merge_from,
+                compression=self.compression
+            )
+            log.info('journal_created', "📝 初始化保存文件：{path}", uid=uid, path=filepath)
+            return filepath
+        except Exception as e:
+            log.error('journal_failed', "❌ 初始化文件失败：{error}", uid=uid, error=e)
+            return ""
 
-        filename = f"videos_{uid}_{timestamp}.json"
-        filepath = os.path.join(self.output_dir, filename)
+    def resume_save_file(self, uid: int) -> Optional[Dict]:
+        """
+        查找未完成的爬取文件，用于断点续传
 
-        # 初始化文件结构
-        init_data = {
-            "user_info": {
-                "uid": uid,
-                "total_videos": 0,
-                "start_time": current_time,
-                "status": "crawling"
-            },
-            "videos": []
-        }
+        Args:
+            uid: 用户UID
+
+        Returns:
+            续传状态（filepath、next_page、total、seen_bvids），没有时返回None
+        """
+        if not self.resume:
+            return None
 
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(init_data, f, ensure_ascii=False, indent=2)
-            print(f"📝 初始化保存文件：{filepath}")
-            return filepath
+            filepath = find_resumable_journal(self.output_dir, uid)
+            if not filepath:
+                return None
+
+            state = load_journal_state(filepath, self.videos_per_page)
+            state['filepath'] = filepath
+            log.info('journal_resumed', "🔁 发现未完成的爬取文件：{path}\n   已保存 {total} 个视频，从第 {page} 页继续",
+                     uid=uid, path=filepath, total=state['total'], page=state['next_page'])
+            return state
+
         except Exception as e:
-            print(f"❌ 初始化文件失败：{e}")
-            return ""
+            log.warning('journal_unreadable', "⚠️  读取未完成的爬取文件失败，重新开始：{error}", uid=uid, error=e)
+            return None
 
-    def append_videos_to_file(self, filepath: str, new_videos: List[Dict]) -> bool:
+    def append_videos_to_file(self, filepath: str, new_videos: List[Dict],
+                              page: Optional[int] = None) -> bool:
         """
         增量添加视频到文件
 
+        每页只在日志末尾追加一行，不会重新读写已保存的数据
+
         Args:
             filepath: 文件路径
             new_videos: 新获取的视频列表
+            page: 页码，为None时按上一页自动递增
 
         Returns:
             是否成功
@@ -428,29 +541,18 @@ class BilibiliSimpleCrawler:
             return True
 
         try:
-            # 读取现有数据
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # 追加新视频
-            data['videos'].extend(new_videos)
-            data['user_info']['total_videos'] = len(data['videos'])
-            data['user_info']['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # 写回文件
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
-            print(f"✅ 已追加 {len(new_videos)} 个视频，总计 {data['user_info']['total_videos']} 个")
+            total = append_journal_page(filepath, new_videos, page)
+            log.info('page_saved', "✅ 已追加 {videos} 个视频，总计 {total} 个",
+                     page=page, videos=len(new_videos), total=total)
             return True
 
         except Exception as e:
-            print(f"❌ 追加视频失败：{e}")
+            log.error('save_failed', "❌ 追加视频失败：{error}", page=page, error=e)
             return False
 
     def finalize_save_file(self, filepath: str) -> str:
         """
-        完成文件保存
+        完成文件保存，流式导出为 _final.json
 
         Args:
             filepath: 文件路径
@@ -459,35 +561,28 @@ class BilibiliSimpleCrawler:
             最终文件路径
         """
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # 更新最终状态
-            data['user_info']['status'] = 'completed'
-            data['user_info']['end_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            final_path, user_info = finalize_journal(filepath)
 
-            # 重命名文件，加上最终标记
-            dir_path = os.path.dirname(filepath)
-            base_name = os.path.basename(filepath)
-            final_name = base_name.replace('.json', '_final.json')
-            final_path = os.path.join(dir_path, final_name)
-
-            with open(final_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
-            # 删除临时文件
-            os.remove(filepath)
-
-            print(f"\n🎉 最终文件已保存：{final_path}")
-            print(f"📊 总计爬取 {data['user_info']['total_videos']} 个视频")
+            log.info('finalized', "\n🎉 最终文件已保存：{path}\n📊 总计爬取 {total} 个视频",
+                     path=final_path, total=user_info['total_videos'])
 
             return final_path
 
         except Exception as e:
-            print(f"❌ 完成保存失败：{e}")
+            log.error('finalize_failed', "❌ 完成保存失败：{error}", path=filepath, error=e)
             return filepath
 
-    def save_to_json(self, uid: int, videos: List[Dict]) -> str:
+    def has_saved_videos(self, uid: int) -> bool:
+        """是否已有该用户之前爬取的结果（_final.json 或数据库中的视频）"""
+        if self.storage == 'sqlite':
+            database = VideoDatabase(self.db_path)
+            try:
+                return database.count_videos(uid) > 0
+            finally:
+                database.close()
+        return find_latest_final(self.output_dir, uid) is not None
+
+    def save_to_json(self, uid: int, videos: List[Video]) -> str:
         """
         保存数据到JSON文件（兼容旧版本）
 
@@ -507,7 +602,7 @@ class BilibiliSimpleCrawler:
                 "total_videos": len(videos),
                 "crawl_time": current_time
             },
-            "videos": videos
+            "videos": video_dicts(videos)
         }
 
         filename = f"videos_{uid}_{timestamp}.json"
@@ -555,10 +650,14 @@ class BilibiliSimpleCrawler:
         print("=" * 50)
         print("💾 使用增量保存模式，数据会实时保存到文件")
 
+        # 本次运行的请求指标从这里开始统计
+        metrics_baseline = self.metrics.snapshot()
+
         # 获取用户信息（测试连接）
         test_data = self.get_user_info(uid)
         if not test_data:
             print("\n获取用户信息失败，请检查UID是否正确")
+            print_metrics_summary(self.metrics, metrics_baseline)
             return False
 
         print(f"✅ 连接成功！")
@@ -566,8 +665,12 @@ class BilibiliSimpleCrawler:
 
         # 使用增量保存模式爬取视频
         total_videos = self.fetch_all_videos_with_incremental_save(uid)
+        print_metrics_summary(self.metrics, metrics_baseline)
 
         if total_videos == 0:
+            if self.incremental and self.has_saved_videos(uid):
+                print("\n✅ 没有新投稿，数据已是最新")
+                return True
             print("\n❌ 没有找到任何视频")
             return False
 
@@ -576,8 +679,15 @@ class BilibiliSimpleCrawler:
         # 显示最终统计信息
         print("\n📊 最终统计：")
         print(f"- 总视频数：{total_videos}")
-        print("- 数据已保存到 output/ 文件夹")
-        print("- 文件名格式：videos_{uid}_时间戳_final.json")
+        if self.storage == 'sqlite':
+            print(f"- 数据已保存到数据库：{self.db_path}")
+            print(f"- 导出JSON：python bilibili_database.py export {uid}")
+        elif self.storage == 'snapshot':
+            print(f"- 计数快照已记录到：{self.snapshot_path}")
+            print(f"- 查看变化：python bilibili_snapshots.py query {uid} --days 30")
+        else:
+            print("- 数据已保存到 output/ 文件夹")
+            print("- 文件名格式：videos_{uid}_时间戳_final.json")
 
         print("\n💡 提示：")
         print("- 即使程序中途失败，已爬取的数据也已保存")
@@ -593,17 +703,35 @@ def main():
     print("=" * 50)
     print()
 
-    # 检查是否提供了命令行参数
+    # 检查是否提供了命令行参数，--sqlite 表示写入数据库，--snapshot 表示只记录计数快照，--gzip / --zstd 表示压缩保存
+    # --quiet / --log-level / --log-json 控制日志输出
+    argv = sys.argv[1:]
+    log_options = parse_logging_args(argv)
+    if log_options is None:
+        return
+    configure_logging(**log_options)
+    args = [arg for arg in argv if arg not in ('--sqlite', '--snapshot', '--gzip', '--zstd')]
     uid = None
-    if len(sys.argv) > 1:
+    if args:
         try:
-            uid = int(sys.argv[1])
+            uid = int(args[0])
         except ValueError:
             print("错误：命令行参数必须是数字UID")
             return
 
     # 创建爬虫实例并运行
     crawler = BilibiliSimpleCrawler()
+    if '--sqlite' in sys.argv:
+        crawler.storage = 'sqlite'
+    elif '--snapshot' in sys.argv:
+        crawler.storage = 'snapshot'
+        # 缓存中的计数可能是几分钟前的，快照需要当前的计数
+        if crawler.transport.cache is not None:
+            crawler.transport.cache.bypass = True
+    if '--zstd' in sys.argv:
+        crawler.compression = 'zstd'
+    elif '--gzip' in sys.argv:
+        crawler.compression = 'gzip'
     success = crawler.run(uid)
 
     if success:
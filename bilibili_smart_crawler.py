@@ -15,8 +15,28 @@ import time
 import random
 import requests
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Set
 import warnings
+from functools import partial
+
+from bilibili_breaker import CircuitOpenError
+from bilibili_log import configure_logging, get_logger, parse_logging_args
+from bilibili_metrics import SLEEP_RETRY, print_metrics_summary
+from bilibili_rate_limiter import (
+    AdaptiveRateLimiter, THROTTLE_HTTP_STATUS, get_shared_rate_limiter, is_throttle_response
+)
+from bilibili_scheduler import create_scheduler
+from bilibili_transport import (
+    BilibiliTransport, USER_AGENTS, api_url, get_shared_transport, random_headers
+)
+from bilibili_database import DEFAULT_DB_PATH, VideoDatabase, crawl_to_database
+from bilibili_snapshots import DEFAULT_SNAPSHOT_PATH, SnapshotStore, crawl_to_snapshots
+from bilibili_storage import (
+    append_journal_page, create_journal, finalize_journal,
+    find_latest_final, find_resumable_journal, load_journal_state, load_known_bvids
+)
+from bilibili_stream import VideoStream
+from bilibili_video import Video, video_dicts
 
 # 禁用SSL警告
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
@@ -26,119 +46,157 @@ try:
 except ImportError:
     pass
 
+log = get_logger('smart')
+
 
 class BilibiliSmartCrawler:
     """B站视频爬虫类（智能版本）"""
 
-    def __init__(self):
-        """初始化爬虫配置"""
+    def __init__(self, transport: Optional[BilibiliTransport] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        """初始化爬虫配置（transport 和 rate_limiter 默认使用进程内共享的实例）"""
+        self.transport = transport or get_shared_transport()
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = self.transport.metrics  # 请求指标（与传输层共用）
         self.max_retries = 10  # 最大重试次数
-        self.base_retry_delay = 15  # 基础重试延迟
-        self.base_request_delay = 8  # 基础请求间隔
+        self.base_retry_delay = 15  # 网络错误时的重试延迟
         self.videos_per_page = 5  # 每页视频数量（非常少）
+        self.parallel_workers = 1  # 得知总数后并发获取剩余页面的线程数，1为逐页获取
         self.output_dir = "./output"
         self.consecutive_failures = 0  # 连续失败计数
         self.last_success_time = None  # 上次成功时间
+        self.resume = True  # 发现未完成的爬取文件时断点续传
+        self.incremental = False  # 增量爬取：遇到整页已知视频即停止，并与上次结果合并
+        self.compression = None  # 日志和 _final.json 的压缩格式：None、gzip 或 zstd（需要 zstandard）
+        self.deadline = None  # 每个UP主的时间预算（秒）：按期限均匀安排每页请求，赶不上时提前警告
+        self.storage = 'json'  # 存储后端：json（JSONL日志 + _final.json）、sqlite（按bvid更新的数据库）或 snapshot（只记录计数快照）
+        self.db_path = DEFAULT_DB_PATH  # sqlite 后端的数据库文件
+        self.snapshot_path = DEFAULT_SNAPSHOT_PATH  # snapshot 后端的快照数据库
 
         # 多个User-Agent轮换
-        self.user_agents = [
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        ]
+        self.user_agents = list(USER_AGENTS)
 
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
 
     def get_random_headers(self):
         """获取随机请求头"""
-        user_agent = random.choice(self.user_agents)
-        return {
-            'User-Agent': user_agent,
-            'Referer': 'https://www.bilibili.com/',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': f'zh-CN,zh;q=0.{random.randint(8,9)},en;q=0.{random.randint(6,8)}',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache',
-            'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': random.choice(['"macOS"', '"Windows"', '"Linux"']),
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-site',
-            'Origin': 'https://www.bilibili.com'
-        }
-
-    def smart_delay(self, base_delay, page=1):
-        """智能延迟计算"""
-        # 基础延迟 + 页数影响 + 随机因素 + 连续失败影响
-        page_factor = min(page * 2, 30)  # 页数影响，最多30秒
-        failure_factor = min(self.consecutive_failures * 10, 120)  # 失败影响，最多120秒
-
-        total_delay = base_delay + page_factor + failure_factor + random.uniform(5, 15)
-
-        print(f"⏱️  智能延迟 {total_delay:.1f} 秒 (页数:{page}, 失败:{self.consecutive_failures})")
-        time.sleep(total_delay)
+        headers = random_headers()
+        headers['User-Agent'] = random.choice(self.user_agents)
+        return headers
+
+    def smart_delay(self):
+        """智能延迟：等待限速器发放令牌，速率根据限流情况自动调整"""
+        wait = self.rate_limiter.acquire()
+        self.metrics.record_sleep(wait)
+        if wait >= 1:
+            log.info('rate_wait', "⏱️  限速等待 {delay:.1f} 秒 (当前速率:{rate:.2f}次/秒, 失败:{failures})",
+                     delay=wait, rate=self.rate_limiter.rate, failures=self.consecutive_failures)
 
     def make_request(self, url, params=None, description="请求"):
         """发送HTTP请求"""
+        # 日志字段：请求的UID和页码
+        uid = params.get('mid') if params else None
+        page = params.get('pn') if params else None
+
+        # 缓存命中时直接使用，不消耗限速配额
+        cached = self.transport.cached_json(url, params)
+        if cached is not None:
+            if cached.get('code') == 0:
+                return cached.get('data', {})
+            log.error('request_failed', "❌ {description}失败（缓存）：{error}", uid=uid, page=page,
+                      description=description, error=cached.get('message', '未知错误'),
+                      outcome='cached_error')
+            return None
+
         for attempt in range(self.max_retries):
+            network_error = False
+            if attempt > 0:
+                self.metrics.record_retry()
             try:
-                if attempt > 0:
-                    self.smart_delay(self.base_retry_delay)
+                self.smart_delay()
 
                 # 每次都使用新的请求头
                 headers = self.get_random_headers()
 
-                print(f"🌐 正在{description} (尝试 {attempt + 1}/{self.max_retries})")
+                log.info('request', "🌐 正在{description} (尝试 {attempt}/{max_retries})",
+                         uid=uid, page=page, description=description, attempt=attempt + 1,
+                         max_retries=self.max_retries)
 
-                response = requests.get(
+                data = self.transport.get_json(
                     url,
                     params=params,
                     headers=headers,
-                    timeout=30,
-                    verify=False
+                    timeout=30
                 )
-                response.raise_for_status()
-                data = response.json()
 
                 if data.get('code') == 0:
                     self.consecutive_failures = 0  # 重置失败计数
                     self.last_success_time = time.time()
+                    self.rate_limiter.on_success()
                     return data.get('data', {})
+                elif is_throttle_response(data):
+                    self.consecutive_failures += 1
+                    self.rate_limiter.on_throttle()
+                    log.warning('throttle', "⚠️  触发频率限制，降速至 {rate:.2f} 次/秒",
+                                uid=uid, page=page, attempt=attempt + 1, rate=self.rate_limiter.rate,
+                                outcome='throttle')
+                    continue
                 else:
                     error_msg = data.get('message', '未知错误')
-                    if '频繁' in error_msg or '频率' in error_msg or '上限' in error_msg:
-                        self.consecutive_failures += 1
-                        wait_time = 60 + self.consecutive_failures * 30  # 递增等待时间
-                        print(f"⚠️  触发频率限制，等待 {wait_time} 秒...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        print(f"❌ {description}失败：{error_msg}")
-                        self.consecutive_failures += 1
-                        return None
-
+                    log.error('request_failed', "❌ {description}失败：{error}", uid=uid, page=page,
+                              attempt=attempt + 1, description=description, error=error_msg,
+                              outcome='api_error')
+                    self.consecutive_failures += 1
+                    return None
+
+            except CircuitOpenError as e:
+                # 接口熔断中：不再等待重试，把时间留给其他UID
+                log.warning('circuit_rejected', "🚧 {description}跳过：接口熔断中，{retry_in:.0f} 秒后才能再试",
+                            uid=uid, page=page, description=description, key=e.key, retry_in=e.retry_in,
+                            outcome='circuit_open')
+                return None
+            except requests.exceptions.HTTPError as e:
+                self.consecutive_failures += 1
+                status = e.response.status_code if e.response is not None else None
+                if status in THROTTLE_HTTP_STATUS:
+                    self.rate_limiter.on_throttle()
+                    log.warning('throttle', "⚠️  HTTP {status} 限流，降速至 {rate:.2f} 次/秒",
+                                uid=uid, page=page, attempt=attempt + 1, status=status,
+                                rate=self.rate_limiter.rate, outcome='throttle')
+                else:
+                    log.warning('http_error', "❌ {description}HTTP错误：{error}", uid=uid, page=page,
+                                attempt=attempt + 1, description=description, status=status, error=e,
+                                outcome='http_error')
+                    network_error = True
             except requests.exceptions.Timeout:
-                print(f"⏰ {description}超时")
+                log.warning('timeout', "⏰ {description}超时", uid=uid, page=page,
+                            attempt=attempt + 1, description=description, outcome='timeout')
                 self.consecutive_failures += 1
+                network_error = True
             except requests.exceptions.ConnectionError:
-                print(f"🔌 {description}连接错误")
+                log.warning('connection_error', "🔌 {description}连接错误", uid=uid, page=page,
+                            attempt=attempt + 1, description=description, outcome='connection_error')
                 self.consecutive_failures += 1
+                network_error = True
             except Exception as e:
-                print(f"❌ {description}异常：{e}")
+                log.warning('request_error', "❌ {description}异常：{error}", uid=uid, page=page,
+                            attempt=attempt + 1, description=description, error=e, outcome='error')
                 self.consecutive_failures += 1
+                network_error = True
+
+            # 网络错误不是限流信号，不降低速率，只稍等后重试
+            if network_error and attempt < self.max_retries - 1:
+                time.sleep(self.base_retry_delay)
+                self.metrics.record_sleep(self.base_retry_delay, SLEEP_RETRY)
 
-        print(f"💥 {description}失败，已达到最大重试次数")
+        log.error('retries_exhausted', "💥 {description}失败，已达到最大重试次数",
+                  uid=uid, page=page, description=description, outcome='gave_up')
         return None
 
     def get_user_info(self, uid: int) -> bool:
         """检查用户是否存在"""
-        url = f"https://api.bilibili.com/x/space/arc/search"
+        url = api_url("/x/space/arc/search")
         params = {
             'mid': uid,
             'ps': 1,
@@ -148,253 +206,231 @@ class BilibiliSmartCrawler:
         data = self.make_request(url, params, f"检查用户 {uid}")
         return data is not None
 
-    def init_save_file(self, uid: int) -> str:
-        """初始化保存文件"""
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        filename = f"videos_{uid}_{timestamp}.json"
-        filepath = os.path.join(self.output_dir, filename)
-
-        init_data = {
-            "user_info": {
-                "uid": uid,
-                "total_videos": 0,
-                "start_time": current_time,
-                "status": "crawling",
-                "crawler_version": "smart_v1.0"
-            },
-            "videos": []
+    def get_user_videos(self, uid: int, page: int = 1) -> Optional[Dict]:
+        """获取用户视频列表（分页），失败返回None"""
+        url = api_url("/x/space/arc/search")
+        params = {
+            'mid': uid,
+            'ps': self.videos_per_page,
+            'pn': page,
+            'order': 'pubdate'
         }
 
+        return self.make_request(url, params, f"获取第 {page} 页")
+
+    def init_save_file(self, uid: int, merge_from: Optional[str] = None) -> str:
+        """初始化保存文件（追加写入的JSONL日志），merge_from 为增量爬取的基础文件"""
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(init_data, f, ensure_ascii=False, indent=2)
-            print(f"📝 初始化保存文件：{filepath}")
+            filepath = create_journal(
+                self.output_dir, uid, {"crawler_version": "smart_v1.0"},
+                page_size=self.videos_per_page, merge_from=merge_from, compression=self.compression
+            )
+            log.info('journal_created', "📝 初始化保存文件：{path}", uid=uid, path=filepath)
             return filepath
         except Exception as e:
-            print(f"❌ 初始化文件失败：{e}")
+            log.error('journal_failed', "❌ 初始化文件失败：{error}", uid=uid, error=e)
             return ""
 
-    def append_videos_to_file(self, filepath: str, new_videos: List[Dict]) -> bool:
-        """增量添加视频到文件"""
-        if not new_videos:
-            return True
+    def resume_save_file(self, uid: int) -> Optional[Dict]:
+        """查找未完成的爬取文件，返回续传状态（没有时返回None）"""
+        if not self.resume:
+            return None
 
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            filepath = find_resumable_journal(self.output_dir, uid)
+            if not filepath:
+                return None
 
-            data['videos'].extend(new_videos)
-            data['user_info']['total_videos'] = len(data['videos'])
-            data['user_info']['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            state = load_journal_state(filepath, self.videos_per_page)
+            state['filepath'] = filepath
+            log.info('journal_resumed', "🔁 发现未完成的爬取文件：{path}\n   已保存 {total} 个视频，从第 {page} 页继续",
+                     uid=uid, path=filepath, total=state['total'], page=state['next_page'])
+            return state
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            log.warning('journal_unreadable', "⚠️  读取未完成的爬取文件失败，重新开始：{error}", uid=uid, error=e)
+            return None
 
-            print(f"✅ 已追加 {len(new_videos)} 个视频，总计 {data['user_info']['total_videos']} 个")
+    def append_videos_to_file(self, filepath: str, new_videos: List[Dict],
+                              page: Optional[int] = None) -> bool:
+        """增量添加视频到文件（只追加一行，不重写已有数据）"""
+        if not new_videos:
+            return True
+
+        try:
+            total = append_journal_page(filepath, new_videos, page)
+            log.info('page_saved', "✅ 已追加 {videos} 个视频，总计 {total} 个",
+                     page=page, videos=len(new_videos), total=total)
             return True
 
         except Exception as e:
-            print(f"❌ 追加视频失败：{e}")
+            log.error('save_failed', "❌ 追加视频失败：{error}", page=page, error=e)
             return False
 
     def finalize_save_file(self, filepath: str) -> str:
-        """完成文件保存"""
+        """完成文件保存，流式导出为 _final.json"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            data['user_info']['status'] = 'completed'
-            data['user_info']['end_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            dir_path = os.path.dirname(filepath)
-            base_name = os.path.basename(filepath)
-            final_name = base_name.replace('.json', '_final.json')
-            final_path = os.path.join(dir_path, final_name)
-
-            with open(final_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
-            os.remove(filepath)
+            final_path, user_info = finalize_journal(filepath)
 
-            print(f"\n🎉 最终文件已保存：{final_path}")
-            print(f"📊 总计爬取 {data['user_info']['total_videos']} 个视频")
+            log.info('finalized', "\n🎉 最终文件已保存：{path}\n📊 总计爬取 {total} 个视频",
+                     path=final_path, total=user_info['total_videos'])
 
             return final_path
 
         except Exception as e:
-            print(f"❌ 完成保存失败：{e}")
+            log.error('finalize_failed', "❌ 完成保存失败：{error}", path=filepath, error=e)
             return filepath
 
-    def fetch_all_videos(self, uid: int) -> List[Dict]:
+    def iter_video_pages(self, uid: int, start_page: int = 1,
+                         seen_bvids: Optional[Set[str]] = None,
+                         stop_on_known: bool = False) -> VideoStream:
+        """
+        按页流式获取用户的视频，每处理完一页才请求下一页
+
+        Args:
+            uid: 用户UID
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+
+        Returns:
+            视频流，迭代产出每一页视频，调用 cancel() 停止之后的请求
+        """
+        return VideoStream(partial(self.get_user_videos, uid), self.videos_per_page, start_page,
+                           seen_bvids, stop_on_known, self.parallel_workers, self.metrics,
+                           create_scheduler(self.deadline, self.rate_limiter, uid))
+
+    def iter_videos(self, uid: int) -> Iterator[Video]:
+        """逐个产出用户的视频，调用方停止迭代后不再请求之后的页面"""
+        return self.iter_video_pages(uid).videos()
+
+    def fetch_all_videos(self, uid: int) -> List[Video]:
         """获取用户的所有视频（保留兼容性）"""
         all_videos = []
-        page = 1
 
-        print(f"\n🎬 开始爬取用户 {uid} 的视频列表")
-        print("=" * 60)
+        log.info('crawl_start', "\n🎬 开始爬取用户 {uid} 的视频列表\n" + "=" * 60, uid=uid)
 
         if not self.get_user_info(uid):
-            print(f"❌ 用户 {uid} 不存在或没有公开视频")
+            log.error('not_found', "❌ 用户 {uid} 不存在或没有公开视频", uid=uid, outcome='not_found')
             return []
 
-        while True:
-            if page > 1:
-                self.smart_delay(self.base_request_delay, page)
+        stream = self.iter_video_pages(uid)
+        for video_page in stream:
+            all_videos.extend(video_page.videos)
+            log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                     uid=uid, page=video_page.page, videos=video_page.fetched, total=len(all_videos))
+        log.info('stream_end', "{description}", uid=uid, page=stream.next_page,
+                 outcome=stream.stop_reason, description=stream.describe())
 
-            url = "https://api.bilibili.com/x/space/arc/search"
-            params = {
-                'mid': uid,
-                'ps': self.videos_per_page,
-                'pn': page,
-                'order': 'pubdate'
-            }
-
-            data = self.make_request(url, params, f"获取第 {page} 页")
-
-            if not data:
-                print(f"🛑 无法获取第 {page} 页，停止爬取")
-                break
-
-            videos = data.get('list', {}).get('vlist', [])
+        return all_videos
 
-            if not videos:
-                print(f"✅ 第 {page} 页没有视频，爬取完成")
-                break
+    def fetch_all_videos_to_database(self, uid: int) -> int:
+        """获取用户的所有视频并逐页写入SQLite数据库，返回本次保存的视频数"""
+        log.info('crawl_start', "\n🎬 开始爬取用户 {uid} 的视频列表\n" + "=" * 60, uid=uid)
 
-            for i, video_info in enumerate(videos):
-                video_data = {
-                    'aid': video_info.get('aid'),
-                    'bvid': video_info.get('bvid'),
-                    'title': video_info.get('title'),
-                    'url': f"https://www.bilibili.com/video/{video_info.get('bvid')}",
-                    'duration': video_info.get('length'),
-                    'created': video_info.get('created'),
-                    'view': video_info.get('play'),
-                    'danmaku': video_info.get('video_review'),
-                    'reply': video_info.get('comment'),
-                    'pic': video_info.get('pic'),
-                    'description': video_info.get('description', '')
-                }
-                all_videos.append(video_data)
-
-                if i < len(videos) - 1:
-                    time.sleep(random.uniform(1, 3))
-
-            print(f"✅ 第 {page} 页完成：{len(videos)} 个视频，总计 {len(all_videos)} 个")
-
-            page_info = data.get('page', {})
-            count = page_info.get('count', 0)
-            if count > 0 and len(all_videos) >= count:
-                print(f"✅ 已获取所有 {count} 个视频")
-                break
+        if not self.get_user_info(uid):
+            log.error('not_found', "❌ 用户 {uid} 不存在或没有公开视频", uid=uid, outcome='not_found')
+            return 0
 
-            if len(videos) < self.videos_per_page:
-                print(f"✅ 当前页视频数不足，说明已到最后一页")
-                break
+        database = VideoDatabase(self.db_path)
+        try:
+            return crawl_to_database(self, uid, database)
+        finally:
+            database.close()
 
-            page += 1
+    def fetch_all_videos_to_snapshots(self, uid: int) -> int:
+        """获取用户的所有视频，只把计数记录为一次快照，返回本次记录的视频数"""
+        log.info('crawl_start', "\n🎬 开始爬取用户 {uid} 的视频列表\n" + "=" * 60, uid=uid)
 
-            if page % 3 == 1:
-                print(f"☕ 已爬取 {page-1} 页，强制休息 60 秒...")
-                time.sleep(60)
+        if not self.get_user_info(uid):
+            log.error('not_found', "❌ 用户 {uid} 不存在或没有公开视频", uid=uid, outcome='not_found')
+            return 0
 
-        return all_videos
+        store = SnapshotStore(self.snapshot_path)
+        try:
+            return crawl_to_snapshots(self, uid, store)
+        finally:
+            store.close()
 
     def fetch_all_videos_with_incremental_save(self, uid: int) -> int:
         """获取用户的所有视频并增量保存"""
-        save_filepath = self.init_save_file(uid)
-        if not save_filepath:
-            return 0
-
-        total_videos = 0
-        page = 1
+        if self.storage == 'sqlite':
+            return self.fetch_all_videos_to_database(uid)
+        if self.storage == 'snapshot':
+            return self.fetch_all_videos_to_snapshots(uid)
 
-        print(f"\n🎬 开始爬取用户 {uid} 的视频列表")
-        print("=" * 60)
-        print("💾 使用增量保存模式，数据会实时保存到文件")
+        log.info('crawl_start', "\n🎬 开始爬取用户 {uid} 的视频列表\n" + "=" * 60, uid=uid)
 
+        # 先确认用户存在，避免为不存在或无法访问的UID留下空的日志文件（之后会被当作可续传的爬取）
         if not self.get_user_info(uid):
-            print(f"❌ 用户 {uid} 不存在或没有公开视频")
+            log.error('not_found', "❌ 用户 {uid} 不存在或没有公开视频", uid=uid, outcome='not_found')
             return 0
 
-        print("\n📝 注意：数据会实时保存，即使程序中断也不会丢失已爬取的数据\n")
-
-        while True:
-            if page > 1:
-                self.smart_delay(self.base_request_delay, page)
-
-            url = "https://api.bilibili.com/x/space/arc/search"
-            params = {
-                'mid': uid,
-                'ps': self.videos_per_page,
-                'pn': page,
-                'order': 'pubdate'
-            }
-
-            data = self.make_request(url, params, f"获取第 {page} 页")
-
-            if not data:
-                print(f"🛑 无法获取第 {page} 页，停止爬取")
-                break
-
-            videos = data.get('list', {}).get('vlist', [])
-
-            if not videos:
-                print(f"✅ 第 {page} 页没有视频，爬取完成")
-                break
-
-            page_videos = []
-            for i, video_info in enumerate(videos):
-                video_data = {
-                    'aid': video_info.get('aid'),
-                    'bvid': video_info.get('bvid'),
-                    'title': video_info.get('title'),
-                    'url': f"https://www.bilibili.com/video/{video_info.get('bvid')}",
-                    'duration': video_info.get('length'),
-                    'created': video_info.get('created'),
-                    'view': video_info.get('play'),
-                    'danmaku': video_info.get('video_review'),
-                    'reply': video_info.get('comment'),
-                    'pic': video_info.get('pic'),
-                    'description': video_info.get('description', '')
-                }
-                page_videos.append(video_data)
-
-                if i < len(videos) - 1:
-                    time.sleep(random.uniform(1, 3))
-
+        # 优先从未完成的文件断点续传
+        state = self.resume_save_file(uid)
+        if state:
+            save_filepath = state['filepath']
+            total_videos = state['total']
+            page = state['next_page']
+            seen_bvids = state['seen_bvids']
+            merge_from = state['merge_from']
+        else:
+            # 增量模式以上一次的完整结果为基础，已知视频不再重复保存
+            merge_from = find_latest_final(self.output_dir, uid) if self.incremental else None
+            if merge_from:
+                log.info('incremental_base', "📚 增量爬取，基于上次结果：{path}", uid=uid, path=merge_from)
+            save_filepath = self.init_save_file(uid, merge_from)
+            if not save_filepath:
+                return 0
+            total_videos = 0
+            page = 1
+            seen_bvids = load_known_bvids(merge_from) if merge_from else set()
+
+        log.info('incremental_mode', "💾 使用增量保存模式，数据会实时保存到文件", uid=uid)
+        log.info('incremental_note', "\n📝 注意：数据会实时保存，即使程序中断也不会丢失已爬取的数据\n", uid=uid)
+
+        stream = self.iter_video_pages(uid, page, seen_bvids, stop_on_known=bool(merge_from))
+        save_failed = False
+        for video_page in stream:
             # 立即保存到文件
-            if self.append_videos_to_file(save_filepath, page_videos):
-                total_videos += len(page_videos)
-                print(f"✅ 第 {page} 页完成：{len(page_videos)} 个视频，总计 {total_videos} 个")
-            else:
-                print(f"❌ 第 {page} 页保存失败")
+            if not self.append_videos_to_file(save_filepath, video_page.videos, video_page.page):
+                log.error('save_failed', "❌ 第 {page} 页保存失败", uid=uid, page=video_page.page)
+                save_failed = True
+                page = video_page.page
                 break
-
-            page_info = data.get('page', {})
-            count = page_info.get('count', 0)
-            if count > 0 and total_videos >= count:
-                print(f"✅ 已获取所有 {count} 个视频")
-                break
-
-            if len(videos) < self.videos_per_page:
-                print(f"✅ 当前页视频数不足，说明已到最后一页")
-                break
-
-            page += 1
-
-            if page % 3 == 1:
-                print(f"☕ 已爬取 {page-1} 页，强制休息 60 秒...")
-                time.sleep(60)
-
-        # 完成保存
-        self.finalize_save_file(save_filepath)
+            total_videos += len(video_page.videos)
+            log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，总计 {total} 个",
+                     uid=uid, page=video_page.page, videos=len(video_page.videos), total=total_videos)
+        else:
+            page = stream.next_page
+            log.info('stream_end', "{description}", uid=uid, page=page,
+                     outcome=stream.stop_reason, description=stream.describe())
+        completed = stream.completed and not save_failed
+
+        # 完成保存；中途失败时保留未完成的文件，下次运行可断点续传
+        if completed and merge_from and total_videos == 0:
+            # 增量爬取没有新投稿，上次的结果就是最新的，不再生成重复文件
+            os.remove(save_filepath)
+            log.info('up_to_date', "✅ 没有新投稿，上次结果已是最新：{path}", uid=uid, path=merge_from)
+        elif completed:
+            self.finalize_save_file(save_filepath)
+        else:
+            log.warning('incomplete', "⏸️  爬取未完成，已保存 {total} 个视频，再次运行将从第 {page} 页继续",
+                        uid=uid, page=page, total=total_videos)
 
         return total_videos
 
-    def save_to_json(self, uid: int, videos: List[Dict]) -> str:
+    def has_saved_videos(self, uid: int) -> bool:
+        """是否已有该用户之前爬取的结果（_final.json 或数据库中的视频）"""
+        if self.storage == 'sqlite':
+            database = VideoDatabase(self.db_path)
+            try:
+                return database.count_videos(uid) > 0
+            finally:
+                database.close()
+        return find_latest_final(self.output_dir, uid) is not None
+
+    def save_to_json(self, uid: int, videos: List[Video]) -> str:
         """保存数据到JSON文件"""
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -406,7 +442,7 @@ class BilibiliSmartCrawler:
                 "crawl_time": current_time,
                 "crawler_version": "smart_v1.0"
             },
-            "videos": videos
+            "videos": video_dicts(videos)
         }
 
         filename = f"videos_{uid}_{timestamp}.json"
@@ -445,9 +481,14 @@ class BilibiliSmartCrawler:
         print("💾 使用增量保存模式，数据会实时保存到文件")
 
         # 使用增量保存模式爬取视频
+        metrics_baseline = self.metrics.snapshot()
         total_videos = self.fetch_all_videos_with_incremental_save(uid)
+        print_metrics_summary(self.metrics, metrics_baseline)
 
         if total_videos == 0:
+            if self.incremental and self.has_saved_videos(uid):
+                print("\n✅ 没有新投稿，数据已是最新")
+                return True
             print("\n❌ 没有找到任何视频")
             return False
 
@@ -456,8 +497,15 @@ class BilibiliSmartCrawler:
         # 显示最终统计信息
         print(f"\n📊 最终统计：")
         print(f"   总视频数：{total_videos}")
-        print(f"   数据已保存到 output/ 文件夹")
-        print(f"   文件名格式：videos_{uid}_时间戳_final.json")
+        if self.storage == 'sqlite':
+            print(f"   数据已保存到数据库：{self.db_path}")
+            print(f"   导出JSON：python bilibili_database.py export {uid}")
+        elif self.storage == 'snapshot':
+            print(f"   计数快照已记录到：{self.snapshot_path}")
+            print(f"   查看变化：python bilibili_snapshots.py query {uid} --days 30")
+        else:
+            print(f"   数据已保存到 output/ 文件夹")
+            print(f"   文件名格式：videos_{uid}_时间戳_final.json")
 
         print("\n💡 提示：")
         print(f"   - 即使程序中途失败，已爬取的数据也已保存")
@@ -475,17 +523,35 @@ def main():
     print("⚠️  注意：此版本专为绕过反爬虫机制优化，速度较慢但成功率更高")
     print()
 
-    # 检查命令行参数
+    # 检查命令行参数，--sqlite 表示写入数据库，--snapshot 表示只记录计数快照，--gzip / --zstd 表示压缩保存
+    # --quiet / --log-level / --log-json 控制日志输出
+    argv = sys.argv[1:]
+    log_options = parse_logging_args(argv)
+    if log_options is None:
+        return
+    configure_logging(**log_options)
+    args = [arg for arg in argv if arg not in ('--sqlite', '--snapshot', '--gzip', '--zstd')]
     uid = None
-    if len(sys.argv) > 1:
+    if args:
         try:
-            uid = int(sys.argv[1])
+            uid = int(args[0])
         except ValueError:
             print("❌ 命令行参数必须是数字UID")
             return
 
     # 运行爬虫
     crawler = BilibiliSmartCrawler()
+    if '--sqlite' in sys.argv:
+        crawler.storage = 'sqlite'
+    elif '--snapshot' in sys.argv:
+        crawler.storage = 'snapshot'
+        # 缓存中的计数可能是几分钟前的，快照需要当前的计数
+        if crawler.transport.cache is not None:
+            crawler.transport.cache.bypass = True
+    if '--zstd' in sys.argv:
+        crawler.compression = 'zstd'
+    elif '--gzip' in sys.argv:
+        crawler.compression = 'gzip'
     success = crawler.run(uid)
 
     if success:
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 统计快照（时间序列）
+每次爬取只记录视频的计数字段（播放、弹幕、评论），按视频做差分存储，不再为了看增长去对比整个 _final.json
+
+- tracked 表保存每个视频的最新计数；deltas 表只保存与上次相比有变化的视频的增量，没有变化的视频不占空间
+- 一次快照中所有视频使用同一个时间戳；deltas 按 (mid, ts, video) 聚簇存储，
+  某个UP主一段时间内的变化是一段连续的范围
+- 某个时间点的数值 = 最新计数 - 该时间点之后的增量之和，查询最近N天只读取这N天的增量，与历史长度无关
+- 快照中断也不影响一致性：每个增量都相对于该视频上一次记录的数值
+
+使用方法：
+python run.py 435776729 --snapshot                           # 爬取并记录一次快照
+python bilibili_snapshots.py import output/*_final.json      # 把已有的 _final.json 按时间顺序导入
+python bilibili_snapshots.py query 435776729 --days 30       # 最近30天的总播放、弹幕、评论
+python bilibili_snapshots.py query BV1xx411c7mD --days 30    # 单个视频
+python bilibili_snapshots.py stats
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Union
+
+from bilibili_compression import COMPRESSION_SUFFIX_PATTERN
+from bilibili_log import get_logger
+from bilibili_storage import load_final_file
+from bilibili_video import Video, as_video
+
+log = get_logger('snapshots')
+
+# 默认快照数据库，放在输出目录下
+DEFAULT_SNAPSHOT_PATH = "./output/snapshots.db"
+
+# 记录的计数字段
+COUNTER_FIELDS = ('view', 'danmaku', 'reply')
+
+# _final.json 文件名中的爬取时间
+_FINAL_TIME_PATTERN = re.compile(r"videos_\d+_(\d{8}_\d{6})_final\.json" + COMPRESSION_SUFFIX_PATTERN + "$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked (
+    id INTEGER PRIMARY KEY,
+    bvid TEXT NOT NULL UNIQUE,
+    mid INTEGER NOT NULL,
+    view INTEGER NOT NULL DEFAULT 0,
+    danmaku INTEGER NOT NULL DEFAULT 0,
+    reply INTEGER NOT NULL DEFAULT 0,
+    first_seen INTEGER NOT NULL,
+    updated INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracked_mid ON tracked (mid);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    mid INTEGER NOT NULL,
+    taken_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    videos INTEGER NOT NULL DEFAULT 0,
+    changed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (mid, taken_at)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS deltas (
+    mid INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    video INTEGER NOT NULL,
+    view INTEGER NOT NULL,
+    danmaku INTEGER NOT NULL,
+    reply INTEGER NOT NULL,
+    PRIMARY KEY (mid, ts, video)
+) WITHOUT ROWID;
+"""
+
+# 同一快照中重复出现的视频（翻页期间有新投稿时）增量累加
+_INSERT_DELTA = """
+INSERT INTO deltas (mid, ts, video, view, danmaku, reply) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (mid, ts, video) DO UPDATE SET
+    view = view + excluded.view,
+    danmaku = danmaku + excluded.danmaku,
+    reply = reply + excluded.reply
+"""
+
+
+def _counter(value) -> Optional[int]:
+    """计数字段的整数值，接口返回“--”等非数字时为None（视为没有变化）"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def final_file_time(filepath: str) -> int:
+    """
+    _final.json 的爬取时间（时间戳），取自文件名，文件名中没有时使用修改时间
+
+    Args:
+        filepath: _final.json 路径
+
+    Returns:
+        Unix时间戳（秒）
+    """
+    match = _FINAL_TIME_PATTERN.search(os.path.basename(filepath))
+    if match:
+        return int(datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp())
+    return int(os.path.getmtime(filepath))
+
+
+class SnapshotStore:
+    """基于SQLite的差分计数时间序列"""
+
+    def __init__(self, db_path: str = DEFAULT_SNAPSHOT_PATH):
+        """
+        打开（或创建）快照数据库
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 自动提交模式，每页的写入显式开启事务
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def begin_snapshot(self, mid: int, taken_at: Optional[float] = None) -> int:
+        """
+        开始一次快照
+
+        Args:
+            mid: UP主UID
+            taken_at: 快照时间（Unix时间戳），默认为当前时间；当前时间不晚于最新快照时
+                      （同一秒内重复爬取同一个UP主）顺延到最新快照的下一秒
+
+        Returns:
+            快照时间戳（秒），之后 record 时传入
+
+        Raises:
+            ValueError: 指定的快照时间不晚于该UP主已记录的最新快照（增量只能按时间顺序追加）
+        """
+        ts = int(taken_at if taken_at is not None else time.time())
+        latest = self.conn.execute(
+            "SELECT MAX(taken_at) FROM snapshots WHERE mid = ?", (mid,)).fetchone()[0]
+        if latest is not None and ts <= latest and taken_at is None:
+            ts = latest + 1
+        elif latest is not None and ts <= latest:
+            raise ValueError(f"快照时间 {ts} 不晚于UID {mid} 已记录的最新快照 {latest}")
+        self.conn.execute("INSERT INTO snapshots (mid, taken_at) VALUES (?, ?)", (mid, ts))
+        return ts
+
+    def record(self, mid: int, ts: int, videos: Iterable[Union[Video, Dict]]) -> int:
+        """
+        在一个事务中记录一批视频的计数，只写入有变化的视频的增量
+
+        Args:
+            mid: UP主UID
+            ts: begin_snapshot 返回的快照时间戳
+            videos: 视频对象或 _final.json 格式的视频字典
+
+        Returns:
+            有变化（包括首次记录）的视频数
+        """
+        videos = [video for video in map(as_video, videos) if video.bvid]
+        if not videos:
+            return 0
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = {
+                row['bvid']: row for row in self.conn.execute(
+                    "SELECT id, bvid, view, danmaku, reply FROM tracked "
+                    "WHERE bvid IN (SELECT value FROM json_each(?))",
+                    (json.dumps([video.bvid for video in videos]),))
+            }
+            changed = 0
+            for video in videos:
+                row = previous.get(video.bvid)
+                old = tuple(row[name] for name in COUNTER_FIELDS) if row else (0, 0, 0)
+                new = tuple(old[i] if value is None else value for i, value in
+                            enumerate(_counter(getattr(video, name)) for name in COUNTER_FIELDS))
+                if row is None:
+                    video_id = self.conn.execute(
+                        "INSERT INTO tracked (bvid, mid, view, danmaku, reply, first_seen, updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (video.bvid, mid) + new + (ts, ts)).lastrowid
+                    previous[video.bvid] = {'id': video_id, 'view': new[0], 'danmaku': new[1], 'reply': new[2]}
+                elif new != old:
+                    video_id = row['id']
+                    self.conn.execute(
+                        "UPDATE tracked SET view = ?, danmaku = ?, reply = ?, updated = ? WHERE id = ?",
+                        new + (ts, video_id))
+                    previous[video.bvid] = {'id': video_id, 'view': new[0], 'danmaku': new[1], 'reply': new[2]}
+                else:
+                    continue
+                self.conn.execute(_INSERT_DELTA, (mid, ts, video_id) +
+                                  tuple(n - o for n, o in zip(new, old)))
+                changed += 1
+
+            self.conn.execute(
+                "UPDATE snapshots SET videos = videos + ?, changed = changed + ? "
+                "WHERE mid = ? AND taken_at = ?", (len(videos), changed, mid, ts))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return changed
+
+    def finish_snapshot(self, mid: int, ts: int) -> Dict:
+        """
+        标记快照完成
+
+        Returns:
+            快照信息：videos（记录的视频数）、changed（有变化的视频数）
+        """
+        self.conn.execute("UPDATE snapshots SET finished_at = ? WHERE mid = ? AND taken_at = ?",
+                          (int(time.time()), mid, ts))
+        return self.snapshot_info(mid, ts)
+
+    def snapshot_info(self, mid: int, ts: int) -> Optional[Dict]:
+        """某次快照的信息，不存在时返回None"""
+        row = self.conn.execute("SELECT * FROM snapshots WHERE mid = ? AND taken_at = ?",
+                                (mid, ts)).fetchone()
+        return dict(row) if row else None
+
+    def record_snapshot(self, mid: int, videos: Iterable[Union[Video, Dict]],
+                        taken_at: Optional[float] = None) -> Dict:
+        """一次记录一个UP主的全部视频，返回快照信息"""
+        ts = self.begin_snapshot(mid, taken_at)
+        self.record(mid, ts, videos)
+        return self.finish_snapshot(mid, ts)
+
+    def import_final_file(self, filepath: str) -> Dict:
+        """
+        把一个 _final.json 作为一次快照导入，快照时间取自文件名
+
+        Returns:
+            快照信息
+        """
+        data = load_final_file(filepath)
+        mid = data.get('user_info', {}).get('uid')
+        if mid is None:
+            raise ValueError(f"文件中没有UID：{filepath}")
+        return self.record_snapshot(int(mid), data.get('videos', []), final_file_time(filepath))
+
+    def _series(self, mid: int, current: sqlite3.Row, video: Optional[int],
+                since: Optional[float], until: Optional[float]) -> List[Dict]:
+        """按快照时间倒推每个时间点的数值（current 为最新计数）"""
+        points = self.conn.execute(
+            "SELECT taken_at, videos FROM snapshots WHERE mid = ? AND taken_at >= ? AND taken_at <= ? "
+            "ORDER BY taken_at", (mid, int(since or 0), int(until if until is not None else 2 ** 62))
+        ).fetchall()
+        if not points:
+            return []
+
+        # 只需要第一个时间点之后的增量
+        sums = ', '.join(f"SUM({name})" for name in COUNTER_FIELDS)
+        if video is None:
+            rows = self.conn.execute(
+                f"SELECT ts, {sums} FROM deltas WHERE mid = ? AND ts > ? GROUP BY ts",
+                (mid, points[0]['taken_at']))
+        else:
+            rows = self.conn.execute(
+                f"SELECT ts, {sums} FROM deltas WHERE mid = ? AND ts > ? AND video = ? GROUP BY ts",
+                (mid, points[0]['taken_at'], video))
+        changes = {row[0]: tuple(row[1:]) for row in rows}
+
+        value = [current[name] or 0 for name in COUNTER_FIELDS]
+        snapshot_videos = {point['taken_at']: point['videos'] for point in points}
+        series = []
+        for ts in sorted(set(snapshot_videos) | set(changes), reverse=True):
+            if ts in snapshot_videos:
+                point = {"ts": ts}
+                point.update(zip(COUNTER_FIELDS, value))
+                if video is None:
+                    point["videos"] = snapshot_videos[ts]
+                series.append(point)
+            for i, delta in enumerate(changes.get(ts, ())):
+                value[i] -= delta
+        series.reverse()
+        return series
+
+    def uploader_series(self, mid: int, since: Optional[float] = None,
+                        until: Optional[float] = None) -> List[Dict]:
+        """
+        某个UP主所有视频的计数之和，每次快照一个数据点
+
+        Args:
+            mid: UP主UID
+            since: 起始时间（Unix时间戳，含），默认为最早的快照
+            until: 结束时间（含），默认为最新的快照
+
+        Returns:
+            按时间排序的数据点：ts、view、danmaku、reply、videos（该次快照记录的视频数）
+        """
+        current = self.conn.execute(
+            "SELECT SUM(view) AS view, SUM(danmaku) AS danmaku, SUM(reply) AS reply "
+            "FROM tracked WHERE mid = ?", (mid,)).fetchone()
+        return self._series(mid, current, None, since, until)
+
+    def video_series(self, bvid: str, since: Optional[float] = None,
+                     until: Optional[float] = None) -> List[Dict]:
+        """
+        单个视频的计数，每次快照一个数据点（从首次记录该视频开始）
+
+        Args:
+            bvid: 视频bvid
+            since: 起始时间（Unix时间戳，含）
+            until: 结束时间（含）
+
+        Returns:
+            按时间排序的数据点：ts、view、danmaku、reply；未记录过的视频返回空列表
+        """
+        row = self.conn.execute("SELECT * FROM tracked WHERE bvid = ?", (bvid,)).fetchone()
+        if row is None:
+            return []
+        since = max(since or 0, row['first_seen'])
+        return self._series(row['mid'], row, row['id'], since, until)
+
+    def latest_snapshot(self, mid: int) -> Optional[Dict]:
+        """某个UP主最新的快照信息"""
+        row = self.conn.execute(
+            "SELECT * FROM snapshots WHERE mid = ? ORDER BY taken_at DESC LIMIT 1", (mid,)).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        """快照数据库统计信息"""
+        def count(sql: str) -> int:
+            return self.conn.execute(sql).fetchone()[0]
+
+        return {
+            "videos": count("SELECT COUNT(*) FROM tracked"),
+            "uploaders": count("SELECT COUNT(DISTINCT mid) FROM tracked"),
+            "snapshots": count("SELECT COUNT(*) FROM snapshots"),
+            "deltas": count("SELECT COUNT(*) FROM deltas"),
+            # WAL模式下未合并的写入位于 -wal 文件中
+            "bytes": sum(os.path.getsize(path) for path in (self.db_path, self.db_path + '-wal')
+                         if os.path.exists(path))
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+
+def crawl_to_snapshots(crawler, uid: int, store: SnapshotStore) -> int:
+    """
+    用爬虫逐页获取视频，只把计数记录为一次快照，每页一个事务
+
+    快照总是完整爬取（不使用增量模式和断点续传）；中断后已记录的页面保留，下次运行开始新的快照。
+
+    Args:
+        crawler: 爬虫实例（需要提供 iter_video_pages）
+        uid: 用户UID
+        store: 快照数据库
+
+    Returns:
+        本次快照记录的视频数
+    """
+    try:
+        ts = store.begin_snapshot(uid)
+    except (ValueError, sqlite3.Error) as e:
+        # 如另一个进程同时开始了该UP主的快照
+        log.warning('snapshot_skipped', "⚠️  无法开始快照：{error}", uid=uid, error=e, outcome='skipped')
+        return 0
+    log.info('snapshot_target', "📸 计数快照写入：{path}", uid=uid, path=store.db_path)
+
+    stream = crawler.iter_video_pages(uid)
+    recorded = 0
+    write_failed = False
+    for video_page in stream:
+        try:
+            changed = store.record(uid, ts, video_page.videos)
+        except sqlite3.Error as e:
+            log.error('save_failed', "❌ 第 {page} 页写入快照失败：{error}",
+                      uid=uid, page=video_page.page, error=e)
+            stream.cancel()
+            write_failed = True
+            break
+        recorded += len(video_page.videos)
+        log.info('page_done', "✅ 第 {page} 页完成：{videos} 个视频，{changed} 个有变化，总计 {total} 个",
+                 uid=uid, page=video_page.page, videos=len(video_page.videos), changed=changed,
+                 total=recorded)
+    else:
+        log.info('stream_end', "{description}", uid=uid, page=stream.next_page,
+                 outcome=stream.stop_reason, description=stream.describe())
+
+    if stream.completed and not write_failed:
+        info = store.finish_snapshot(uid, ts)
+        log.info('finalized', "\n🎉 快照已记录：{videos} 个视频，其中 {changed} 个有变化",
+                 uid=uid, videos=info['videos'], changed=info['changed'])
+    else:
+        log.warning('incomplete', "⏸️  快照未完成，已记录 {total} 个视频，再次运行将开始新的快照",
+                    uid=uid, total=recorded)
+    return recorded
+
+
+def count_snapshot_videos(db_path: str, uid: int, since: float) -> int:
+    """某次爬取记录到快照中的视频数（该UP主在 since 之后开始的最新快照）"""
+    store = SnapshotStore(db_path)
+    try:
+        info = store.latest_snapshot(uid)
+    finally:
+        store.close()
+    if not info or info['taken_at'] < int(since):
+        return 0
+    return info['videos']
+
+
+def _parse_time(text: str) -> float:
+    """解析 YYYY-MM-DD 或 YYYY-MM-DD HH:MM 格式的时间"""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"无法解析时间：{text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站视频计数快照（时间序列）")
+    parser.add_argument('--db', default=DEFAULT_SNAPSHOT_PATH, help=f"快照数据库（默认 {DEFAULT_SNAPSHOT_PATH}）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="按时间顺序导入 _final.json 作为历史快照")
+    import_parser.add_argument('files', nargs='+')
+
+    query_parser = subparsers.add_parser('query', help="查询UP主（UID）或视频（bvid）的计数变化")
+    query_parser.add_argument('target', help="UID 或 bvid")
+    query_parser.add_argument('--days', type=float, help="最近N天")
+    query_parser.add_argument('--since', type=_parse_time, help="起始时间（YYYY-MM-DD [HH:MM]）")
+    query_parser.add_argument('--until', type=_parse_time, help="结束时间（YYYY-MM-DD [HH:MM]）")
+    query_parser.add_argument('--json', action='store_true', help="按JSON输出数据点")
+
+    subparsers.add_parser('stats', help="快照数据库统计信息")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.db)
+    try:
+        if args.command == 'import':
+            # 增量只能按时间顺序追加，先按文件中的爬取时间排序
+            for filepath in sorted(args.files, key=final_file_time):
+                try:
+                    info = store.import_final_file(filepath)
+                    print(f"📥 {filepath}：{info['videos']} 个视频，{info['changed']} 个有变化")
+                except (OSError, ValueError) as e:
+                    print(f"❌ {filepath}：{e}")
+        elif args.command == 'query':
+            since = args.since
+            if args.days is not None:
+                since = time.time() - args.days * 86400
+            start = time.perf_counter()
+            if args.target.isdigit():
+                series = store.uploader_series(int(args.target), since, args.until)
+            else:
+                series = store.video_series(args.target, since, args.until)
+            elapsed = (time.perf_counter() - start) * 1000
+            if args.json:
+                print(json.dumps(series, ensure_ascii=False))
+            else:
+                for point in series:
+                    taken = datetime.fromtimestamp(point['ts']).strftime("%Y-%m-%d %H:%M")
+                    print(f"{taken}  播放 {point['view']:>12}  弹幕 {point['danmaku']:>9}  评论 {point['reply']:>9}")
+            if series:
+                first, last = series[0], series[-1]
+                print(f"\n📈 {len(series)} 个快照，播放 +{last['view'] - first['view']}，"
+                      f"弹幕 +{last['danmaku'] - first['danmaku']}，评论 +{last['reply'] - first['reply']}，"
+                      f"查询耗时 {elapsed:.1f} 毫秒", file=sys.stderr)
+            else:
+                print("❌ 该时间范围内没有快照", file=sys.stderr)
+        elif args.command == 'stats':
+            stats = store.stats()
+            print(f"📊 {args.db}：{stats['uploaders']} 个UP主，{stats['videos']} 个视频，"
+                  f"{stats['snapshots']} 次快照，{stats['deltas']} 条增量，"
+                  f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,714 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 增量保存日志（journal）
+爬取过程中按页追加写入JSONL日志，完成时流式导出兼容的 _final.json
+
+日志文件格式（每行一条JSON记录）：
+    {"type": "header", "user_info": {...}}          第一行，爬取开始时写入
+    {"type": "page", "page": 1, "total": 10, ...}   每获取一页追加一行
+    {"type": "end", "user_info": {...}}             完成时追加，记录最终的 user_info
+每页追加的开销是固定的，不会随已爬取视频数增长。
+
+完成时先追加结尾记录，再把 _final.json 写入临时文件、fsync 后原子重命名，最后删除日志：
+读取方要么看不到 _final.json，要么看到完整的文件；中途崩溃时，带结尾记录的日志会在下次查找
+续传文件时重新导出，不会留下重复或不完整的结果。
+
+增量爬取时头部记录 merge_from 指向上一次的 _final.json，
+导出时新视频在前，上一次的视频接在后面。
+
+日志和 _final.json 可以压缩（.jsonl.gz / .jsonl.zst，见 bilibili_compression.py）：
+每条记录一个独立的压缩帧，读取时按扩展名自动解压，导出的 _final.json 使用相同的压缩格式。
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import contextlib
+import glob
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bilibili_compression import (
+    COMPRESSION_SUFFIX_PATTERN, close_text_writer, compress_frame, compression_of, open_text,
+    open_text_writer, read_last_frame, require_compression, strip_compression_suffix,
+    truncate_incomplete_frame, with_compression_suffix
+)
+from bilibili_log import get_logger
+from bilibili_video import Video, video_dicts
+
+log = get_logger('storage')
+
+JOURNAL_SUFFIX = ".jsonl"
+FINAL_SUFFIX = "_final.json"
+
+# 从文件尾部反向查找最后一条记录时每次读取的字节数
+_TAIL_BLOCK_SIZE = 8192
+
+
+def _now() -> str:
+    """当前时间字符串（与旧版文件格式一致）"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _encode_record(record: Dict) -> bytes:
+    """将一条日志记录编码为单行JSON"""
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def _append_record(filepath: str, record: Dict, sync: bool = False) -> None:
+    """
+    在日志末尾追加一条记录
+
+    压缩日志的每条记录是一个独立的压缩帧；上次中断留下的不完整内容会先被处理，
+    避免与新记录粘连。
+
+    Args:
+        filepath: 日志文件路径
+        record: 日志记录
+        sync: 是否 fsync 到磁盘
+    """
+    compression = compression_of(filepath)
+    if compression:
+        truncate_incomplete_frame(filepath, compression)
+        with open(filepath, 'ab') as f:
+            f.write(compress_frame(_encode_record(record), compression))
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        return
+
+    with open(filepath, 'a', encoding='utf-8') as f:
+        # 上次中断可能留下未写完的行，先换行避免与新记录粘连
+        if f.tell() > 0 and not _ends_with_newline(filepath):
+            f.write("\n")
+        _write_record(f, record)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+
+
+def _write_record(f, record: Dict) -> None:
+    """写入一条日志记录（单行JSON）"""
+    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+    f.write("\n")
+
+
+def _fsync_directory(path: str) -> None:
+    """同步目录项，确保重命名在断电后依然有效（不支持的平台上忽略）"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_write(filepath: str):
+    """
+    原子写入文本文件：先写入同目录的临时文件，fsync 后重命名为目标文件
+
+    写入过程中读取方看到的始终是旧文件（或没有文件），出错时删除临时文件、不影响旧文件。
+    目标文件以 .gz / .zst 结尾时流式压缩写入。
+
+    Args:
+        filepath: 目标文件路径
+
+    Yields:
+        临时文件对象
+    """
+    compression = compression_of(filepath)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            f = open_text_writer(raw, compression)
+            yield f
+            close_text_writer(f, compression)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(filepath)
+
+
+def _ends_with_newline(filepath: str) -> bool:
+    """检查文件是否以换行结尾"""
+    with open(filepath, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def create_journal(output_dir: str, uid: int, extra_info: Optional[Dict] = None,
+                   page_size: Optional[int] = None, merge_from: Optional[str] = None,
+                   compression: Optional[str] = None) -> str:
+    """
+    创建新的日志文件并写入头部记录
+
+    Args:
+        output_dir: 输出目录
+        uid: 用户UID
+        extra_info: 额外写入 user_info 的字段（如 crawler_version）
+        page_size: 每页视频数，断点续传时用于换算下一页页码
+        merge_from: 增量爬取时上一次的 _final.json 路径，完成时合并其中的视频
+        compression: 压缩格式（gzip / zstd），None 表示不压缩
+
+    Returns:
+        日志文件路径
+    """
+    require_compression(compression)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = with_compression_suffix(
+        os.path.join(output_dir, f"videos_{uid}_{timestamp}{JOURNAL_SUFFIX}"), compression
+    )
+
+    user_info = {
+        "uid": uid,
+        "total_videos": 0,
+        "start_time": _now(),
+        "status": "crawling"
+    }
+    if extra_info:
+        user_info.update(extra_info)
+    if merge_from:
+        user_info["incremental_from"] = os.path.basename(merge_from)
+
+    header = {"type": "header", "user_info": user_info}
+    if page_size:
+        header["page_size"] = page_size
+    if merge_from:
+        header["merge_from"] = merge_from
+
+    with open(filepath, 'wb') as f:
+        f.write(compress_frame(_encode_record(header), compression))
+
+    return filepath
+
+
+def iter_journal_records(filepath: str) -> Iterator[Dict]:
+    """
+    逐条读取日志记录
+
+    程序中断时最后一行（压缩日志的最后一帧）可能只写了一半，这种不完整的记录会被跳过。
+
+    Args:
+        filepath: 日志文件路径
+
+    Yields:
+        日志记录字典
+    """
+    with open_text(filepath, whole_frames=True) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def read_journal_header_record(filepath: str) -> Dict:
+    """读取日志头部记录"""
+    with open_text(filepath, whole_frames=True) as f:
+        record = json.loads(f.readline())
+    if record.get('type') != 'header':
+        raise ValueError(f"不是有效的日志文件：{filepath}")
+    return record
+
+
+def read_journal_header(filepath: str) -> Dict:
+    """读取日志头部记录中的 user_info"""
+    return read_journal_header_record(filepath)['user_info']
+
+
+def read_last_record(filepath: str) -> Optional[Dict]:
+    """
+    从文件尾部反向读取最后一条完整记录
+
+    只读取文件末尾的少量数据，开销与文件大小无关。
+
+    Args:
+        filepath: 日志文件路径
+
+    Returns:
+        最后一条完整记录，文件为空时返回None
+    """
+    compression = compression_of(filepath)
+    if compression:
+        # 每条记录一个帧，最后一个完整的帧就是最后一条记录
+        data, _ = read_last_frame(filepath, compression)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+
+        while pos > 0:
+            step = min(_TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+
+            lines = buf.split(b"\n")
+            # 第一段可能是被截断的行，除非已经读到文件开头
+            candidates = lines if pos == 0 else lines[1:]
+            for line in reversed(candidates):
+                if not line.strip():
+                    continue
+                try:
+                    return json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+            if pos > 0:
+                buf = lines[0]
+
+    return None
+
+
+def append_journal_page(filepath: str, videos: List[Video], page: Optional[int] = None) -> int:
+    """
+    追加一页视频到日志
+
+    Args:
+        filepath: 日志文件路径
+        videos: 本页视频列表
+        page: 页码，为None时自动按上一页递增
+
+    Returns:
+        追加后的视频总数
+    """
+    last = read_last_record(filepath) or {}
+    prev_total = last.get('total', 0) if last.get('type') == 'page' else 0
+    if page is None:
+        page = last.get('page', 0) + 1 if last.get('type') == 'page' else 1
+
+    total = prev_total + len(videos)
+    record = {
+        "type": "page",
+        "page": page,
+        "total": total,
+        "time": _now(),
+        "videos": video_dicts(videos)
+    }
+
+    _append_record(filepath, record)
+
+    return total
+
+
+def final_path_for(filepath: str) -> str:
+    """根据日志路径生成最终文件路径（压缩日志导出为相同格式压缩的 _final.json）"""
+    compression = compression_of(filepath)
+    filepath = strip_compression_suffix(filepath)
+    if filepath.endswith(JOURNAL_SUFFIX):
+        base = filepath[:-len(JOURNAL_SUFFIX)]
+    elif filepath.endswith(".json"):
+        base = filepath[:-len(".json")]
+    else:
+        base = filepath
+    return with_compression_suffix(base + FINAL_SUFFIX, compression)
+
+
+def _indented(obj, level: int) -> str:
+    """按 json.dump(indent=2) 的格式输出嵌套对象"""
+    text = json.dumps(obj, ensure_ascii=False, indent=2)
+    return text.replace("\n", "\n" + " " * level)
+
+
+def write_final_json(filepath: str, user_info: Dict, videos: Iterable[Dict]) -> int:
+    """
+    流式写入 _final.json 格式的文件（原子替换）
+
+    格式与 json.dump(indent=2) 的输出一致，user_info 位于 "videos" 之前，
+    内存中只保留当前正在写入的视频。写入完成前目标文件不会出现或保持旧内容。
+
+    Args:
+        filepath: 输出文件路径
+        user_info: 用户信息
+        videos: 视频（可以是生成器）
+
+    Returns:
+        写入的视频数
+    """
+    count = 0
+    with atomic_write(filepath) as out:
+        out.write('{\n  "user_info": ')
+        out.write(_indented(user_info, 2))
+        out.write(',\n  "videos": [')
+
+        for video in videos:
+            out.write(',\n    ' if count else '\n    ')
+            out.write(_indented(video, 4))
+            count += 1
+
+        out.write('\n  ]\n}' if count else ']\n}')
+    return count
+
+
+def _final_user_info(filepath: str, header: Dict) -> Dict:
+    """根据日志内容生成最终的 user_info（只读取头部和最后一条记录）"""
+    user_info = header['user_info']
+    last = read_last_record(filepath) or {}
+    if last.get('type') == 'page':
+        user_info['total_videos'] = last.get('total', 0)
+        user_info['last_update'] = last.get('time')
+    user_info['status'] = 'completed'
+    user_info['end_time'] = _now()
+
+    # 增量爬取：总数加上上一次的视频数（从上一次结果的头部读取，不加载视频）
+    merge_from = header.get('merge_from')
+    if merge_from and os.path.exists(merge_from):
+        merged = read_final_user_info(merge_from).get('total_videos')
+        if merged is None:
+            merged = sum(1 for _ in iter_final_videos(merge_from))
+        user_info['new_videos'] = user_info['total_videos']
+        user_info['total_videos'] += merged
+    return user_info
+
+
+def finalize_journal(filepath: str) -> Tuple[str, Dict]:
+    """
+    将日志流式导出为最终JSON文件，并删除日志
+
+    导出文件与旧版 _final.json 格式完全一致。步骤：
+    1. 日志末尾追加结尾记录（最终的 user_info）并 fsync
+    2. 顺序读取日志（增量爬取时接着流式读取上一次的结果），写入临时文件，fsync
+    3. 原子重命名为 _final.json，删除日志
+
+    内存中最多保留一页数据。任何一步中断后再次调用（或查找续传文件时）会从结尾记录重新导出，
+    结果相同。
+
+    Args:
+        filepath: 日志文件路径
+
+    Returns:
+        (最终文件路径, 最终 user_info)
+    """
+    header = read_journal_header_record(filepath)
+    last = read_last_record(filepath) or {}
+    if last.get('type') == 'end':
+        # 上一次导出中断，沿用已记录的 user_info
+        user_info = last['user_info']
+    else:
+        user_info = _final_user_info(filepath, header)
+        _append_record(filepath, {"type": "end", "user_info": user_info}, sync=True)
+
+    merge_from = header.get('merge_from')
+
+    def iter_videos() -> Iterator[Dict]:
+        for record in iter_journal_records(filepath):
+            if record.get('type') == 'page':
+                yield from record.get('videos', [])
+        if merge_from and os.path.exists(merge_from):
+            yield from iter_final_videos(merge_from)
+
+    final_path = final_path_for(filepath)
+    write_final_json(final_path, user_info, iter_videos())
+
+    os.remove(filepath)
+
+    return final_path, user_info
+
+
+def is_finalizing(filepath: str) -> bool:
+    """日志是否已追加结尾记录（已爬取完成，导出尚未结束或被中断）"""
+    last = read_last_record(filepath) or {}
+    return last.get('type') == 'end'
+
+
+def _migrate_legacy_file(filepath: str) -> Optional[str]:
+    """
+    将旧版整文件JSON格式的未完成文件转换为日志格式
+
+    旧版文件没有记录页码，转换后的数据作为第0页写入，续传时按视频数换算页码。
+
+    Args:
+        filepath: 旧版 videos_UID_时间戳.json 文件路径
+
+    Returns:
+        转换后的日志路径，不是未完成文件时返回None
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    user_info = data.get('user_info', {})
+    if user_info.get('status') != 'crawling':
+        return None
+
+    videos = data.get('videos', [])
+    user_info['total_videos'] = 0
+    user_info.pop('last_update', None)
+
+    journal_path = filepath[:-len(".json")] + JOURNAL_SUFFIX
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        _write_record(f, {"type": "header", "user_info": user_info})
+        if videos:
+            _write_record(f, {
+                "type": "page",
+                "page": 0,
+                "total": len(videos),
+                "time": _now(),
+                "videos": videos
+            })
+
+    os.remove(filepath)
+    return journal_path
+
+
+def find_resumable_journal(output_dir: str, uid: int) -> Optional[str]:
+    """
+    查找指定UID最近一次未完成（status 为 crawling）的爬取文件
+
+    旧版JSON格式的未完成文件会先被转换为日志格式。
+
+    Args:
+        output_dir: 输出目录
+        uid: 用户UID
+
+    Returns:
+        日志文件路径，没有可续传的文件时返回None
+    """
+    pattern = re.compile(rf"^videos_{uid}_\d{{8}}_\d{{6}}(\.json|\.jsonl{COMPRESSION_SUFFIX_PATTERN})$")
+    candidates = sorted(
+        path for path in glob.glob(os.path.join(output_dir, f"videos_{uid}_*"))
+        if pattern.match(os.path.basename(path))
+    )
+
+    for path in reversed(candidates):
+        try:
+            if strip_compression_suffix(path).endswith(JOURNAL_SUFFIX):
+                if is_finalizing(path):
+                    # 上次在导出 _final.json 时中断：数据已完整，重新导出即可
+                    final_path, _ = finalize_journal(path)
+                    log.info('finalize_recovered', "🔁 上次导出未完成，已重新导出：{path}",
+                             uid=uid, path=final_path)
+                    continue
+                if read_journal_header(path).get('status') == 'crawling':
+                    return path
+            else:
+                journal_path = _migrate_legacy_file(path)
+                if journal_path:
+                    return journal_path
+        except (OSError, ValueError):
+            continue
+
+    return None
+
+
+def load_journal_state(filepath: str, page_size: int) -> Dict:
+    """
+    读取日志中的续传状态
+
+    Args:
+        filepath: 日志文件路径
+        page_size: 本次爬取使用的每页视频数
+
+    Returns:
+        包含 next_page、total、seen_bvids、merge_from 的字典
+    """
+    header = read_journal_header_record(filepath)
+    seen_bvids: Set[str] = set()
+    last_page = 0
+
+    for record in iter_journal_records(filepath):
+        if record.get('type') != 'page':
+            continue
+        last_page = max(last_page, record.get('page') or 0)
+        for video in record.get('videos', []):
+            seen_bvids.add(video.get('bvid'))
+
+    total = len(seen_bvids)
+
+    # 增量爬取的续传：上一次结果中的视频同样视为已知
+    merge_from = header.get('merge_from')
+    if merge_from and os.path.exists(merge_from):
+        seen_bvids |= load_known_bvids(merge_from)
+    if header.get('page_size') == page_size and last_page > 0:
+        next_page = last_page + 1
+    else:
+        # 每页数量不同（或旧版文件）时按已获取的视频数换算，重叠部分靠bvid去重
+        next_page = total // page_size + 1
+
+    return {
+        "next_page": next_page,
+        "total": total,
+        "seen_bvids": seen_bvids,
+        "merge_from": merge_from
+    }
+
+
+def find_latest_final(output_dir: str, uid: int) -> Optional[str]:
+    """
+    查找指定UID最近一次完整爬取的 _final.json
+
+    Args:
+        output_dir: 输出目录
+        uid: 用户UID
+
+    Returns:
+        文件路径，没有时返回None
+    """
+    pattern = re.compile(rf"^videos_{uid}_\d{{8}}_\d{{6}}{FINAL_SUFFIX}{COMPRESSION_SUFFIX_PATTERN}$")
+    candidates = sorted(
+        path for path in glob.glob(os.path.join(output_dir, f"videos_{uid}_*{FINAL_SUFFIX}*"))
+        if pattern.match(os.path.basename(path))
+    )
+    return candidates[-1] if candidates else None
+
+
+def load_final_file(filepath: str) -> Dict:
+    """读取 _final.json 文件（压缩文件自动解压）"""
+    with open_text(filepath) as f:
+        return json.load(f)
+
+
+class _JsonStream:
+    """按块读取JSON文本，逐个解析值（用于流式读取大文件）"""
+
+    def __init__(self, f, block_size: int = 1 << 16):
+        self.f = f
+        self.block_size = block_size
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """读取下一块，丢弃已解析的部分；文件结束时返回False"""
+        chunk = self.f.read(self.block_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符（文件结束时返回空字符串）"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """读取下一个字符，必须是 chars 之一"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"JSON格式错误：期望 {chars!r}，实际为 {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """解析下一个完整的JSON值，数据不完整时继续读取"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 数字可能被块边界截断，读到后续字符后再确认
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_final_videos(filepath: str) -> Iterator[Dict]:
+    """
+    流式读取 _final.json（或旧版JSON文件）中的视频
+
+    按块解析顶层对象，"videos" 数组中的视频逐个产出，
+    内存占用与文件大小无关。
+
+    Args:
+        filepath: 文件路径
+
+    Yields:
+        视频字典
+    """
+    with open_text(filepath) as f:
+        stream = _JsonStream(f)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key != 'videos':
+                stream.value()
+            else:
+                stream.expect('[')
+                if stream.peek() == ']':
+                    stream.pos += 1
+                else:
+                    while True:
+                        yield stream.value()
+                        if stream.expect(',]') == ']':
+                            break
+            if stream.expect(',}') == '}':
+                return
+
+
+def load_known_bvids(filepath: str) -> Set[str]:
+    """读取 _final.json 中所有视频的bvid（流式读取，不加载整个文件）"""
+    return {
+        video.get('bvid') for video in iter_final_videos(filepath)
+        if video.get('bvid')
+    }
+
+
+def read_final_user_info(filepath: str) -> Dict:
+    """
+    读取 _final.json 的 user_info，不加载视频列表
+
+    finalize_journal 导出的文件中 user_info 位于 "videos" 之前，只需读取文件开头；
+    其他格式的文件退回到完整解析。
+    """
+    lines = []
+    with open_text(filepath) as f:
+        for line in f:
+            if line.startswith('  "videos"'):
+                text = ''.join(lines).rstrip().rstrip(',') + '\n}'
+                try:
+                    return json.loads(text).get('user_info', {})
+                except ValueError:
+                    break
+            lines.append(line)
+    return load_final_file(filepath).get('user_info', {})
+
+
+def count_saved_videos(output_dir: str, uid: int, since: float) -> int:
+    """
+    某次爬取保存的视频数
+
+    Args:
+        output_dir: 输出目录
+        uid: 用户UID
+        since: 爬取开始时间，之前生成的 _final.json 不计入（如增量爬取没有新投稿）
+
+    Returns:
+        新生成的 _final.json 中本次新增的视频数
+    """
+    final_path = find_latest_final(output_dir, uid)
+    if not final_path or os.path.getmtime(final_path) < since:
+        return 0
+    user_info = read_final_user_info(final_path)
+    return user_info.get('new_videos', user_info.get('total_videos', 0))
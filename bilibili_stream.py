@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 流式视频迭代
+按页产出解析后的视频，调用方可以边获取边处理，随时停止
+
+- VideoStream（同步）和 AsyncVideoStream（异步）逐页产出 VideoPage，videos() 逐个产出视频
+- 每页产出之后才请求下一页，同时在内存中的只有当前一页
+- 调用方停止迭代或调用 cancel() 后不再发送新的请求（并发获取时取消尚未开始的页面）
+- 按bvid去重，增量模式下遇到整页已知视频即停止
+- 结束后 completed / failed / cancelled 与 next_page 说明停止的原因和续传的页码
+- 传入 scheduler（DeadlineScheduler）时，每次页面请求按期限安排时间点
+
+使用示例：
+    stream = crawler.iter_video_pages(uid)
+    for video in stream.videos():
+        if video.created < since:
+            stream.cancel()
+
+    async for video in engine.iter_videos(uid):
+        ...
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Set
+
+from bilibili_metrics import CrawlMetrics
+from bilibili_pages import PageFetcher, iter_pages
+from bilibili_scheduler import DeadlineScheduler
+from bilibili_video import Video, parse_video
+
+# 异步获取一页数据的函数：参数为页码，返回API的 data 字段，失败返回None
+AsyncPageFetcher = Callable[[int], Awaitable[Optional[Dict]]]
+
+# 停止原因
+STOP_EMPTY = 'empty'          # 某一页没有视频
+STOP_KNOWN = 'known'          # 增量模式下整页都是已知视频
+STOP_LAST_PAGE = 'last_page'  # 已到最后一页
+STOP_FAILED = 'failed'        # 某一页获取失败
+STOP_CANCELLED = 'cancelled'  # 调用方取消
+
+# 表示已获取全部视频的停止原因
+COMPLETED_REASONS = (STOP_EMPTY, STOP_KNOWN, STOP_LAST_PAGE)
+
+
+class VideoPage(NamedTuple):
+    """一页视频"""
+    page: int            # 页码
+    videos: List[Video]  # 本页去重后的新视频
+    fetched: int         # 接口返回的视频数（含重复）
+    count: int           # 接口报告的视频总数，未知为0
+
+
+class _StreamState:
+    """同步和异步视频流共用的分页状态"""
+
+    def __init__(self, page_size: int, start_page: int = 1,
+                 seen_bvids: Optional[Set[str]] = None, stop_on_known: bool = False,
+                 metrics: Optional[CrawlMetrics] = None,
+                 scheduler: Optional[DeadlineScheduler] = None):
+        """
+        Args:
+            page_size: 每页视频数
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出（集合会被更新）
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+            metrics: 记录页数和视频数的请求指标，为None时不记录
+            scheduler: 按期限安排请求的调度器，为None时只受限速器控制
+        """
+        self.page_size = page_size
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.next_page = start_page
+        self.seen_bvids = seen_bvids if seen_bvids is not None else set()
+        self.stop_on_known = stop_on_known
+        self.stop_reason: Optional[str] = None
+        self.pages = 0  # 已产出的页数
+        self.total = 0  # 已产出的视频数
+        self._cancelled = False
+
+    @property
+    def completed(self) -> bool:
+        """是否已获取全部视频"""
+        return self.stop_reason in COMPLETED_REASONS
+
+    @property
+    def failed(self) -> bool:
+        """是否因某一页获取失败而停止"""
+        return self.stop_reason == STOP_FAILED
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已被调用方取消"""
+        return self._cancelled
+
+    def cancel(self):
+        """取消：当前页处理完后不再请求之后的页面（可从其他线程调用）"""
+        self._cancelled = True
+        if self.stop_reason is None:
+            self.stop_reason = STOP_CANCELLED
+
+    def describe(self) -> str:
+        """停止原因的说明"""
+        if self.stop_reason == STOP_FAILED:
+            return f"🛑 第 {self.next_page} 页获取失败，停止爬取"
+        if self.stop_reason == STOP_EMPTY:
+            return f"✅ 第 {self.next_page} 页没有视频，爬取完成"
+        if self.stop_reason == STOP_KNOWN:
+            return f"✅ 第 {self.next_page} 页全部为已知视频，增量爬取完成"
+        if self.stop_reason == STOP_LAST_PAGE:
+            return f"✅ 已到最后一页（第 {self.next_page - 1} 页）"
+        if self.stop_reason == STOP_CANCELLED:
+            return f"⏹️  已取消，下一页为第 {self.next_page} 页"
+        return "尚未结束"
+
+    def _accept(self, page: int, data: Optional[Dict]) -> Optional[VideoPage]:
+        """
+        处理获取到的一页数据
+
+        Returns:
+            要产出的一页视频，None 表示到此停止
+        """
+        if not data:
+            self.stop_reason = STOP_FAILED
+            self.next_page = page
+            return None
+
+        vlist = data.get('list', {}).get('vlist', [])
+        if not vlist:
+            self.stop_reason = STOP_EMPTY
+            return None
+
+        videos = []
+        for video_info in vlist:
+            video = parse_video(video_info)
+            # 断点续传或切换每页数量后页面会有重叠，按bvid去重
+            if video.bvid in self.seen_bvids:
+                continue
+            self.seen_bvids.add(video.bvid)
+            videos.append(video)
+
+        # 增量模式：整页都是已知视频，之后的页面只会更旧
+        if self.stop_on_known and not videos:
+            self.stop_reason = STOP_KNOWN
+            return None
+
+        count = data.get('page', {}).get('count', 0)
+        if (count > 0 and page * self.page_size >= count) or len(vlist) < self.page_size:
+            self.stop_reason = STOP_LAST_PAGE
+
+        self.next_page = page + 1
+        self.pages += 1
+        self.total += len(videos)
+        if self.metrics is not None:
+            self.metrics.record_page(len(videos))
+        return VideoPage(page, videos, len(vlist), count)
+
+
+class VideoStream(_StreamState):
+    """同步视频流，迭代产出 VideoPage"""
+
+    def __init__(self, fetch_page: PageFetcher, page_size: int, start_page: int = 1,
+                 seen_bvids: Optional[Set[str]] = None, stop_on_known: bool = False,
+                 max_workers: int = 1, metrics: Optional[CrawlMetrics] = None,
+                 scheduler: Optional[DeadlineScheduler] = None):
+        """
+        Args:
+            fetch_page: 获取单页数据的函数
+            page_size: 每页视频数
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出（集合会被更新）
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+            max_workers: 得知总数后并发获取剩余页面的线程数，1为逐页获取
+            metrics: 记录页数和视频数的请求指标，为None时不记录
+            scheduler: 按期限安排请求的调度器，为None时只受限速器控制
+        """
+        super().__init__(page_size, start_page, seen_bvids, stop_on_known, metrics, scheduler)
+        self.fetch_page = fetch_page
+        self.max_workers = max_workers
+
+    def __iter__(self) -> Iterator[VideoPage]:
+        if self.stop_reason is not None:
+            return
+        fetch_page = self.fetch_page
+        if self.scheduler is not None:
+            fetch_page = self.scheduler.wrap(fetch_page, self.page_size)
+        pages = iter_pages(fetch_page, self.next_page, self.page_size, self.max_workers)
+        try:
+            for page, data in pages:
+                if self._cancelled:
+                    return
+                video_page = self._accept(page, data)
+                if video_page is None:
+                    return
+                yield video_page
+                if self.stop_reason is not None:
+                    return
+            # 并发模式下所有页面都已获取
+            self.stop_reason = STOP_LAST_PAGE
+        finally:
+            pages.close()
+            if self.scheduler is not None and self.stop_reason is not None:
+                self.scheduler.finish()
+
+    def videos(self) -> Iterator[Video]:
+        """逐个产出视频"""
+        for video_page in self:
+            yield from video_page.videos
+
+
+class AsyncVideoStream(_StreamState):
+    """异步视频流，async for 产出 VideoPage"""
+
+    def __init__(self, fetch_page: AsyncPageFetcher, page_size: int, start_page: int = 1,
+                 seen_bvids: Optional[Set[str]] = None, stop_on_known: bool = False,
+                 metrics: Optional[CrawlMetrics] = None,
+                 scheduler: Optional[DeadlineScheduler] = None):
+        """
+        Args:
+            fetch_page: 异步获取单页数据的函数
+            page_size: 每页视频数
+            start_page: 起始页码
+            seen_bvids: 已保存的视频bvid，这些视频不再产出（集合会被更新）
+            stop_on_known: 整页都是已知视频时停止（增量模式）
+            metrics: 记录页数和视频数的请求指标，为None时不记录
+            scheduler: 按期限安排请求的调度器，为None时只受限速器控制
+        """
+        super().__init__(page_size, start_page, seen_bvids, stop_on_known, metrics, scheduler)
+        self.fetch_page = fetch_page
+
+    async def __aiter__(self) -> AsyncIterator[VideoPage]:
+        fetch_page = self.fetch_page
+        if self.scheduler is not None:
+            fetch_page = self.scheduler.wrap_async(fetch_page, self.page_size)
+        page = self.next_page
+        try:
+            while self.stop_reason is None and not self._cancelled:
+                data = await fetch_page(page)
+                if self._cancelled:
+                    return
+                video_page = self._accept(page, data)
+                if video_page is None:
+                    return
+                yield video_page
+                page += 1
+        finally:
+            if self.scheduler is not None and self.stop_reason is not None:
+                self.scheduler.finish()
+
+    async def videos(self) -> AsyncIterator[Video]:
+        """逐个产出视频"""
+        async for video_page in self:
+            for video in video_page.videos:
+                yield video
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 共享HTTP传输层
+所有爬虫版本共用一个带连接池的 requests.Session，复用TCP/TLS连接
+
+- 连接池：同一主机的请求复用keep-alive连接，不再每页重新握手
+- 主机连接数限制：每个主机最多保持 per_host_limit 个连接，超出时排队等待
+- 请求头轮换：每次请求单独生成请求头，与底层连接无关
+- 响应缓存（可选）：get_json 的结果写入磁盘缓存，调用方在限速前用 cached_json 查询
+- 请求指标：每个请求的耗时、状态码、字节数和业务码记录到 bilibili_metrics
+- 出口池（可选）：请求发往限速器选定的代理出口，结果计入该出口的健康分（见 bilibili_egress）
+- 熔断器：按“接口 + 出口”记录请求结果，熔断中的请求直接抛出 CircuitOpenError；
+  使用出口池时改用未熔断的其他出口（见 bilibili_breaker）
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import os
+import random
+import threading
+import time
+import warnings
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bilibili_breaker import CircuitBreaker, CircuitOpenError, circuit_key, get_shared_circuit_breaker
+from bilibili_cache import ResponseCache, get_shared_response_cache
+from bilibili_log import get_logger
+from bilibili_metrics import (
+    STATUS_CONNECTION_ERROR, STATUS_ERROR, STATUS_TIMEOUT, CrawlMetrics, get_shared_metrics
+)
+from bilibili_rate_limiter import THROTTLE_HTTP_STATUS, is_throttle_response
+
+if TYPE_CHECKING:
+    from bilibili_egress import Egress, EgressPool
+
+log = get_logger('transport')
+
+# 禁用SSL警告
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+try:
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+except ImportError:
+    pass
+
+# API地址，可通过环境变量指向本地模拟服务器
+API_BASE = os.environ.get("BILIBILI_API_BASE", "https://api.bilibili.com").rstrip("/")
+
+# 多个User-Agent轮换
+USER_AGENTS = [
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+]
+
+
+def api_url(path: str) -> str:
+    """拼接API地址"""
+    return API_BASE + path
+
+
+def random_headers() -> Dict[str, str]:
+    """生成一组随机请求头"""
+    return {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Referer': 'https://www.bilibili.com/',
+        'Accept': 'application/json, text/plain, */*',
+        'Accept-Language': f'zh-CN,zh;q=0.{random.randint(8,9)},en;q=0.{random.randint(6,8)}',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache',
+        'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': random.choice(['"macOS"', '"Windows"', '"Linux"']),
+        'Sec-Fetch-Dest': 'empty',
+        'Sec-Fetch-Mode': 'cors',
+        'Sec-Fetch-Site': 'same-site',
+        'Origin': 'https://www.bilibili.com'
+    }
+
+
+class BilibiliTransport:
+    """带连接池的HTTP传输层"""
+
+    def __init__(self, pool_size: int = 10, per_host_limit: int = 4,
+                 verify: bool = False, rotate_headers: bool = True,
+                 cache: Optional[ResponseCache] = None, proxy: Optional[str] = None,
+                 metrics: Optional[CrawlMetrics] = None,
+                 egress_pool: Optional['EgressPool'] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        初始化传输层
+
+        Args:
+            pool_size: 缓存的主机连接池数量
+            per_host_limit: 每个主机最多保持的连接数，超出的请求排队等待空闲连接
+            verify: 是否校验SSL证书
+            rotate_headers: 调用方未指定请求头时，是否每次请求随机生成
+            cache: 响应缓存，为None时不缓存
+            proxy: 代理地址（如 http://host:port），为None时直连
+            metrics: 请求指标，默认使用进程内共享的实例
+            egress_pool: 出口池，设置后请求经由池中的出口发送（proxy 不再生效）
+            breaker: 熔断器，默认使用进程内共享的实例（状态文件由同一台机器的进程共用）
+        """
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.verify = verify
+        self.rotate_headers = rotate_headers
+        self.cache = cache
+        self.proxy = proxy
+        self.metrics = metrics or get_shared_metrics()
+        self.egress_pool = egress_pool
+        self.breaker = breaker or get_shared_circuit_breaker()
+        self.circuit_rejections = 0  # 因熔断未发送的请求数
+
+        self.session = requests.Session()
+        # 重试由各爬虫自己控制，这里不做自动重试
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=per_host_limit,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if proxy:
+            self.session.proxies = {'http': proxy, 'https': proxy}
+
+    def _route(self, url: str) -> Tuple[Optional['Egress'], str]:
+        """
+        选择本次请求的出口并检查熔断器
+
+        Returns:
+            (出口, 熔断器的键)，不使用出口池时出口为None
+
+        Raises:
+            CircuitOpenError: 该接口在所有可用出口上都处于熔断状态
+        """
+        if self.egress_pool is None:
+            key = circuit_key(url, self.proxy)
+            if not self.breaker.allow(key):
+                self.circuit_rejections += 1
+                raise CircuitOpenError(key, self.breaker.retry_in(key))
+            return None, key
+
+        egress = self.egress_pool.take()
+        key = circuit_key(url, egress.proxy)
+        if self.breaker.allow(key):
+            return egress, key
+        # 选定的出口在该接口上熔断，改用其他未熔断的出口
+        fallback = self.egress_pool.fallback(
+            egress, lambda other: self.breaker.allow(circuit_key(url, other.proxy)))
+        if fallback is None:
+            self.circuit_rejections += 1
+            raise CircuitOpenError(key, self.breaker.retry_in(key))
+        return fallback, circuit_key(url, fallback.proxy)
+
+    def _record_success(self, route: Tuple[Optional['Egress'], str]):
+        """请求成功：计入所用出口和熔断器"""
+        egress, key = route
+        if egress is not None:
+            self.egress_pool.record_success(egress)
+        self.breaker.record_success(key)
+
+    def _record_failure(self, route: Tuple[Optional['Egress'], str], throttled: bool = False):
+        """请求失败或触发限流：计入所用出口和熔断器"""
+        egress, key = route
+        if egress is not None:
+            if throttled:
+                self.egress_pool.record_throttle(egress)
+            else:
+                self.egress_pool.record_failure(egress)
+        self.breaker.record_failure(key)
+
+    def _send(self, url: str, params: Optional[Dict], headers: Optional[Dict],
+              timeout: float) -> Tuple[requests.Response, Optional[Tuple]]:
+        """
+        发送GET请求并记录指标
+
+        连接失败、HTTP限流和5xx在这里计入所用出口和熔断器；返回的 route 为None表示已记录，
+        否则由调用方按响应内容记录。
+        """
+        if headers is None and self.rotate_headers:
+            headers = random_headers()
+
+        route = self._route(url)
+        egress = route[0]
+        session = egress.session if egress is not None else self.session
+
+        start = time.perf_counter()
+        try:
+            response = session.get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=timeout,
+                verify=self.verify
+            )
+        except requests.exceptions.Timeout:
+            self.metrics.record_request(url, time.perf_counter() - start, STATUS_TIMEOUT)
+            self._record_failure(route)
+            raise
+        except requests.exceptions.ConnectionError:
+            self.metrics.record_request(url, time.perf_counter() - start, STATUS_CONNECTION_ERROR)
+            self._record_failure(route)
+            raise
+        except requests.exceptions.RequestException:
+            self.metrics.record_request(url, time.perf_counter() - start, STATUS_ERROR)
+            self._record_failure(route)
+            raise
+        self.metrics.record_request(url, time.perf_counter() - start,
+                                    response.status_code, len(response.content))
+
+        if response.status_code in THROTTLE_HTTP_STATUS:
+            self._record_failure(route, throttled=True)
+            return response, None
+        if response.status_code >= 500:
+            # 代理不可用时通常返回 502/503/504
+            self._record_failure(route)
+            return response, None
+        return response, route
+
+    def get(self, url: str, params: Optional[Dict] = None,
+            headers: Optional[Dict] = None, timeout: float = 20) -> requests.Response:
+        """
+        发送GET请求
+
+        Args:
+            url: 请求地址
+            params: 查询参数
+            headers: 本次请求的请求头，为None时按配置生成
+            timeout: 超时时间（秒）
+
+        Returns:
+            响应对象
+        """
+        response, route = self._send(url, params, headers, timeout)
+        if route is not None:
+            self._record_success(route)
+        return response
+
+    def get_json(self, url: str, params: Optional[Dict] = None,
+                 headers: Optional[Dict] = None, timeout: float = 20) -> Dict:
+        """发送GET请求并解析JSON，HTTP错误状态码会抛出异常；可缓存的响应写入缓存"""
+        response, route = self._send(url, params, headers, timeout)
+        try:
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.HTTPError, ValueError):
+            # 其他4xx或无法解析的响应同样计入出口和熔断器，半开状态的试探请求不会一直占着名额
+            if route is not None:
+                self._record_failure(route)
+            raise
+        self.metrics.record_code(url, data)
+        # 业务码表示的限流（-412、频繁等）同样计入所用出口和熔断器
+        if route is not None:
+            if is_throttle_response(data):
+                self._record_failure(route, throttled=True)
+            else:
+                self._record_success(route)
+        self.cache_json(url, params, data)
+        return data
+
+    def cached_json(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        查询响应缓存，不发送请求
+
+        命中时调用方可直接使用，无需等待限速器。
+
+        Args:
+            url: 请求地址
+            params: 查询参数
+
+        Returns:
+            缓存的响应JSON，未启用缓存或未命中时返回None
+        """
+        if self.cache is None:
+            return None
+        data = self.cache.get(url, params)
+        if data is not None:
+            self.metrics.record_cache_hit()
+        return data
+
+    def cache_json(self, url: str, params: Optional[Dict], data: Dict) -> bool:
+        """将自行解析的响应写入缓存（成功和“不存在”类响应才会缓存）"""
+        if self.cache is None:
+            return False
+        try:
+            return self.cache.put(url, params, data)
+        except OSError as e:
+            log.warning('cache_write_failed', "⚠️  写入响应缓存失败：{error}", url=url, error=e)
+            return False
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        连接池统计，用于对比连接复用效果
+
+        Returns:
+            包含 connections（新建连接数）和 requests（请求数）的字典
+        """
+        connections = 0
+        sent = 0
+        sessions = [self.session]
+        if self.egress_pool is not None:
+            sessions.extend(egress.session for egress in self.egress_pool.egresses)
+        adapters = {adapter for session in sessions for adapter in session.adapters.values()}
+        for adapter in adapters:
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                connections += pool.num_connections
+                sent += pool.num_requests
+        return {"connections": connections, "requests": sent}
+
+    def close(self):
+        """关闭所有连接（包括出口池的连接）"""
+        self.session.close()
+        if self.egress_pool is not None:
+            self.egress_pool.close()
+
+
+_shared_transport: Optional[BilibiliTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport() -> BilibiliTransport:
+    """获取进程内共享的传输层实例（使用共享的磁盘响应缓存）"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = BilibiliTransport(cache=get_shared_response_cache())
+        return _shared_transport
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 视频记录
+arc/search 接口 vlist 中的一项只在 parse_video 中解析一次，之后在各模块中以 Video 对象传递
+
+- Video 使用 __slots__，不为每个视频创建 __dict__，十万个视频的常驻内存明显少于字典
+- url 由 bvid 拼接，用到时才生成，不单独存储
+- 写入日志、数据库和 _final.json 时显式调用 to_dict() 序列化，格式与以前的字典完全一致
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+from typing import Dict, Iterable, List, Tuple, Union
+
+# 视频页面地址前缀
+VIDEO_URL_PREFIX = "https://www.bilibili.com/video/"
+
+# 视频字段（不含由 bvid 生成的 url），顺序与数据库列一致
+VIDEO_FIELDS = ('aid', 'bvid', 'title', 'duration', 'created',
+                'view', 'danmaku', 'reply', 'pic', 'description')
+
+
+class Video:
+    """一个视频的基本信息"""
+
+    __slots__ = VIDEO_FIELDS
+
+    def __init__(self, aid=None, bvid=None, title=None, duration=None, created=None,
+                 view=None, danmaku=None, reply=None, pic=None, description=''):
+        self.aid = aid
+        self.bvid = bvid
+        self.title = title
+        self.duration = duration
+        self.created = created
+        self.view = view
+        self.danmaku = danmaku
+        self.reply = reply
+        self.pic = pic
+        self.description = description
+
+    @property
+    def url(self) -> str:
+        """视频页面地址"""
+        return f"{VIDEO_URL_PREFIX}{self.bvid}"
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Video':
+        """
+        从 _final.json 格式的视频字典创建
+
+        Args:
+            data: 视频字典（url 字段会被忽略）
+
+        Returns:
+            视频对象
+        """
+        return cls(**{name: data.get(name) for name in VIDEO_FIELDS if name in data})
+
+    def to_dict(self) -> Dict:
+        """转换为 _final.json 中的视频格式（字段顺序与以前的字典一致）"""
+        return {
+            'aid': self.aid,
+            'bvid': self.bvid,
+            'title': self.title,
+            'url': self.url,
+            'duration': self.duration,
+            'created': self.created,
+            'view': self.view,
+            'danmaku': self.danmaku,
+            'reply': self.reply,
+            'pic': self.pic,
+            'description': self.description
+        }
+
+    def to_row(self) -> Tuple:
+        """按 VIDEO_FIELDS 的顺序返回字段值"""
+        return tuple(getattr(self, name) for name in VIDEO_FIELDS)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Video):
+            return NotImplemented
+        return self.to_row() == other.to_row()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"Video(bvid={self.bvid!r}, title={self.title!r})"
+
+
+def parse_video(video_info: Dict) -> Video:
+    """
+    解析 arc/search 接口 vlist 中的一项
+
+    Args:
+        video_info: 接口返回的视频数据
+
+    Returns:
+        视频对象
+    """
+    get = video_info.get
+    return Video(
+        get('aid'),
+        get('bvid'),
+        get('title'),
+        get('length'),
+        get('created'),
+        get('play'),
+        get('video_review'),
+        get('comment'),
+        get('pic'),
+        get('description', '')
+    )
+
+
+def as_video(video: Union[Video, Dict]) -> Video:
+    """视频对象原样返回，_final.json 格式的字典转换为视频对象"""
+    return video if isinstance(video, Video) else Video.from_dict(video)
+
+
+def video_dicts(videos: Iterable[Union[Video, Dict]]) -> List[Dict]:
+    """
+    序列化一组视频，用于写入日志和JSON文件
+
+    Args:
+        videos: 视频对象（已是字典的原样保留）
+
+    Returns:
+        _final.json 格式的视频字典列表
+    """
+    return [video.to_dict() if isinstance(video, Video) else video for video in videos]
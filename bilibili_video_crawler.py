@@ -12,10 +12,12 @@ import asyncio
 import json
 import os
 import sys
-import time
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from bilibili_rate_limiter import get_shared_rate_limiter, is_throttle_response
+from bilibili_video import Video, parse_video, video_dicts
+
 try:
     from bilibili_api import user, video
     from bilibili_api.exceptions import ResponseCodeException
@@ -32,7 +34,7 @@ class BilibiliCrawler:
         """初始化爬虫配置"""
         self.max_retries = 3  # 最大重试次数
         self.retry_delay = 2  # 重试延迟（秒）
-        self.request_delay = 1  # 请求间隔（秒）
+        self.rate_limiter = get_shared_rate_limiter()  # 与其他版本共用的限速器
         self.videos_per_page = 30  # 每页视频数量
         self.output_dir = "./output"  # 输出目录
 
@@ -80,9 +82,12 @@ class BilibiliCrawler:
                 ps=self.videos_per_page
             )
 
+            self.rate_limiter.on_success()
             return videos_data
 
         except ResponseCodeException as e:
+            if is_throttle_response({'code': e.code, 'message': str(e)}):
+                self.rate_limiter.on_throttle()
             if e.code in [-400, -404]:
                 print(f"错误：用户 {uid} 不存在或没有公开视频")
             else:
@@ -92,7 +97,7 @@ class BilibiliCrawler:
             print(f"获取视频列表时发生错误（页码：{page}）：{e}")
             return None
 
-    async def fetch_all_videos(self, uid: int) -> List[Dict]:
+    async def fetch_all_videos(self, uid: int) -> List[Video]:
         """
         获取用户的所有视频
 
@@ -108,9 +113,8 @@ class BilibiliCrawler:
         print("开始爬取视频列表...")
 
         while True:
-            # 添加请求延迟
-            if page > 1:
-                time.sleep(self.request_delay)
+            # 等待限速器发放令牌（非阻塞，不会卡住事件循环）
+            await self.rate_limiter.acquire_async()
 
             # 获取当前页视频
             videos_data = await self.get_user_videos(uid, page)
@@ -127,18 +131,7 @@ class BilibiliCrawler:
 
             # 处理每个视频信息
             for video_info in videos:
-                video_data = {
-                    'aid': video_info.get('aid'),
-                    'bvid': video_info.get('bvid'),
-                    'title': video_info.get('title'),
-                    'url': f"https://www.bilibili.com/video/{video_info.get('bvid')}",
-                    'duration': video_info.get('length'),
-                    'created': video_info.get('created'),
-                    'view': video_info.get('play'),
-                    'danmaku': video_info.get('video_review'),
-                    'reply': video_info.get('comment')
-                }
-                all_videos.append(video_data)
+                all_videos.append(parse_video(video_info))
 
             print(f"已获取第 {page} 页，本页 {len(videos)} 个视频，总计 {len(all_videos)} 个视频")
 
@@ -151,7 +144,7 @@ class BilibiliCrawler:
 
         return all_videos
 
-    def save_to_json(self, uid: int, videos: List[Dict]) -> str:
+    def save_to_json(self, uid: int, videos: List[Video]) -> str:
         """
         保存数据到JSON文件
 
@@ -172,7 +165,7 @@ class BilibiliCrawler:
                 "total_videos": len(videos),
                 "crawl_time": current_time
             },
-            "videos": videos
+            "videos": video_dicts(videos)
         }
 
         # 生成文件名
@@ -246,15 +239,15 @@ class BilibiliCrawler:
             print(f"- 总视频数：{len(videos)}")
 
             # 计算总播放量
-            total_views = sum(v.get('view', 0) for v in videos if v.get('view'))
+            total_views = sum(v.view for v in videos if v.view)
             if total_views > 0:
                 print(f"- 总播放量：{total_views:,}")
 
             # 显示前5个视频作为示例
             print("\n前5个视频：")
             for i, video in enumerate(videos[:5], 1):
-                print(f"{i}. {video['title']}")
-                print(f"   {video['url']}")
+                print(f"{i}. {video.title}")
+                print(f"   {video.url}")
 
             if len(videos) > 5:
                 print(f"... 还有 {len(videos) - 5} 个视频")
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 多进程工作者
+多个进程（可以分布在多台机器上）共同处理同一个持久化任务队列
+
+- 每个工作者以租约方式领取UID，爬取期间后台线程定期续约
+- 工作者崩溃或机器断电后租约过期，任务由其他工作者重新领取
+- 每个工作者使用独立的连接池、限速器和固定的User-Agent，可选独立的代理出口
+- --pool：代理按工作者分组，每个工作者用自己的一组代理组成出口池（见 bilibili_egress），
+  同一个代理只被一个进程使用，各进程的限额互不影响
+- 所有工作者结束后按领取者汇总吞吐量
+
+多台机器共享队列时，把队列文件放在共享卷上（如NFS），并确保：
+- 共享卷支持POSIX文件锁（SQLite依赖文件锁保证同一任务只被领取一次）
+- 各机器时钟同步（租约过期时间使用各自的本地时间）
+- 输出目录可以各自独立，也可以指向共享卷（--sqlite 的视频数据库使用WAL模式，
+  只能在同一台机器的进程之间共享，不要放在共享卷上）
+
+使用方法：
+python bilibili_worker.py --add uids.txt --workers 4
+python bilibili_worker.py --queue /mnt/shared/crawl_queue.db --workers 4 --proxies http://p1:8080,http://p2:8080
+python bilibili_worker.py --workers 2 --pool --proxies http://p1:8080,http://p2:8080,http://p3:8080,direct
+python bilibili_worker.py --workers 4 --quiet --log-json output/workers/crawl_log.jsonl
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import importlib
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bilibili_cache import get_shared_response_cache
+from bilibili_compression import COMPRESSIONS, require_compression
+from bilibili_database import count_crawl_videos
+from bilibili_egress import EgressPool, parse_proxy_list, pool_components
+from bilibili_log import LEVELS, configure_logging, get_logger
+from bilibili_metrics import start_metrics_server
+from bilibili_queue import DEFAULT_QUEUE_PATH, STATUS_FAILED, CrawlQueue, read_uid_source
+from bilibili_rate_limiter import AdaptiveRateLimiter
+from bilibili_scheduler import parse_duration
+from bilibili_transport import USER_AGENTS, BilibiliTransport
+
+log = get_logger('worker')
+
+# 可用于工作者的爬虫版本（快速版本只获取第一页，不适合批量爬取）
+CRAWLER_CLASSES = {
+    'simple': ('bilibili_simple_crawler', 'BilibiliSimpleCrawler'),
+    'smart': ('bilibili_smart_crawler', 'BilibiliSmartCrawler'),
+    'adaptive': ('bilibili_adaptive_crawler', 'BilibiliAdaptiveCrawler'),
+}
+
+# 支持 --sqlite 数据库存储和 --snapshot 计数快照的版本
+SQLITE_VERSIONS = ('simple', 'smart')
+
+# 默认租约时长（秒），续约间隔为其三分之一
+DEFAULT_LEASE_SECONDS = 300
+
+
+def worker_identity() -> str:
+    """工作者标识：主机名和进程号，多台机器之间也不会重复"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_worker_crawler(version: str, index: int, proxy: Optional[str] = None,
+                          egress: Optional[List[Optional[str]]] = None):
+    """
+    创建工作者使用的爬虫，连接池和限速器不与其他工作者共享
+
+    Args:
+        version: 爬虫版本
+        index: 工作者序号，用于选择固定的User-Agent
+        proxy: 代理地址，为None时直连
+        egress: 出口池的代理列表（None 表示直连），设置后忽略 proxy
+
+    Returns:
+        爬虫实例
+    """
+    module_name, class_name = CRAWLER_CLASSES[version]
+    crawler_class = getattr(importlib.import_module(module_name), class_name)
+
+    if egress:
+        crawler = crawler_class(**pool_components(EgressPool(egress)))
+    else:
+        transport = BilibiliTransport(cache=get_shared_response_cache(), proxy=proxy)
+        crawler = crawler_class(transport=transport, rate_limiter=AdaptiveRateLimiter())
+
+    # 每个工作者固定一个User-Agent，看起来像不同的客户端
+    user_agent = USER_AGENTS[index % len(USER_AGENTS)]
+    crawler.user_agents = [user_agent]
+    if isinstance(getattr(crawler, 'headers', None), dict):
+        crawler.headers['User-Agent'] = user_agent
+    return crawler
+
+
+class LeaseKeeper:
+    """后台续约线程，爬取期间每隔租约时长的三分之一续约一次"""
+
+    def __init__(self, queue_path: str, owner: str, lease_seconds: float):
+        """
+        初始化续约线程
+
+        Args:
+            queue_path: 队列文件路径（线程使用独立的数据库连接）
+            owner: 领取者标识
+            lease_seconds: 租约时长（秒）
+        """
+        self.queue_path = queue_path
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.uid: Optional[int] = None
+        self.lost = False  # 租约是否已被其他工作者领取
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """启动续约线程"""
+        self._thread.start()
+
+    def track(self, uid: int):
+        """开始为某个任务续约"""
+        with self._lock:
+            self.uid = uid
+            self.lost = False
+
+    def untrack(self):
+        """停止为当前任务续约"""
+        with self._lock:
+            self.uid = None
+
+    def stop(self):
+        """停止续约线程"""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        queue = CrawlQueue(self.queue_path)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                with self._lock:
+                    uid = self.uid
+                    if uid is None or self.lost:
+                        continue
+                    try:
+                        renewed = queue.renew_lease(uid, self.owner, self.lease_seconds)
+                    except Exception as e:
+                        # 数据库暂时不可用（如共享卷抖动），下次继续尝试
+                        log.warning('lease_renew_failed', "⚠️  UID {uid} 续约失败：{error}",
+                                    uid=uid, owner=self.owner, error=e, outcome='renew_failed')
+                        continue
+                    if not renewed:
+                        self.lost = True
+                        log.warning('lease_lost', "⚠️  UID {uid} 的租约已过期并被其他工作者领取",
+                                    uid=uid, owner=self.owner, outcome='lease_lost')
+        finally:
+            queue.close()
+
+
+def run_worker(queue_path: str, version: str = 'adaptive', index: int = 0,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, poll_interval: float = 5,
+               proxy: Optional[str] = None, incremental: bool = False,
+               output_dir: Optional[str] = None, storage: str = 'json',
+               status_stream=None, compression: Optional[str] = None,
+               deadline: Optional[float] = None,
+               egress: Optional[List[Optional[str]]] = None) -> Dict[str, int]:
+    """
+    工作者主循环：领取任务、爬取、记录结果，直到队列中没有剩余任务
+
+    其他工作者仍在爬取时不会立即退出，而是等待一段时间后重试，以便接手租约过期的任务。
+
+    Args:
+        queue_path: 队列文件路径
+        version: 爬虫版本
+        index: 工作者序号
+        lease_seconds: 租约时长（秒）
+        poll_interval: 没有可领取的任务时的等待间隔（秒）
+        proxy: 代理地址，为None时直连
+        incremental: 是否增量爬取
+        output_dir: 输出目录，为None时使用爬虫的默认目录
+        storage: 存储后端（json、sqlite 或 snapshot，后两者只支持标准版本和智能版本）
+        status_stream: 输出每个任务结果的流，为None时使用标准输出
+        compression: 日志和 _final.json 的压缩格式（gzip 或 zstd），None 表示不压缩
+        deadline: 每个UID的时间预算（秒），None 表示不限
+        egress: 本工作者出口池的代理列表（None 表示直连），设置后忽略 proxy
+
+    Returns:
+        本工作者的统计信息
+    """
+    status_stream = status_stream or sys.stdout
+    owner = worker_identity()
+    prefix = f"[工作者{index} {owner}]"
+
+    def report(message: str):
+        print(f"{prefix} {message}", file=status_stream, flush=True)
+
+    crawler = create_worker_crawler(version, index, proxy, egress)
+    if incremental and hasattr(crawler, 'incremental'):
+        crawler.incremental = True
+    if compression and hasattr(crawler, 'compression'):
+        crawler.compression = compression
+    if deadline is not None:
+        crawler.deadline = deadline
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        crawler.output_dir = output_dir
+    if storage in ('sqlite', 'snapshot'):
+        if version not in SQLITE_VERSIONS:
+            raise ValueError(f"{version} 版本不支持数据库存储")
+        crawler.storage = storage
+        if output_dir:
+            crawler.db_path = os.path.join(output_dir, os.path.basename(crawler.db_path))
+            crawler.snapshot_path = os.path.join(output_dir, os.path.basename(crawler.snapshot_path))
+
+    queue = CrawlQueue(queue_path)
+    keeper = LeaseKeeper(queue_path, owner, lease_seconds)
+    keeper.start()
+    stats = {"finished": 0, "failed": 0, "videos": 0, "lost": 0}
+    if egress:
+        report(f"启动（{version}，出口池：{', '.join(item or 'direct' for item in egress)}）")
+    else:
+        report(f"启动（{version}，代理：{proxy or '无'}）")
+
+    try:
+        while True:
+            uid = queue.claim_next(owner, lease_seconds)
+            if uid is None:
+                if queue.counts()['running'] == 0:
+                    break
+                # 其他工作者仍在爬取，等待可能过期的租约
+                time.sleep(poll_interval)
+                continue
+
+            keeper.track(uid)
+            job_start = time.time()
+            rejections = crawler.transport.circuit_rejections
+            try:
+                success = crawler.run(uid)
+                error = "" if success else "爬取失败或未完成"
+            except KeyboardInterrupt:
+                keeper.untrack()
+                queue.release(uid, owner)
+                raise
+            except Exception as e:
+                success = False
+                error = f"{type(e).__name__}: {e}"
+            keeper.untrack()
+
+            # 因接口熔断而失败：放回队列（不计入尝试次数），等熔断到期后再领取
+            if not success and crawler.transport.circuit_rejections > rejections:
+                queue.release(uid, owner)
+                wait = max(crawler.transport.breaker.retry_in(), poll_interval)
+                report(f"🚧 接口熔断中，UID {uid} 放回队列，{wait:.0f} 秒后继续")
+                time.sleep(wait)
+                continue
+
+            if success:
+                videos = count_crawl_videos(crawler, uid, job_start)
+                if queue.mark_done(uid, videos, owner):
+                    stats["finished"] += 1
+                    stats["videos"] += videos
+                    report(f"✅ UID {uid} 完成，{videos} 个视频，耗时 {time.time() - job_start:.1f} 秒")
+                else:
+                    stats["lost"] += 1
+                    report(f"⚠️  UID {uid} 已完成，但租约已被其他工作者领取，结果不记入队列")
+            else:
+                status = queue.mark_failed(uid, error, owner)
+                stats["failed"] += 1
+                suffix = "已达到最大尝试次数" if status == STATUS_FAILED else "稍后重试"
+                report(f"⚠️  UID {uid} 失败：{error}（{suffix}）")
+    except KeyboardInterrupt:
+        report("👋 已中断，当前任务已放回队列")
+    finally:
+        keeper.stop()
+        queue.close()
+        if crawler.transport.egress_pool is not None:
+            print(crawler.transport.egress_pool.describe())
+        crawler.transport.close()
+
+    report(f"结束：完成 {stats['finished']} 个UID，失败 {stats['failed']} 次，{stats['videos']} 个视频")
+    return stats
+
+
+def _worker_process(queue_path: str, version: str, index: int, lease_seconds: float,
+                    poll_interval: float, proxy: Optional[str], incremental: bool,
+                    no_cache: bool, output_dir: Optional[str], storage: str,
+                    log_path: Optional[str], compression: Optional[str] = None,
+                    metrics_port: Optional[int] = None, log_options: Optional[Dict] = None,
+                    deadline: Optional[float] = None,
+                    egress: Optional[List[Optional[str]]] = None):
+    """子进程入口：爬虫的详细输出写入日志文件，终端只显示每个任务的结果"""
+    # 增量爬取和计数快照需要最新的数据，跳过缓存读取
+    if no_cache or incremental or storage == 'snapshot':
+        get_shared_response_cache().bypass = True
+    # 各工作者追加写入同一个JSON行日志，每条记录带进程号
+    if log_options:
+        configure_logging(**log_options)
+
+    status_stream = sys.stdout
+    log_file = None
+    if log_path:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        log_file = open(log_path, 'a', encoding='utf-8', buffering=1)
+        sys.stdout = sys.stderr = log_file
+
+    # 每个工作者进程有自己的指标，端口按序号递增
+    if metrics_port is not None:
+        start_metrics_server(metrics_port + index)
+
+    try:
+        run_worker(queue_path, version, index, lease_seconds, poll_interval,
+                   proxy, incremental, output_dir, storage, status_stream, compression, deadline,
+                   egress)
+    finally:
+        if log_file:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            log_file.close()
+
+
+def print_summary(queue: CrawlQueue, start_time: float):
+    """按领取者汇总本次运行完成的任务"""
+    elapsed = time.time() - start_time
+    counts = queue.counts()
+    owners = queue.owner_stats(start_time)
+    total_jobs = sum(row['jobs'] for row in owners)
+    total_videos = sum(row['videos'] or 0 for row in owners)
+
+    print(f"\n{'=' * 50}")
+    print("📊 多进程爬取汇总：")
+    for row in owners:
+        videos = row['videos'] or 0
+        print(f"   {row['owner'] or '（无租约）'}：{row['jobs']} 个UID，{videos} 个视频，"
+              f"{videos / elapsed if elapsed > 0 else 0:.2f} 视频/秒")
+    print(f"   本次完成：{total_jobs} 个UID，{total_videos} 个视频")
+    print(f"   总耗时：{elapsed:.1f} 秒")
+    if elapsed > 0:
+        print(f"   吞吐量：{total_videos / elapsed:.2f} 视频/秒，{total_jobs * 60 / elapsed:.2f} UID/分钟")
+    print(f"   队列状态：等待 {counts['pending']}，爬取中 {counts['running']}，"
+          f"已完成 {counts['done']}，已失败 {counts['failed']}")
+
+    failed_jobs = list(queue.jobs(STATUS_FAILED))
+    if failed_jobs:
+        print("\n💔 失败的UID：")
+        for job in failed_jobs:
+            print(f"   {job['uid']}（尝试 {job['attempts']} 次）：{job['last_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B站视频爬虫多进程工作者")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH,
+                        help=f"队列文件路径，多台机器共享时放在共享卷上（默认 {DEFAULT_QUEUE_PATH}）")
+    parser.add_argument('--add', metavar='FILE',
+                        help="启动前把文件中的UID加入队列，- 表示标准输入")
+    parser.add_argument('--workers', type=int, default=2, help="本机启动的工作者进程数（默认2）")
+    parser.add_argument('--version', choices=sorted(CRAWLER_CLASSES), default='adaptive',
+                        help="爬虫版本（默认 adaptive）")
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help=f"租约时长（秒），工作者崩溃后任务最多等待这么久被重新领取（默认{DEFAULT_LEASE_SECONDS}）")
+    parser.add_argument('--poll', type=float, default=5, help="等待其他工作者时的轮询间隔（秒）")
+    parser.add_argument('--proxies', default='',
+                        help="逗号分隔的代理地址，按工作者序号轮流分配（direct 表示直连）")
+    parser.add_argument('--pool', action='store_true',
+                        help="代理按工作者分组，每个工作者用自己的一组代理组成出口池（代理数不少于工作者数）")
+    parser.add_argument('--incremental', action='store_true', help="增量爬取")
+    parser.add_argument('--no-cache', action='store_true', help="跳过响应缓存")
+    parser.add_argument('--output-dir', help="输出目录（默认 ./output）")
+    parser.add_argument('--sqlite', dest='storage', action='store_const', const='sqlite', default='json',
+                        help="视频写入输出目录下的SQLite数据库（WAL模式，同一台机器的工作者可以共用）")
+    parser.add_argument('--snapshot', dest='storage', action='store_const', const='snapshot',
+                        help="只把播放、弹幕、评论数记录到输出目录下的计数快照数据库")
+    parser.add_argument('--compress', choices=COMPRESSIONS,
+                        help="压缩保存增量日志和 _final.json（zstd 需要 zstandard 库）")
+    parser.add_argument('--metrics-port', type=int,
+                        help="在本地端口提供 Prometheus 格式的请求指标，第N个工作者使用 端口+N")
+    parser.add_argument('--log-dir', default='./output/workers',
+                        help="工作者日志目录，多个工作者时爬虫的详细输出写入这里")
+    parser.add_argument('--deadline', type=parse_duration, metavar='DURATION',
+                        help="每个UID的时间预算（如 1800、30m、1h30m），按期限安排请求，赶不上时提前警告")
+    parser.add_argument('--log-level', choices=list(LEVELS), default='info',
+                        help="爬虫日志的最低级别（默认 info）")
+    parser.add_argument('--quiet', action='store_true',
+                        help="爬虫的详细输出只保留警告和错误（JSON行日志不受影响）")
+    parser.add_argument('--log-json', metavar='FILE',
+                        help="所有工作者的爬虫日志按JSON行追加写入该文件")
+    args = parser.parse_args()
+    log_options = {"level": args.log_level, "quiet": args.quiet, "jsonl_path": args.log_json}
+    if args.storage != 'json' and args.version not in SQLITE_VERSIONS:
+        parser.error(f"{args.version} 版本不支持 --{args.storage}，请使用 --version simple 或 smart")
+    try:
+        require_compression(args.compress)
+    except ImportError as e:
+        parser.error(str(e))
+
+    print("🎬 B站视频爬虫 - 多进程工作者")
+    print("=" * 40)
+
+    queue = CrawlQueue(args.queue)
+    if args.add:
+        try:
+            uids = read_uid_source(args.add)
+        except OSError as e:
+            print(f"❌ 读取UID列表失败：{e}")
+            queue.close()
+            sys.exit(1)
+        added = queue.add(uids, retry_finished=args.incremental)
+        print(f"📥 读取 {len(uids)} 个UID，新加入队列 {added} 个")
+
+    counts = queue.counts()
+    print(f"📋 队列：{args.queue}（等待 {counts['pending']}，爬取中 {counts['running']}，"
+          f"已完成 {counts['done']}，已失败 {counts['failed']}）")
+
+    proxies = parse_proxy_list(args.proxies)
+    workers = max(args.workers, 1)
+    if args.pool and len(proxies) < workers:
+        parser.error(f"--pool 需要至少 {workers} 个代理（每个工作者至少一个出口），当前 {len(proxies)} 个")
+    # 出口池模式下第N个工作者使用第 N、N+workers、N+2*workers... 个代理
+    groups = [proxies[index::workers] for index in range(workers)] if args.pool else [None] * workers
+    start_time = time.time()
+
+    if workers == 1:
+        _worker_process(args.queue, args.version, 0, args.lease, args.poll,
+                        proxies[0] if proxies else None, args.incremental,
+                        args.no_cache, args.output_dir, args.storage, None, args.compress,
+                        args.metrics_port, log_options, args.deadline, groups[0])
+    else:
+        print(f"🚀 启动 {workers} 个工作者，日志目录：{args.log_dir}")
+        processes = []
+        for index in range(workers):
+            proxy = proxies[index % len(proxies)] if proxies else None
+            log_path = os.path.join(args.log_dir, f"worker_{index}.log")
+            process = multiprocessing.Process(
+                target=_worker_process,
+                args=(args.queue, args.version, index, args.lease, args.poll, proxy,
+                      args.incremental, args.no_cache, args.output_dir, args.storage, log_path,
+                      args.compress, args.metrics_port, log_options, args.deadline, groups[index]),
+                name=f"worker-{index}"
+            )
+            process.start()
+            processes.append(process)
+
+        # Ctrl+C 同时发送给子进程，子进程放回当前任务后退出
+        for process in processes:
+            while process.is_alive():
+                try:
+                    process.join()
+                except KeyboardInterrupt:
+                    print("\n👋 正在等待工作者放回当前任务...")
+
+    print_summary(queue, start_time)
+    counts = queue.counts()
+    queue.close()
+    sys.exit(0 if counts['pending'] == 0 and counts['running'] == 0 and counts['failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
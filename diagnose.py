@@ -9,11 +9,12 @@ B站爬虫诊断工具
 """
 
 import json
-import requests
 import sys
 import time
 from datetime import datetime
 
+from bilibili_transport import api_url, get_shared_transport
+
 
 def test_network_connectivity():
     """测试网络连接性"""
@@ -22,7 +23,7 @@ def test_network_connectivity():
 
     test_urls = [
         "https://www.bilibili.com",
-        "https://api.bilibili.com/x/web-interface/nav",
+        api_url("/x/web-interface/nav"),
         "https://httpbin.org/ip"
     ]
 
@@ -33,11 +34,10 @@ def test_network_connectivity():
     for url in test_urls:
         try:
             print(f"🌐 测试: {url}")
-            response = requests.get(
+            response = get_shared_transport().get(
                 url,
                 headers=headers,
-                timeout=10,
-                verify=False
+                timeout=10
             )
             print(f"   ✅ 状态码: {response.status_code}")
             print(f"   📏 响应大小: {len(response.content)} bytes")
@@ -53,17 +53,18 @@ def test_bilibili_api(uid: int):
 
     # 测试用户信息API
     print("📊 测试用户信息API...")
-    url = f"https://api.bilibili.com/x/space/acc/info"
+    url = api_url("/x/space/acc/info")
     params = {'mid': uid}
 
     try:
-        response = requests.get(
+        response = get_shared_transport().get(
             url,
             params=params,
-            timeout=10,
-            verify=False
+            timeout=10
         )
         data = response.json()
+        # 诊断总是请求真实接口，结果写入缓存，随后运行爬虫时不再重复请求
+        get_shared_transport().cache_json(url, params, data)
         print(f"   状态码: {response.status_code}")
         print(f"   API响应: {json.dumps(data, ensure_ascii=False, indent=2)}")
     except Exception as e:
@@ -73,7 +74,7 @@ def test_bilibili_api(uid: int):
 
     # 测试视频列表API
     print("📼 测试视频列表API...")
-    url = "https://api.bilibili.com/x/space/arc/search"
+    url = api_url("/x/space/arc/search")
     params = {
         'mid': uid,
         'ps': 1,
@@ -81,13 +82,13 @@ def test_bilibili_api(uid: int):
     }
 
     try:
-        response = requests.get(
+        response = get_shared_transport().get(
             url,
             params=params,
-            timeout=10,
-            verify=False
+            timeout=10
         )
         data = response.json()
+        get_shared_transport().cache_json(url, params, data)
         print(f"   状态码: {response.status_code}")
         print(f"   API响应: {json.dumps(data, ensure_ascii=False, indent=2)}")
 
@@ -116,7 +117,7 @@ def test_different_uids():
 
     for uid in test_uids:
         print(f"👤 测试UID: {uid}")
-        url = "https://api.bilibili.com/x/space/arc/search"
+        url = api_url("/x/space/arc/search")
         params = {
             'mid': uid,
             'ps': 1,
@@ -124,13 +125,13 @@ def test_different_uids():
         }
 
         try:
-            response = requests.get(
+            response = get_shared_transport().get(
                 url,
                 params=params,
-                timeout=5,
-                verify=False
+                timeout=5
             )
             data = response.json()
+            get_shared_transport().cache_json(url, params, data)
             print(f"   状态码: {response.status_code}")
             print(f"   响应码: {data.get('code', 'N/A')}")
             print(f"   消息: {data.get('message', 'N/A')}")
@@ -186,10 +187,9 @@ def quick_test():
     try:
         print("🚀 发送测试请求...")
         start_time = time.time()
-        response = requests.get(
-            "https://api.bilibili.com/x/web-interface/online",
-            timeout=5,
-            verify=False
+        response = get_shared_transport().get(
+            api_url("/x/web-interface/online"),
+            timeout=5
         )
         end_time = time.time()
         print(f"   ✅ 请求成功")
@@ -198,6 +198,10 @@ def quick_test():
     except Exception as e:
         print(f"   ❌ 请求失败: {e}")
 
+    # 连接复用情况（keep-alive 生效时连接数远小于请求数）
+    stats = get_shared_transport().connection_stats()
+    print(f"   🔗 本次诊断共 {stats['requests']} 个请求，新建 {stats['connections']} 个连接")
+
 
 def main():
     """主函数"""
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+B站视频爬虫 - 本地模拟API服务器
+在本地模拟爬虫用到的B站接口，用于离线测试和性能测试，不会访问真实的 api.bilibili.com
+
+模拟的接口：
+- /x/space/arc/search  用户投稿列表（按发布时间倒序分页）
+- /x/space/acc/info    用户信息
+- /x/web-interface/nav 导航信息（未登录）
+- /x/web-interface/view 视频详情（完整统计、分P、UP主信息）
+- /x/tag/archive/tags  视频标签
+- /__stats             服务器统计（请求数、限流数、返回的页面和视频数）
+
+可配置：
+- 每个UP主的视频数量，未配置的UID使用默认数量；也可以指定不存在的UID
+- 响应延迟分布：fixed / uniform / exponential / lognormal
+- 注入限流：按概率随机限流，或超过每秒请求数上限时限流（每秒上限按来源分别计算，与真实接口按IP限流一致）
+- 限流形式：-412 业务码、-799“请求过于频繁”、HTTP 412，或随机混合
+- 模拟时间流逝（advance_days）：较新的投稿和少数旧投稿的播放、弹幕、评论数按天增长，用于测试统计快照
+
+本地代理（MockProxy）：转发请求并用 X-Forwarded-For 标明来源，模拟多个出口IP，用于测试出口池
+
+使用方法：
+python mock_bilibili_server.py --port 8000 --uploaders 1001:500,1002:80 --latency 50
+BILIBILI_API_BASE=http://127.0.0.1:8000 python run.py 1001
+python mock_bilibili_server.py --max-rps 2 --proxies 4       # 同时启动4个本地代理
+
+作者：Kirk
+日期：2025-12-08
+"""
+
+import argparse
+import http.client
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# 支持的延迟分布
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+# 支持的限流形式
+THROTTLE_MODES = ('code', 'message', 'http', 'mixed')
+
+# 模拟视频的最新发布时间（2025-12-08 00:00:00 UTC+8）
+LATEST_CREATED = 1765123200
+
+# 会被限流的接口
+THROTTLED_PATHS = ('/x/space/arc/search', '/x/space/acc/info',
+                   '/x/web-interface/view', '/x/tag/archive/tags')
+
+# 模拟视频的bvid：BV{UID}m{六位序号}
+MOCK_BVID_PATTERN = re.compile(r'^BV(\d+)m(\d{6})$')
+
+
+class MockBilibiliAPI:
+    """模拟API的数据和行为，与HTTP服务本身无关，可直接在进程内调用"""
+
+    def __init__(self, uploaders: Optional[Dict[int, int]] = None,
+                 default_videos: int = 100, latency_ms: float = 0.0,
+                 latency_distribution: str = 'fixed', throttle_rate: float = 0.0,
+                 max_rps: float = 0.0, throttle_mode: str = 'code',
+                 missing_uids: Iterable[int] = (), seed: Optional[int] = None):
+        """
+        初始化模拟API
+
+        Args:
+            uploaders: UID到视频数量的映射
+            default_videos: 未配置的UID的视频数量
+            latency_ms: 平均响应延迟（毫秒）
+            latency_distribution: 延迟分布
+            throttle_rate: 每个请求被随机限流的概率（0~1）
+            max_rps: 每秒请求数上限，超出时限流，0表示不限制
+            throttle_mode: 限流响应的形式
+            missing_uids: 不存在的UID，请求时返回 -404
+            seed: 随机数种子，便于复现
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布：{latency_distribution}")
+        if throttle_mode not in THROTTLE_MODES:
+            raise ValueError(f"不支持的限流形式：{throttle_mode}")
+
+        self.uploaders = dict(uploaders or {})
+        self.default_videos = default_videos
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.throttle_mode = throttle_mode
+        self.missing_uids = set(missing_uids)
+        self.days = 0  # 模拟经过的天数，计数按天增长
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # 服务端令牌桶，用于 max_rps 限流，每个来源一个：来源 -> [令牌数, 上次补充时间]
+        self._buckets: Dict[str, list] = {}
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空统计信息"""
+        with self._lock:
+            self.requests = 0
+            self.throttled = 0
+            self.pages = 0
+            self.videos = 0
+            self.sources: Dict[str, int] = {}
+
+    def stats(self) -> Dict[str, int]:
+        """服务器统计信息"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "pages": self.pages,
+                "videos": self.videos,
+                "sources": dict(self.sources)
+            }
+
+    def video_count(self, mid: int) -> int:
+        """UP主的视频数量"""
+        return self.uploaders.get(mid, self.default_videos)
+
+    def add_videos(self, mid: int, count: int):
+        """为UP主新增投稿，用于测试增量爬取"""
+        with self._lock:
+            self.uploaders[mid] = self.video_count(mid) + count
+
+    def advance_days(self, days: int = 1):
+        """模拟时间流逝，之后返回的播放、弹幕、评论数按天数增长"""
+        with self._lock:
+            self.days += days
+
+    def current_video(self, mid: int, serial: int) -> Dict:
+        """
+        当前的视频数据：make_video 的基础计数加上按天的增长
+
+        最新的10%投稿每天增长较多，旧投稿中约10%每天少量增长，其余不变。
+        """
+        video = self.make_video(mid, serial)
+        if self.days <= 0:
+            return video
+        rng = random.Random(mid * 104729 + serial)
+        if serial > self.video_count(mid) * 0.9:
+            daily = rng.randint(500, 20000)
+        elif rng.random() < 0.1:
+            daily = rng.randint(1, 200)
+        else:
+            return video
+        video['play'] += daily * self.days
+        video['video_review'] += daily // 50 * self.days
+        video['comment'] += daily // 100 * self.days
+        return video
+
+    def sample_latency(self) -> float:
+        """按配置的分布生成一次响应延迟（秒）"""
+        mean = self.latency_ms / 1000
+        if mean <= 0:
+            return 0.0
+
+        with self._lock:
+            if self.latency_distribution == 'uniform':
+                return self._random.uniform(0, 2 * mean)
+            if self.latency_distribution == 'exponential':
+                return self._random.expovariate(1 / mean)
+            if self.latency_distribution == 'lognormal':
+                # sigma=0.5 的长尾分布，mu 取值使均值等于 mean
+                sigma = 0.5
+                return self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return mean
+
+    def _should_throttle(self, source: str) -> bool:
+        """判断本次请求是否限流（需持有锁）"""
+        if self.max_rps > 0:
+            now = time.monotonic()
+            capacity = max(self.max_rps, 1.0)
+            bucket = self._buckets.setdefault(source, [capacity, now])
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * self.max_rps)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return True
+            bucket[0] -= 1
+
+        return self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+
+    def _throttle_response(self) -> Tuple[int, Dict]:
+        """生成限流响应（需持有锁）"""
+        mode = self.throttle_mode
+        if mode == 'mixed':
+            mode = self._random.choice(('code', 'message', 'http'))
+
+        if mode == 'message':
+            return 200, {"code": -799, "message": "请求过于频繁，请稍后再发送", "ttl": 1}
+        body = {"code": -412, "message": "请求被拦截", "ttl": 1}
+        return (412 if mode == 'http' else 200), body
+
+    @staticmethod
+    def make_video(mid: int, serial: int) -> Dict:
+        """
+        生成一个模拟视频，字段与真实接口的 vlist 元素一致
+
+        Args:
+            mid: UP主UID
+            serial: 视频序号，最早的投稿为1，内容只由序号决定
+
+        Returns:
+            视频数据
+        """
+        rng = random.Random(mid * 1000003 + serial)
+        seconds = rng.randint(30, 3600)
+        return {
+            "aid": mid * 100000 + serial,
+            "bvid": f"BV{mid}m{serial:06d}",
+            "title": f"模拟视频 {serial}",
+            "description": f"UID {mid} 的第 {serial} 个模拟投稿",
+            "author": f"模拟UP主{mid}",
+            "mid": mid,
+            "created": LATEST_CREATED - (100000 - serial) * 3600,
+            "length": f"{seconds // 60:02d}:{seconds % 60:02d}",
+            "play": rng.randint(100, 2000000),
+            "video_review": rng.randint(0, 50000),
+            "comment": rng.randint(0, 10000),
+            "pic": f"http://i0.hdslb.com/bfs/archive/mock_{mid}_{serial}.jpg",
+            "typeid": 17,
+            "copyright": "1",
+            "is_pay": 0,
+            "hide_click": False
+        }
+
+    def handle(self, path: str, query: Dict[str, str], source: str = 'direct') -> Tuple[int, Dict]:
+        """
+        处理一次请求
+
+        Args:
+            path: 请求路径
+            query: 查询参数
+            source: 请求来源（客户端IP或代理标明的出口），每秒上限按来源分别计算
+
+        Returns:
+            (HTTP状态码, 响应JSON)
+        """
+        with self._lock:
+            self.requests += 1
+            self.sources[source] = self.sources.get(source, 0) + 1
+            if path in THROTTLED_PATHS and self._should_throttle(source):
+                self.throttled += 1
+                return self._throttle_response()
+
+        if path == '/x/space/arc/search':
+            return self._arc_search(query)
+        if path == '/x/space/acc/info':
+            return self._acc_info(query)
+        if path == '/x/web-interface/view':
+            return self._view(query)
+        if path == '/x/tag/archive/tags':
+            return self._tags(query)
+        if path == '/x/web-interface/nav':
+            return 200, {"code": -101, "message": "账号未登录", "ttl": 1, "data": {"isLogin": False}}
+        if path == '/__stats':
+            return 200, self.stats()
+        return 404, {"code": -404, "message": "啥都木有", "ttl": 1}
+
+    def _arc_search(self, query: Dict[str, str]) -> Tuple[int, Dict]:
+        """投稿列表：按发布时间倒序分页"""
+        try:
+            mid = int(query.get('mid', 0))
+            ps = int(query.get('ps', 30))
+            pn = int(query.get('pn', 1))
+        except ValueError:
+            return 200, {"code": -400, "message": "请求错误", "ttl": 1}
+        if mid <= 0 or ps <= 0 or pn <= 0:
+            return 200, {"code": -400, "message": "请求错误", "ttl": 1}
+        if mid in self.missing_uids:
+            return 200, {"code": -404, "message": "啥都木有", "ttl": 1}
+
+        count = self.video_count(mid)
+        newest = count - (pn - 1) * ps
+        vlist = [self.current_video(mid, serial) for serial in range(newest, max(newest - ps, 0), -1)]
+
+        with self._lock:
+            self.pages += 1
+            self.videos += len(vlist)
+
+        return 200, {
+            "code": 0,
+            "message": "0",
+            "ttl": 1,
+            "data": {
+                "list": {"tlist": {}, "vlist": vlist},
+                "page": {"pn": pn, "ps": ps, "count": count}
+            }
+        }
+
+    def _find_video(self, bvid: str) -> Optional[Tuple[int, int]]:
+        """解析模拟视频的bvid，返回 (UID, 序号)，视频不存在时返回None"""
+        match = MOCK_BVID_PATTERN.match(bvid or '')
+        if not match:
+            return None
+        mid, serial = int(match.group(1)), int(match.group(2))
+        if mid in self.missing_uids or not 0 < serial <= self.video_count(mid):
+            return None
+        return mid, serial
+
+    def _view(self, query: Dict[str, str]) -> Tuple[int, Dict]:
+        """视频详情：字段与真实接口的 data 一致（只包含常用字段）"""
+        found = self._find_video(query.get('bvid', ''))
+        if found is None:
+            return 200, {"code": -404, "message": "啥都木有", "ttl": 1}
+        mid, serial = found
+        video = self.current_video(mid, serial)
+        rng = random.Random(mid * 7919 + serial)
+        minutes, seconds = video['length'].split(':')
+        duration = int(minutes) * 60 + int(seconds)
+        pages = [
+            {"cid": video['aid'] * 10 + page, "page": page, "part": f"P{page} 模拟分P",
+             "duration": duration // (page + 1) + 1, "dimension": {"width": 1920, "height": 1080, "rotate": 0}}
+            for page in range(1, rng.randint(1, 3) + 1)
+        ]
+        return 200, {
+            "code": 0,
+            "message": "0",
+            "ttl": 1,
+            "data": {
+                "bvid": video['bvid'],
+                "aid": video['aid'],
+                "videos": len(pages),
+                "tid": video['typeid'],
+                "tname": "单机游戏",
+                "copyright": 1,
+                "pic": video['pic'],
+                "title": video['title'],
+                "pubdate": video['created'],
+                "ctime": video['created'],
+                "desc": video['description'],
+                "duration": duration,
+                "owner": {"mid": mid, "name": video['author'], "face": f"http://i0.hdslb.com/bfs/face/mock_{mid}.jpg"},
+                "stat": {
+                    "aid": video['aid'],
+                    "view": video['play'],
+                    "danmaku": video['video_review'],
+                    "reply": video['comment'],
+                    "favorite": rng.randint(0, 50000),
+                    "coin": rng.randint(0, 50000),
+                    "share": rng.randint(0, 10000),
+                    "like": rng.randint(0, 100000),
+                    "dislike": 0
+                },
+                "pages": pages
+            }
+        }
+
+    def _tags(self, query: Dict[str, str]) -> Tuple[int, Dict]:
+        """视频标签"""
+        found = self._find_video(query.get('bvid', ''))
+        if found is None:
+            return 200, {"code": -404, "message": "啥都木有", "ttl": 1}
+        mid, serial = found
+        names = ["模拟", f"UP主{mid}", ("游戏", "音乐", "知识")[serial % 3]]
+        return 200, {
+            "code": 0,
+            "message": "0",
+            "ttl": 1,
+            "data": [{"tag_id": index + 1, "tag_name": name} for index, name in enumerate(names)]
+        }
+
+    def _acc_info(self, query: Dict[str, str]) -> Tuple[int, Dict]:
+        """用户信息"""
+        try:
+            mid = int(query.get('mid', 0))
+        except ValueError:
+            mid = 0
+        if mid <= 0:
+            return 200, {"code": -400, "message": "请求错误", "ttl": 1}
+        if mid in self.missing_uids:
+            return 200, {"code": -404, "message": "啥都木有", "ttl": 1}
+
+        return 200, {
+            "code": 0,
+            "message": "0",
+            "ttl": 1,
+            "data": {
+                "mid": mid,
+                "name": f"模拟UP主{mid}",
+                "sign": "本地模拟服务器生成的用户",
+                "level": 6,
+                "face": f"http://i0.hdslb.com/bfs/face/mock_{mid}.jpg"
+            }
+        }
+
+
+class MockBilibiliServer:
+    """在后台线程中运行模拟API的HTTP服务器"""
+
+    def __init__(self, api: Optional[MockBilibiliAPI] = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        初始化服务器
+
+        Args:
+            api: 模拟API，默认使用默认配置
+            host: 监听地址
+            port: 监听端口，0表示随机分配空闲端口
+        """
+        self.api = api or MockBilibiliAPI()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """服务器地址，可直接用作 BILIBILI_API_BASE"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        """创建绑定到当前模拟API的请求处理类"""
+        api = self.api
+
+        class Handler(BaseHTTPRequestHandler):
+            # 支持keep-alive，与真实接口一样复用连接
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+                delay = api.sample_latency()
+                if delay > 0:
+                    time.sleep(delay)
+
+                source = self.headers.get('X-Forwarded-For') or self.client_address[0]
+                status, body = api.handle(parts.path, query, source)
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # 不输出每个请求的访问日志
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """在后台线程启动服务器，返回服务器地址"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """停止服务器"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'MockBilibiliServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class MockProxy:
+    """本地HTTP代理：转发请求并用 X-Forwarded-For 标明出口名称，模拟一个独立的出口IP"""
+
+    def __init__(self, name: Optional[str] = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        初始化代理
+
+        Args:
+            name: 出口名称（模拟服务器据此分别计算每秒上限），默认使用代理地址
+            host: 监听地址
+            port: 监听端口，0表示随机分配空闲端口
+        """
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.name = name or self.url
+        self.failing = False  # 为True时对所有请求返回 502，模拟不可用的代理
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """代理地址，可直接用作出口池的代理"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        """创建绑定到当前代理的请求处理类"""
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with proxy._lock:
+                    proxy.requests += 1
+                if proxy.failing:
+                    self._reply(502, b'{"code": -502, "message": "Bad Gateway"}')
+                    return
+
+                # 代理请求的路径是完整的URL
+                parts = urlsplit(self.path)
+                target = parts.path + (f"?{parts.query}" if parts.query else "")
+                headers = {key: value for key, value in self.headers.items()
+                           if key.lower() not in ('host', 'connection', 'proxy-connection',
+                                                  'keep-alive', 'accept-encoding')}
+                headers['X-Forwarded-For'] = proxy.name
+                connection = http.client.HTTPConnection(parts.netloc, timeout=30)
+                try:
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                    self._reply(response.status, response.read(),
+                                response.getheader('Content-Type', 'application/json'))
+                except OSError:
+                    self._reply(502, b'{"code": -502, "message": "Bad Gateway"}')
+                finally:
+                    connection.close()
+
+            def _reply(self, status: int, payload: bytes, content_type: str = 'application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """在后台线程启动代理，返回代理地址"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """停止代理"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'MockProxy':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def parse_uploaders(text: str) -> Dict[int, int]:
+    """
+    解析UP主配置
+
+    Args:
+        text: 形如 "1001:500,1002:80" 的字符串
+
+    Returns:
+        UID到视频数量的映射
+    """
+    uploaders = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        mid, _, count = item.partition(':')
+        uploaders[int(mid)] = int(count) if count else 100
+    return uploaders
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="B站API本地模拟服务器")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8000, help="监听端口")
+    parser.add_argument('--uploaders', default='', help="UP主视频数量，如 1001:500,1002:80")
+    parser.add_argument('--default-videos', type=int, default=100, help="未配置UID的视频数量")
+    parser.add_argument('--latency', type=float, default=0.0, help="平均响应延迟（毫秒）")
+    parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='fixed', help="延迟分布")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="随机限流概率（0~1）")
+    parser.add_argument('--max-rps', type=float, default=0.0, help="每秒请求数上限，0为不限制")
+    parser.add_argument('--throttle-mode', choices=THROTTLE_MODES, default='code', help="限流形式")
+    parser.add_argument('--missing', default='', help="不存在的UID，逗号分隔")
+    parser.add_argument('--seed', type=int, default=None, help="随机数种子")
+    parser.add_argument('--proxies', type=int, default=0, help="同时启动的本地代理数（模拟多个出口IP）")
+    args = parser.parse_args()
+
+    api = MockBilibiliAPI(
+        uploaders=parse_uploaders(args.uploaders),
+        default_videos=args.default_videos,
+        latency_ms=args.latency,
+        latency_distribution=args.distribution,
+        throttle_rate=args.throttle_rate,
+        max_rps=args.max_rps,
+        throttle_mode=args.throttle_mode,
+        missing_uids=[int(uid) for uid in args.missing.split(',') if uid.strip()],
+        seed=args.seed
+    )
+    server = MockBilibiliServer(api, host=args.host, port=args.port)
+
+    print("🧪 B站API模拟服务器")
+    print("=" * 50)
+    print(f"🌐 地址：{server.base_url}")
+    print(f"⏱️  延迟：{args.latency} 毫秒（{args.distribution}）")
+    print(f"🚦 限流：概率 {args.throttle_rate}，每秒上限 {args.max_rps or '不限'}，形式 {args.throttle_mode}")
+    print(f"💡 使用：BILIBILI_API_BASE={server.base_url} python run.py UID")
+    proxies = [MockProxy(name=f"egress-{index}") for index in range(args.proxies)]
+    if proxies:
+        urls = ','.join(proxy.start() for proxy in proxies)
+        print(f"🔀 本地代理：{urls}")
+        print(f"💡 出口池：BILIBILI_API_BASE={server.base_url} python run.py UID --proxies {urls}")
+    print("按 Ctrl+C 停止")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务器已停止")
+    finally:
+        server.httpd.server_close()
+        for proxy in proxies:
+            proxy.stop()
+
+
+if __name__ == "__main__":
+    main()
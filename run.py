@@ -12,111 +12,473 @@ python run.py UID
 使用智能版本：
 python run.py smart UID
 
+使用自适应版本（从快速设置开始，遇到限流自动切换）：
+python run.py adaptive UID
+
+增量爬取（只获取上次爬取之后的新投稿）：
+python run.py smart UID --incremental
+
+跳过响应缓存，强制请求最新数据：
+python run.py UID --no-cache
+
+写入SQLite数据库（按bvid更新，不再生成带时间戳的文件，标准版本和智能版本支持）：
+python run.py UID --sqlite
+
+只记录播放、弹幕、评论数的计数快照（按视频差分存储，用 bilibili_snapshots.py query 查看变化）：
+python run.py batch uids.txt --snapshot
+
+在本地端口提供 Prometheus 格式的请求指标（http://127.0.0.1:9108/metrics）：
+python run.py batch uids.txt --metrics-port 9108
+
+压缩保存增量日志和 _final.json（zstd 需要安装 zstandard）：
+python run.py UID --gzip
+python run.py UID --zstd
+
+为每个UP主设定时间预算，请求均匀分布在期限内，预计赶不上时提前警告（支持 1800、90s、30m、1h30m）：
+python run.py smart UID --deadline 30m
+
+通过多个代理出口爬取（每个出口单独限速，触发限流的出口冷却，不可用的出口自动剔除，direct 表示直连）：
+python run.py batch uids.txt --proxies http://p1:8080,http://p2:8080,direct
+
+只显示警告和错误，同时把所有日志按JSON行写入文件（级别：debug / info / warning / error）：
+python run.py batch uids.txt --quiet --log-json output/crawl_log.jsonl
+python run.py UID --log-level warning
+
+批量爬取（UID写入持久化队列，无需交互，中断后再次运行继续处理）：
+python run.py batch uids.txt
+python run.py batch adaptive uids.txt
+cat uids.txt | python run.py batch -
+python run.py batch                      # 只处理队列中剩余的UID
+
+多进程爬取同一个队列见 bilibili_worker.py
+
 示例：
 python run.py 435776729
 python run.py smart 435776729
 """
 
 import sys
-import os
+import time
+from typing import Dict, Optional
 
-def main():
-    print("🎬 B站视频爬虫程序")
-    print("=" * 40)
-    print("📋 版本选择：")
-    print("   1. 标准版本 - 速度较快，可能遇到频率限制")
-    print("   2. 智能版本 - 速度较慢，成功率更高")
-    print("   3. 快速版本 - 10秒获取结果，仅第一页数据")
-    print()
+from bilibili_log import configure_logging, get_logger, parse_logging_args
 
-    # 解析命令行参数
-    use_smart = False
-    use_fast = False
-    uid = None
+log = get_logger('run')
 
-    if len(sys.argv) > 1:
-        if sys.argv[1].lower() == 'smart':
-            use_smart = True
-            if len(sys.argv) > 2:
-                try:
-                    uid = int(sys.argv[2])
-                    print(f"📍 目标UID: {uid}")
-                except ValueError:
-                    print("❌ 错误：UID必须是数字")
-                    return
-        elif sys.argv[1].lower() == 'fast':
-            use_fast = True
-            if len(sys.argv) > 2:
-                try:
-                    uid = int(sys.argv[2])
-                    print(f"📍 目标UID: {uid}")
-                except ValueError:
-                    print("❌ 错误：UID必须是数字")
-                    return
-        else:
-            try:
-                uid = int(sys.argv[1])
-                print(f"📍 目标UID: {uid}")
-            except ValueError:
-                print("❌ 错误：UID必须是数字")
-                return
+# 命令行中的版本名称
+VERSIONS = ('simple', 'smart', 'fast', 'adaptive')
 
-    # 如果没有指定版本，让用户选择
-    if not use_smart and not use_fast and len(sys.argv) <= 1:
-        try:
-            choice = input("请选择版本 (1/2/3) [默认:1]: ").strip()
-            if choice == '2':
-                use_smart = True
-            elif choice == '3':
-                use_fast = True
-        except KeyboardInterrupt:
-            print("\n👋 程序已取消")
-            return
 
-    # 选择爬虫版本
-    if use_fast:
+def create_crawler(version: str, components: Optional[Dict] = None):
+    """
+    按版本名称创建爬虫实例
+
+    Args:
+        version: 爬虫版本
+        components: 爬虫的构造参数（如出口池的 transport 和 rate_limiter），为None时使用共享实例
+    """
+    components = components or {}
+    if version == 'fast':
         print("\n🚀 使用快速版本（10秒获取结果）")
         try:
             from bilibili_fast_crawler import BilibiliFastCrawler
-            crawler = BilibiliFastCrawler()
+            return BilibiliFastCrawler(**components)
         except ImportError:
             print("❌ 无法导入快速版本，使用标准版本")
-            from bilibili_simple_crawler import BilibiliSimpleCrawler
-            crawler = BilibiliSimpleCrawler()
-    elif use_smart:
+    elif version == 'adaptive':
+        print("\n🎚️  使用自适应版本（按限流情况自动切换设置）")
+        from bilibili_adaptive_crawler import BilibiliAdaptiveCrawler
+        return BilibiliAdaptiveCrawler(**components)
+    elif version == 'smart':
         print("\n🤖 使用智能版本（成功率更高）")
         try:
             from bilibili_smart_crawler import BilibiliSmartCrawler
-            crawler = BilibiliSmartCrawler()
+            return BilibiliSmartCrawler(**components)
         except ImportError:
             print("❌ 无法导入智能版本，使用标准版本")
-            from bilibili_simple_crawler import BilibiliSimpleCrawler
-            crawler = BilibiliSimpleCrawler()
     else:
         print("\n⚡ 使用标准版本（速度较快）")
-        from bilibili_simple_crawler import BilibiliSimpleCrawler
-        crawler = BilibiliSimpleCrawler()
+
+    from bilibili_simple_crawler import BilibiliSimpleCrawler
+    return BilibiliSimpleCrawler(**components)
+
+
+def choose_version() -> str:
+    """交互式选择版本"""
+    choice = input("请选择版本 (1/2/3/4) [默认:1]: ").strip()
+    return {'2': 'smart', '3': 'fast', '4': 'adaptive'}.get(choice, 'simple')
+
+
+def apply_storage(crawler, storage: str):
+    """设置爬虫的存储后端"""
+    if storage == 'json':
+        return
+    if not hasattr(crawler, 'storage'):
+        print("⚠️  该版本不支持数据库存储，使用JSON文件保存")
+    elif storage == 'snapshot':
+        crawler.storage = storage
+        print(f"📸 只记录计数快照：{crawler.snapshot_path}")
+    else:
+        crawler.storage = storage
+        print(f"🗄️  数据写入数据库：{crawler.db_path}")
+
+
+def apply_compression(crawler, compression: Optional[str]):
+    """设置日志和 _final.json 的压缩格式"""
+    if compression is None:
+        return
+    if hasattr(crawler, 'compression'):
+        crawler.compression = compression
+        print(f"🗜️  日志和结果文件使用 {compression} 压缩")
+    else:
+        print("⚠️  该版本不支持压缩保存，使用普通JSON文件")
+
+
+def apply_deadline(crawler, deadline: Optional[float]):
+    """设置每个UP主的时间预算"""
+    if deadline is None:
+        return
+    if hasattr(crawler, 'deadline'):
+        from bilibili_scheduler import format_duration
+        crawler.deadline = deadline
+        print(f"⏳ 每个UP主的期限：{format_duration(deadline)}，得知总页数后按期限安排请求")
+    else:
+        print("⚠️  该版本不支持按期限安排请求，忽略 --deadline")
+
+
+def describe_egress(crawler):
+    """使用出口池时输出每个出口的统计"""
+    pool = getattr(crawler.transport, 'egress_pool', None)
+    if pool is not None:
+        print(pool.describe())
+
+
+def run_single(version: str, uid, incremental: bool, storage: str = 'json',
+               compression: Optional[str] = None, deadline: Optional[float] = None,
+               components: Optional[Dict] = None) -> bool:
+    """
+    爬取单个UID
+
+    Args:
+        version: 爬虫版本
+        uid: 用户UID，为None时由爬虫交互式输入
+        incremental: 是否增量爬取
+        storage: 存储后端（json、sqlite 或 snapshot）
+        compression: 压缩格式（gzip 或 zstd），None 表示不压缩
+        deadline: 时间预算（秒），None 表示不限
+        components: 爬虫的构造参数（出口池），None 表示使用共享实例
+
+    Returns:
+        是否成功
+    """
+    crawler = create_crawler(version, components)
+    apply_storage(crawler, storage)
+    apply_compression(crawler, compression)
+    apply_deadline(crawler, deadline)
+
+    if incremental and hasattr(crawler, 'incremental'):
+        crawler.incremental = True
+        print("📚 增量模式：只获取上次爬取之后的新投稿")
 
     print("\n🚀 开始爬取...")
     success = crawler.run(uid)
+    describe_egress(crawler)
 
     if success:
         print("\n✅ 爬取成功！")
     else:
         print("\n❌ 爬取失败，请检查UID或稍后重试")
         print("💡 建议尝试：")
-        print("   1. 使用智能版本：python run.py smart")
+        print("   1. 使用智能版本：python run.py smart（或自适应版本：python run.py adaptive）")
         print("   2. 使用快速版本：python run.py fast")
         print("   3. 运行诊断工具：python diagnose.py")
 
-    # 询问是否继续
+    return success
+
+
+def run_batch(version: str, source, incremental: bool, queue_path: str,
+              storage: str = 'json', compression: Optional[str] = None,
+              deadline: Optional[float] = None, components: Optional[Dict] = None) -> bool:
+    """
+    批量爬取队列中的UID，不需要交互
+
+    Args:
+        version: 爬虫版本（fast 只获取第一页，批量模式下改用标准版本）
+        source: UID来源（文件路径或 "-" 表示标准输入），为None时只处理队列中剩余的UID
+        incremental: 是否增量爬取
+        queue_path: 队列文件路径
+        storage: 存储后端（json、sqlite 或 snapshot）
+        compression: 压缩格式（gzip 或 zstd），None 表示不压缩
+        deadline: 每个UID的时间预算（秒），None 表示不限
+        components: 爬虫的构造参数（出口池），None 表示使用共享实例
+
+    Returns:
+        是否所有UID都已完成
+    """
+    from bilibili_database import count_crawl_videos
+    from bilibili_queue import STATUS_FAILED, CrawlQueue, read_uid_source
+
+    if version == 'fast':
+        print("⚠️  快速版本只获取第一页，批量模式使用标准版本")
+        version = 'simple'
+
+    queue = CrawlQueue(queue_path)
+    recovered = queue.recover()
+    if recovered:
+        print(f"🔁 恢复上次中断的 {recovered} 个任务")
+
+    if source:
+        try:
+            uids = read_uid_source(source)
+        except OSError as e:
+            print(f"❌ 读取UID列表失败：{e}")
+            queue.close()
+            return False
+        # 增量模式下已完成的UID也需要重新检查新投稿
+        added = queue.add(uids, retry_finished=incremental)
+        print(f"📥 读取 {len(uids)} 个UID，新加入队列 {added} 个")
+
+    counts = queue.counts()
+    print(f"📋 队列：{queue_path}（等待 {counts['pending']}，已完成 {counts['done']}，已失败 {counts['failed']}）")
+
+    crawler = create_crawler(version, components)
+    apply_storage(crawler, storage)
+    apply_compression(crawler, compression)
+    apply_deadline(crawler, deadline)
+    if incremental and hasattr(crawler, 'incremental'):
+        crawler.incremental = True
+        print("📚 增量模式：只获取上次爬取之后的新投稿")
+
+    egress_pool = getattr(crawler.transport, 'egress_pool', None)
+    start_time = time.time()
+    finished = 0
+    failed = 0
+    total_videos = 0
+
     try:
-        answer = input("\n🔄 是否继续爬取其他用户？(y/n): ").strip().lower()
-        if answer == 'y' or answer == 'yes':
-            # 递归调用，继续爬取
-            main()
+        while True:
+            uid = queue.claim_next()
+            if uid is None:
+                break
+
+            log.info('job_start', "\n" + "=" * 50 + "\n📍 [{index}] 开始爬取 UID {uid}",
+                     uid=uid, index=finished + failed + 1)
+            job_start = time.time()
+            rejections = crawler.transport.circuit_rejections
+            try:
+                success = crawler.run(uid)
+                error = "" if success else "爬取失败或未完成"
+            except KeyboardInterrupt:
+                queue.release(uid)
+                raise
+            except Exception as e:
+                success = False
+                error = f"{type(e).__name__}: {e}"
+
+            # 因接口熔断而失败：放回队列（不计入尝试次数），等熔断到期后再继续
+            if not success and crawler.transport.circuit_rejections > rejections:
+                queue.release(uid)
+                wait = max(crawler.transport.breaker.retry_in(), 1.0)
+                log.warning('circuit_wait', "🚧 接口熔断中，UID {uid} 放回队列，{wait:.0f} 秒后继续",
+                            uid=uid, wait=wait, outcome='circuit_open')
+                time.sleep(wait)
+                continue
+
+            if success:
+                videos = count_crawl_videos(crawler, uid, job_start)
+                queue.mark_done(uid, videos)
+                finished += 1
+                total_videos += videos
+                log.info('job_done', "✅ UID {uid} 完成，{videos} 个视频，耗时 {elapsed:.1f} 秒",
+                         uid=uid, videos=videos, elapsed=time.time() - job_start, outcome='done')
+            else:
+                status = queue.mark_failed(uid, error)
+                failed += 1
+                if status == STATUS_FAILED:
+                    log.error('job_failed', "💔 UID {uid} 失败：{error}（已达到最大尝试次数）",
+                              uid=uid, error=error, outcome=status)
+                else:
+                    log.warning('job_failed', "⚠️  UID {uid} 失败：{error}（稍后重试）",
+                                uid=uid, error=error, outcome=status)
+                # 出口全部被剔除后继续领取只会让剩余的UID逐个失败
+                if egress_pool is not None and not egress_pool.healthy():
+                    log.error('no_egress', "🚫 所有出口都已被剔除，停止批量爬取", outcome='no_egress')
+                    break
     except KeyboardInterrupt:
-        print("\n👋 再见！")
+        print("\n👋 已中断，再次运行 python run.py batch 继续处理剩余的UID")
+    if egress_pool is not None:
+        print(egress_pool.describe())
+
+    elapsed = time.time() - start_time
+    counts = queue.counts()
+
+    print(f"\n{'=' * 50}")
+    print("📊 批量爬取汇总：")
+    print(f"   本次完成：{finished} 个UID，失败 {failed} 次")
+    print(f"   保存视频：{total_videos} 个")
+    print(f"   总耗时：{elapsed:.1f} 秒")
+    if elapsed > 0:
+        print(f"   吞吐量：{total_videos / elapsed:.2f} 视频/秒，{finished * 60 / elapsed:.2f} UID/分钟")
+    print(f"   队列状态：等待 {counts['pending']}，已完成 {counts['done']}，已失败 {counts['failed']}")
+
+    failed_jobs = list(queue.jobs(STATUS_FAILED))
+    if failed_jobs:
+        print("\n💔 失败的UID：")
+        for job in failed_jobs:
+            print(f"   {job['uid']}（尝试 {job['attempts']} 次）：{job['last_error']}")
+
+    queue.close()
+    return counts['pending'] == 0 and counts['failed'] == 0
+
+
+def main():
+    print("🎬 B站视频爬虫程序")
+    print("=" * 40)
+    print("📋 版本选择：")
+    print("   1. 标准版本 - 速度较快，可能遇到频率限制")
+    print("   2. 智能版本 - 速度较慢，成功率更高")
+    print("   3. 快速版本 - 10秒获取结果，仅第一页数据")
+    print("   4. 自适应版本 - 从快速设置开始，遇到限流自动切换到更保守的设置")
+    print()
+
+    # 增量爬取、缓存和存储开关可以放在任意位置
+    args = sys.argv[1:]
+    incremental = '--incremental' in args
+    no_cache = '--no-cache' in args
+    storage = 'sqlite' if '--sqlite' in args else 'snapshot' if '--snapshot' in args else 'json'
+    compression = 'zstd' if '--zstd' in args else 'gzip' if '--gzip' in args else None
+    args = [arg for arg in args
+            if arg not in ('--incremental', '--no-cache', '--sqlite', '--snapshot', '--gzip', '--zstd')]
+
+    # 日志级别、安静模式和JSON行日志
+    log_options = parse_logging_args(args)
+    if log_options is None:
+        return
+    configure_logging(**log_options)
+
+    if compression:
+        from bilibili_compression import require_compression
+        try:
+            require_compression(compression)
+        except ImportError as e:
+            print(f"❌ {e}")
+            return
+
+    # 批量模式的队列文件
+    from bilibili_queue import DEFAULT_QUEUE_PATH
+    queue_path = DEFAULT_QUEUE_PATH
+    if '--queue' in args:
+        index = args.index('--queue')
+        if index + 1 >= len(args):
+            print("❌ 错误：--queue 后需要指定队列文件路径")
+            return
+        queue_path = args[index + 1]
+        del args[index:index + 2]
+
+    # 每个UP主的时间预算
+    deadline = None
+    if '--deadline' in args:
+        from bilibili_scheduler import parse_duration
+        index = args.index('--deadline')
+        try:
+            deadline = parse_duration(args[index + 1])
+        except IndexError:
+            print("❌ 错误：--deadline 后需要指定时长（如 30m）")
+            return
+        except ValueError as e:
+            print(f"❌ 错误：{e}")
+            return
+        del args[index:index + 2]
+
+    # 代理出口池
+    components = None
+    if '--proxies' in args:
+        index = args.index('--proxies')
+        if index + 1 >= len(args):
+            print("❌ 错误：--proxies 后需要指定逗号分隔的代理地址（direct 表示直连）")
+            return
+        from bilibili_egress import EgressPool, parse_proxy_list, pool_components
+        proxies = parse_proxy_list(args[index + 1])
+        del args[index:index + 2]
+        if not proxies:
+            print("❌ 错误：--proxies 后需要指定逗号分隔的代理地址（direct 表示直连）")
+            return
+        pool = EgressPool(proxies)
+        components = pool_components(pool)
+        print(f"🌐 出口池：{len(pool.egresses)} 个出口，每个出口单独限速")
+
+    # 请求指标服务
+    if '--metrics-port' in args:
+        index = args.index('--metrics-port')
+        try:
+            metrics_port = int(args[index + 1])
+        except (IndexError, ValueError):
+            print("❌ 错误：--metrics-port 后需要指定端口号")
+            return
+        del args[index:index + 2]
+        from bilibili_metrics import start_metrics_server
+        start_metrics_server(metrics_port)
+
+    # 增量爬取需要最新的第一页，计数快照需要当前的计数，同样跳过缓存读取
+    if no_cache or incremental or storage == 'snapshot':
+        from bilibili_cache import get_shared_response_cache
+        get_shared_response_cache().bypass = True
+
+    # 批量模式：python run.py batch [版本] [UID文件|-]
+    if args and args[0].lower() == 'batch':
+        rest = args[1:]
+        version = 'simple'
+        if rest and rest[0].lower() in VERSIONS:
+            version = rest.pop(0).lower()
+        source = rest[0] if rest else None
+        success = run_batch(version, source, incremental, queue_path, storage, compression,
+                            deadline, components)
+        sys.exit(0 if success else 1)
+
+    # 解析命令行参数
+    version = None
+    uid = None
+
+    if args:
+        if args[0].lower() in VERSIONS:
+            version = args[0].lower()
+            args = args[1:]
+        if args:
+            try:
+                uid = int(args[0])
+                print(f"📍 目标UID: {uid}")
+            except ValueError:
+                print("❌ 错误：UID必须是数字")
+                return
+
+    # 逐个爬取，每次结束后询问是否继续
+    while True:
+        # 如果没有指定版本，让用户选择
+        if version is None:
+            if uid is None:
+                try:
+                    version = choose_version()
+                except KeyboardInterrupt:
+                    print("\n👋 程序已取消")
+                    return
+            else:
+                version = 'simple'
+
+        run_single(version, uid, incremental, storage, compression, deadline, components)
+
+        # 询问是否继续
+        try:
+            answer = input("\n🔄 是否继续爬取其他用户？(y/n): ").strip().lower()
+        except (KeyboardInterrupt, EOFError):
+            print("\n👋 再见！")
+            return
+        if answer not in ('y', 'yes'):
+            return
+
+        # 下一个用户重新选择版本和UID
+        version = None
+        uid = None
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()